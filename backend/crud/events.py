@@ -0,0 +1,252 @@
+################################################################################
+# crud/events.py
+# Purpose:  Implements the transactional outbox for real-time events. CRUD
+#           mutations call record_event before committing, so the event row is
+#           committed (or rolled back) together with the change it describes.
+#           Also provides the reads used by the dispatcher to tail the outbox
+#           by sequence number, and lets it know when new rows were committed.
+#           Recording a project-scoped event also bumps the project's
+#           version and updated_at, so neither needs separate bookkeeping, and
+#           project listeners (the response cache) hear which projects changed
+#           once the transaction commits. The outbox doubles as the change
+#           log behind delta sync: clients ask for a project's changes since
+#           the last seq they saw, and old rows are compacted away once they
+#           have been broadcast.
+################################################################################
+
+# Libraries
+import json
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Union
+from sqlalchemy import delete, event, func, select
+from sqlalchemy.orm import Session
+
+# Local files
+from ..database import read_snapshot
+from ..exceptions import ProjectNotFound
+from ..models import OutboxEvent, OutboxCursor, Project
+from ..schemas import TaskCompact
+from ..websocket_utils import EventType
+
+# Most events a change request collapses before asking for a full resync
+CHANGES_LIMIT = 1000
+# Outbox cursor holding the highest seq removed by compaction
+COMPACTED_CURSOR = "compacted"
+
+# Called (without arguments) after a commit that wrote outbox rows
+_commit_listeners: List[Callable[[], None]] = []
+# Called with the ids of the projects a commit changed
+_project_listeners: List[Callable[[Set[int]], None]] = []
+
+################################################################################
+###                                 Outbox                                   ###
+################################################################################
+# Create
+# * Does not commit; the caller's commit publishes the event
+# * Project-scoped events also bump their project's version
+def record_event(db: Session, event_type: Union[EventType, str],
+                 data: Dict[str, Any], project_id: Optional[int] = None):
+    record_events(db, event_type, [data], project_id=project_id)
+
+# * Several events of one type and project, e.g. one per member added in
+#   bulk; the project's version is bumped once for all of them
+def record_events(db: Session, event_type: Union[EventType, str],
+                  datas: Iterable[Dict[str, Any]],
+                  project_id: Optional[int] = None):
+    event_name = event_type.value if isinstance(event_type, EventType) \
+                                  else event_type
+    db.add_all([OutboxEvent(event_type=event_name,
+                            project_id=project_id,
+                            payload=json.dumps(data, default=str))
+                for data in datas])
+    db.info["outbox_pending"] = True
+    if project_id is not None:
+        touch_projects(db, [project_id])
+
+# Update
+# * For changes that affect projects without a project-scoped event, such as
+#   deleting a user who was a member
+def touch_projects(db: Session, project_ids: Iterable[int]):
+    project_ids = set(project_ids)
+    if project_ids:
+        db.query(Project).filter(
+                Project.id.in_(project_ids)
+        ).update({Project.version: Project.version + 1,
+                  Project.updated_at: func.now()},
+                 synchronize_session=False)
+        db.info.setdefault("touched_projects", set()).update(project_ids)
+
+# Projects changed by the session's transaction, forgotten once taken
+def take_touched_projects(db: Session) -> Set[int]:
+    return db.info.pop("touched_projects", set())
+
+# Read
+def get_events_after(db: Session, seq: int, limit: int = 500):
+    return db.query(OutboxEvent).filter(
+                OutboxEvent.seq > seq
+           ).order_by(OutboxEvent.seq).limit(limit).all()
+
+# Largest seq ever written; the compaction floor once old rows are gone
+def get_head_seq(db: Session) -> int:
+    return db.scalar(select(func.max(OutboxEvent.seq))) or \
+           get_cursor(db, COMPACTED_CURSOR)
+
+# Deltas of a project since a seq, for clients catching up after a reconnect
+# * Events are collapsed to the latest state of each task and member, plus
+#   tombstones (ids) for those deleted or removed. Clients unassign the
+#   tasks of removed members themselves, as for live member_removed events
+# * resync asks for a full reload instead: when rows after since were
+#   compacted away, since is ahead of the log, there are more than limit
+#   events, or an event cannot be expressed as a delta
+# * last_seq is the log's head, the since of the next call
+# * Query budget: 4 (BEGIN, head, compaction floor, events)
+def get_project_changes(db: Session, project_id: int, since: int,
+                        limit: int = CHANGES_LIMIT) -> Dict[str, Any]:
+    read_snapshot(db)
+    head = get_head_seq(db)
+    changes = {"since": since, "last_seq": head}
+    if since < get_cursor(db, COMPACTED_CURSOR) or since > head:
+        _check_project(db, project_id)
+        return {**changes, "resync": True}
+    rows = db.query(OutboxEvent).filter(
+                OutboxEvent.project_id == project_id,
+                OutboxEvent.seq > since,
+                OutboxEvent.seq <= head
+           ).order_by(OutboxEvent.seq).limit(limit + 1).all()
+    # Rows show the project existed, including its deletion if it is gone;
+    # without any, there has to be a project to have had no changes
+    if not rows:
+        _check_project(db, project_id)
+    if len(rows) > limit:
+        return {**changes, "resync": True}
+    try:
+        return {**changes, **_collapse(rows)}
+    except (KeyError, TypeError, ValueError):
+        logging.warning(f"Changes of project {project_id} since {since} "
+                        f"need a full resync")
+        return {**changes, "resync": True}
+
+def _check_project(db: Session, project_id: int):
+    if db.get(Project, project_id) is None:
+        raise ProjectNotFound(project_id)
+
+def _collapse(rows: List[OutboxEvent]) -> Dict[str, Any]:
+    tasks, deleted_tasks = {}, set()
+    members, removed_members = {}, set()
+    project_deleted = False
+
+    def upsert_task(task):
+        # Rejects payloads that are not a valid task (ValueError)
+        task = TaskCompact.model_validate(task)
+        tasks[task.id] = task
+        deleted_tasks.discard(task.id)
+
+    def delete_task(task):
+        tasks.pop(task["id"], None)
+        deleted_tasks.add(task["id"])
+
+    for row in rows:
+        data = json.loads(row.payload)
+        name = EventType(row.event_type)
+        if name in (EventType.TASK_CREATED, EventType.TASK_UPDATED):
+            upsert_task(data)
+        elif name == EventType.TASK_DELETED:
+            delete_task(data)
+        elif name == EventType.TASKS_BULK:
+            for task in data["created"] + data["updated"]:
+                upsert_task(task)
+            for task in data["deleted"]:
+                delete_task(task)
+        elif name == EventType.MEMBER_ADDED:
+            members[data["user"]["id"]] = data["user"]
+            removed_members.discard(data["user"]["id"])
+        elif name == EventType.MEMBER_REMOVED:
+            members.pop(data["user"]["id"], None)
+            removed_members.add(data["user"]["id"])
+        elif name == EventType.PROJECT_DELETED:
+            project_deleted = True
+        else:
+            raise ValueError(f"No delta for {name.value}")
+
+    return {
+        "resync": False,
+        "tasks": list(tasks.values()),
+        "deleted_tasks": sorted(deleted_tasks),
+        "members": list(members.values()),
+        "removed_members": sorted(removed_members),
+        "project_deleted": project_deleted,
+    }
+
+def get_cursor(db: Session, name: str = "default") -> int:
+    cursor = db.get(OutboxCursor, name)
+    return cursor.last_seq if cursor else 0
+
+def set_cursor(db: Session, last_seq: int, name: str = "default"):
+    cursor = db.get(OutboxCursor, name)
+    if cursor:
+        cursor.last_seq = last_seq
+    else:
+        db.add(OutboxCursor(name=name, last_seq=last_seq))
+    db.commit()
+
+# Delete
+# * Drops rows older than older_than, but never past max_seq (what the
+#   dispatcher has broadcast); the highest seq dropped is kept as the
+#   compaction floor, so get_project_changes knows what it can no longer
+#   answer
+# * Returns the number of rows dropped
+def compact_events(db: Session, max_seq: int, older_than: datetime) -> int:
+    floor = db.scalar(select(func.max(OutboxEvent.seq)).where(
+                OutboxEvent.seq <= max_seq,
+                OutboxEvent.created_at < older_than
+            ))
+    if floor is None:
+        return 0
+    dropped = db.execute(delete(OutboxEvent).where(
+                  OutboxEvent.seq <= floor
+              )).rowcount
+    set_cursor(db, max(floor, get_cursor(db, COMPACTED_CURSOR)),
+               COMPACTED_CURSOR)
+    return dropped
+
+################################################################################
+###                             Commit listeners                             ###
+################################################################################
+def add_commit_listener(listener: Callable[[], None]):
+    _commit_listeners.append(listener)
+
+def remove_commit_listener(listener: Callable[[], None]):
+    if listener in _commit_listeners:
+        _commit_listeners.remove(listener)
+
+def notify_commit_listeners():
+    for listener in list(_commit_listeners):
+        listener()
+
+def add_project_listener(listener: Callable[[Set[int]], None]):
+    _project_listeners.append(listener)
+
+def remove_project_listener(listener: Callable[[Set[int]], None]):
+    if listener in _project_listeners:
+        _project_listeners.remove(listener)
+
+def notify_project_listeners(project_ids: Set[int]):
+    if project_ids:
+        for listener in list(_project_listeners):
+            listener(project_ids)
+
+# * Sessions of the single writer (info["write_group"]) only release a
+#   SAVEPOINT when they commit; the writer notifies once its group commits
+@event.listens_for(Session, "after_commit")
+def _notify_after_commit(session: Session):
+    if session.info.get("write_group"):
+        return
+    if session.info.pop("outbox_pending", False):
+        notify_commit_listeners()
+    notify_project_listeners(take_touched_projects(session))
+
+@event.listens_for(Session, "after_rollback")
+def _clear_pending(session: Session):
+    session.info.pop("outbox_pending", None)
+    session.info.pop("touched_projects", None)
@@ -0,0 +1,27 @@
+################################################################################
+# crud/pagination.py
+# Purpose:  Keyset (cursor) pagination shared by the list reads. Pages are
+#           ordered by id and the cursor is the last id of the previous page,
+#           so every page is a single indexed range scan ("id > cursor LIMIT
+#           n") and costs the same no matter how deep the client has paged.
+################################################################################
+
+# Libraries
+from typing import Any, Dict, Optional
+from sqlalchemy.orm import Query
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# * Fetches one row past the limit to know whether another page exists
+# * Returns {"items": [...], "next_cursor": id or None}, see schemas.Page
+def paginate(query: Query, key_column, cursor: Optional[int] = None,
+             limit: int = DEFAULT_PAGE_SIZE) -> Dict[str, Any]:
+    if cursor is not None:
+        query = query.filter(key_column > cursor)
+    rows = query.order_by(key_column).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].id
+    return {"items": rows, "next_cursor": next_cursor}
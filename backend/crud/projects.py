@@ -4,114 +4,263 @@
 #           Functions include creating, reading, adding/removing users, and
 #           deleting projects. All operations are performed using project IDs to
 #           ensure consistent and reliable access to records in the event of
-#           database corruption.
+#           database corruption. Every mutation records its real-time event in
+#           the outbox within the same transaction.
 ################################################################################
 
 # Libraries
-from sqlalchemy.orm import Session
+from sqlalchemy import case, delete, exists, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from typing import List, Optional
 
 # Local files
-from ..models import Project, User, Task
-from ..schemas import ProjectCreate
+from ..database import read_snapshot
+from ..models import Project, User, Task, TaskStatus, project_members
+from ..schemas import ProjectCreate, UserCreate
 from ..exceptions import *
+from ..websocket_utils import EventType, convert_to_dict
+from .events import get_head_seq, record_event, record_events
+from .pagination import DEFAULT_PAGE_SIZE, paginate
+from .users import get_or_create_users, unassign_tasks
+
+# schemas.Project serializes the members of every project it returns
+PROJECT_LOADERS = (selectinload(Project.members),)
 
 ################################################################################
 ###                                 Project                                  ###
 ################################################################################
 # Create
+# * Duplicate names are rejected by the unique index on projects.name
+# * INSERT ... RETURNING hands back the row with its server defaults, so it is
+#   not read again after the commit
 def create_project(db: Session, project: ProjectCreate):
-    # Handling duplicate names
-    dupe = db.query(Project).filter(
-                Project.name == project.name
-           ).first()
-    if dupe:
+    try:
+        db_project = db.execute(
+            insert(Project).values(**project.model_dump()).returning(Project)
+        ).scalar_one()
+    except IntegrityError:
+        db.rollback()
         raise DuplicateProjectName(project.name)
-
-    db_project = Project(**project.model_dump())
-    db.add(db_project)
+    # A new project has no members, no need to ask
+    set_committed_value(db_project, "members", [])
+    record_event(db, EventType.PROJECT_CREATED, convert_to_dict(db_project))
     db.commit()
-    db.refresh(db_project)
     return db_project
 
 # Read
+# * Query budget: 2 (project, members)
 def get_project(db: Session, project_id: int):
-    project = db.query(Project).filter(
+    project = db.query(Project).options(*PROJECT_LOADERS).filter(
                     Project.id == project_id
               ).first()
     if not project:
         raise ProjectNotFound(project_id)
     return project
 
-def get_all_projects(db: Session):
-    projects = db.query(Project).all()
-    return projects
+# * Query budget: 2 per page (projects, members)
+def get_projects_page(db: Session, cursor: Optional[int] = None,
+                      limit: int = DEFAULT_PAGE_SIZE):
+    return paginate(db.query(Project).options(*PROJECT_LOADERS),
+                    Project.id, cursor, limit)
 
-# Update
-def add_user_to_project(db: Session, project_id: int, user_id: int):
-    project = db.query(Project).filter(
-                    Project.id == project_id
-              ).first()
-    user = db.query(User).filter(
-                User.id == user_id
-           ).first()
+# * Primary key lookup, None if the project does not exist
+# * Query budget: 1
+def get_project_version(db: Session, project_id: int) -> Optional[int]:
+    return db.query(Project.version).filter(
+                Project.id == project_id
+           ).scalar()
 
-    # Ensure the project and the user exists
+# * One grouped query per page: projects are walked in id order, each joined
+#   to its tasks through the (project_id, status) index and counted per
+#   status, with the member count from a correlated count on project_members
+# * Query budget: 1 per page
+def get_project_summaries(db: Session, cursor: Optional[int] = None,
+                          limit: int = DEFAULT_PAGE_SIZE):
+    member_count = select(func.count()) \
+                   .where(project_members.c.project_id == Project.id) \
+                   .correlate(Project) \
+                   .scalar_subquery()
+    status_counts = [func.count(case((Task.status == status, 1)))
+                          .label(status.name)
+                     for status in TaskStatus]
+    query = db.query(Project.id, Project.name, Project.updated_at,
+                     member_count.label("member_count"),
+                     *status_counts) \
+              .outerjoin(Task, Task.project_id == Project.id) \
+              .group_by(Project.id)
+    page = paginate(query, Project.id, cursor, limit)
+    page["items"] = [{
+        "id": row.id,
+        "name": row.name,
+        "updated_at": row.updated_at,
+        "member_count": row.member_count,
+        "task_count": sum(getattr(row, status.name) for status in TaskStatus),
+        "task_counts": {status.value: getattr(row, status.name)
+                        for status in TaskStatus},
+    } for row in page["items"]]
+    return page
+
+# * Project, members and compact tasks for the task board, all read from the
+#   same snapshot so they agree with each other
+# * seq is the change log head in that snapshot, for delta sync later on
+# * Query budget: 5 (BEGIN, project, members, tasks, head)
+def get_board(db: Session, project_id: int):
+    read_snapshot(db)
+    project = get_project(db, project_id)
+    tasks = db.query(Task).filter(
+                Task.project_id == project_id
+            ).order_by(Task.id).all()
+    return {"project": project, "members": project.members, "tasks": tasks,
+            "seq": get_head_seq(db)}
+
+# * Query budget: 1, members are not loaded
+def get_project_info(db: Session, project_id: int):
+    project = db.get(Project, project_id)
     if not project:
         raise ProjectNotFound(project_id)
+    return project
+
+# Membership is checked and changed directly on project_members, so the cost
+# does not grow with the number of members
+# * Query budget: 1
+def is_member(db: Session, project_id: int, user_id: int) -> bool:
+    return db.scalar(select(exists().where(
+                project_members.c.project_id == project_id,
+                project_members.c.user_id == user_id
+           )))
+
+# Update
+# * Members already in the project are left alone; returns the users added
+# * One INSERT ... ON CONFLICT DO NOTHING RETURNING for all of them
+def _add_members(db: Session, project: Project, users: List[User]):
+    if not users:
+        return []
+    added = set(db.scalars(
+        sqlite_insert(project_members)
+        .values([{"project_id": project.id, "user_id": user.id}
+                 for user in users])
+        .on_conflict_do_nothing()
+        .returning(project_members.c.user_id)
+    ))
+    users = [user for user in users if user.id in added]
+    if users:
+        record_events(db, EventType.MEMBER_ADDED, [{
+            "project_id": project.id,
+            "user": convert_to_dict(user)
+        } for user in users], project_id=project.id)
+    return users
+
+# * Non-members are left alone; returns the users removed
+# * One DELETE ... RETURNING, then one UPDATE unassigning their tasks in the
+#   project, with task_updated events for those
+def _remove_members(db: Session, project: Project, users: List[User]):
+    if not users:
+        return []
+    removed = set(db.scalars(
+        delete(project_members)
+        .where(project_members.c.project_id == project.id,
+               project_members.c.user_id.in_([user.id for user in users]))
+        .returning(project_members.c.user_id)
+    ))
+    if not removed:
+        return []
+    unassign_tasks(db, Task.project_id == project.id,
+                   Task.assigned_to.in_(removed))
+    users = [user for user in users if user.id in removed]
+    record_events(db, EventType.MEMBER_REMOVED, [{
+        "project_id": project.id,
+        "user": convert_to_dict(user)
+    } for user in users], project_id=project.id)
+    return users
+
+# * Query budget: 5 (project, user, insert, event, project version)
+def add_user_to_project(db: Session, project_id: int, user_id: int):
+    # Ensure the project and the user exists
+    project = get_project_info(db, project_id)
+    user = db.get(User, user_id)
     if not user:
         raise UserNotFound(user_id)
 
-    if user not in project.members:
-        project.members.append(user)
-        db.commit()
-        db.refresh(project)
-        db.refresh(user)
-    else:
+    if not _add_members(db, project, [user]):
         raise UserInProject(user.name, project.name)
-
+    db.commit()
     return user
 
+# * Tasks in the project assigned to the user are unassigned
 def remove_user_from_project(db: Session, project_id: int, user_id: int):
-    project = db.query(Project).filter(
-                    Project.id == project_id
-              ).first()
-    user = db.query(User).filter(
-                User.id == user_id
-           ).first()
-
     # Ensure the project and the user exists
-    if not project:
-        raise ProjectNotFound(project_id)
+    project = get_project_info(db, project_id)
+    user = db.get(User, user_id)
     if not user:
         raise UserNotFound(user_id)
 
-    if user in project.members:
-        project.members.remove(user)
-
-        # Find tasks in this project assigned to the user and reassign to NULL
-        tasks = db.query(Task).filter(
-                    Task.project_id == project_id,
-                    Task.assigned_to == user_id
-                ).all()
-
-        for task in tasks:
-            task.assigned_to = None
-            task.assigned_user = None
-
-        db.commit()
-        db.refresh(project)
-        db.refresh(user)  # Add this line
-    else:
+    if not _remove_members(db, project, [user]):
         raise UserNotInProject(user.name, project.name)
-
+    db.commit()
     return user
 
+# Add users by name and email, creating those that do not exist yet
+# * One upsert for the users and one insert for the memberships, however many
+#   are invited
+# * Emails taken by a user with another name, or repeated with another
+#   name, are reported as conflicts
+def invite_members(db: Session, project_id: int,
+                   people: List[UserCreate]):
+    project = get_project_info(db, project_id)
+    invited, conflicts = get_or_create_users(db, people)
+    added = _add_members(db, project, invited)
+    db.commit()
+    added_ids = {user.id for user in added}
+    return {
+        "changed": added,
+        "unchanged": [user.id for user in invited
+                      if user.id not in added_ids],
+        "conflicts": conflicts,
+    }
+
+# Add or remove many users at once
+# * Users that do not exist are reported, as are those that are already
+#   (or, when removing, not) members; the rest are changed with one
+#   statement
+# * Query budget: 2 + the statements of _add_members or _remove_members
+def change_members(db: Session, project_id: int, user_ids: List[int],
+                   add: bool):
+    project = get_project_info(db, project_id)
+    user_ids = list(dict.fromkeys(user_ids))
+    users = db.query(User).filter(User.id.in_(user_ids)).all()
+    found = {user.id for user in users}
+    changed = (_add_members if add else _remove_members)(db, project, users)
+    db.commit()
+    changed_ids = {user.id for user in changed}
+    return {
+        "changed": changed,
+        "unchanged": [user_id for user_id in user_ids
+                      if user_id in found and user_id not in changed_ids],
+        "not_found": [user_id for user_id in user_ids
+                      if user_id not in found],
+    }
 
 # Delete
+# * Tasks and memberships go with one statement each, so the cost does not
+#   grow with the project; explicit rather than left to ON DELETE CASCADE,
+#   which databases created before it was declared do not have
+# * Query budget: 6 (project, tasks, members, project, event, version)
 def delete_project(db: Session, project_id: int):
-    db_project = get_project(db, project_id)
-    if not db_project:
-        raise ProjectNotFound(project_id)
-    db.delete(db_project)
+    db_project = get_project_info(db, project_id)
+    for statement in (
+        delete(Task).where(Task.project_id == project_id),
+        delete(project_members).where(
+            project_members.c.project_id == project_id),
+        delete(Project).where(Project.id == project_id),
+    ):
+        db.execute(statement,
+                   execution_options={"synchronize_session": False})
+    record_event(db, EventType.PROJECT_DELETED, {
+        "id": db_project.id,
+        "name": db_project.name
+    }, project_id=db_project.id)
     db.commit()
     return db_project
@@ -6,22 +6,44 @@
 #           duplicates), and deletion. Ensures business rules like project
 #           membership and task uniqueness are enforced at the database
 #           interaction layer. Again, ID's are used to ensure consistency in the
-#           event of data corruption.
+#           event of data corruption. Every mutation records its real-time
+#           event in the outbox within the same transaction.
 ################################################################################
 
 # Libraries
+from sqlalchemy import exists, insert, or_, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session, selectinload
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
 
 # Local files
-from ..models import Project, Task, User
-from ..schemas import TaskCreate
+from ..models import Project, Task, TaskStatus, User, project_members
+from ..schemas import BulkOp, TaskBulkOperation, TaskCompact, TaskCreate
 from ..exceptions import *
+from ..websocket_utils import EventType, convert_to_dict
+from .events import record_event
+from .projects import is_member
+from .pagination import DEFAULT_PAGE_SIZE, paginate
+
+# Everything schemas.Task serializes, loaded up front with one IN query per
+# relationship, so serializing N tasks never lazy loads row by row
+# * Keyed by the expand names of schemas.task_view
+TASK_EXPANSION_LOADERS = {
+    "project": selectinload(Task.project).selectinload(Project.members),
+    "assigned_user": selectinload(Task.assigned_user),
+}
+TASK_LOADERS = tuple(TASK_EXPANSION_LOADERS.values())
 
 ################################################################################
 ###                                  Task                                    ###
 ################################################################################
 
 # Create
+# * Duplicate names in the same project are rejected by the unique index on
+#   tasks(project_id, title)
+# * The row comes back from INSERT ... RETURNING, nothing is read afterwards
+#   apart from what the response nests (project members, assignee)
 def create_task(db: Session, task: TaskCreate):
     # Double checks that the project to be attached to exists
     project = db.query(Project).filter(
@@ -29,47 +51,33 @@ def create_task(db: Session, task: TaskCreate):
               ).first()
     if not project:
         raise ProjectNotFound(task.project_id)
-
-    # Handling duplicate names in the same project
-    dupe = db.query(Task).filter(
-                Task.project_id == task.project_id,
-                Task.title == task.title
-           ).first()
-    if dupe:
-        raise DuplicateTaskName(task.title, project.name)
+    project_name = project.name
 
     # Check if the assigned user is a member of the project
     if task.assigned_to is not None:
-        assignee = db.query(User).filter(
-                        User.id == task.assigned_to
-                   ).first()
+        assignee = db.get(User, task.assigned_to)
         if not assignee:
             raise UserNotFound(task.assigned_to)
-
-        project = db.query(Project).filter(
-                        Project.id == task.project_id
-                  ).first()
-        if not project:
-            raise ProjectNotFound(task.project_id)
-        user_ids = [user.id for user in project.members]
-        # Since members of a project HAS to be valid users, no need to double
-        # check here
-        if assignee.id not in user_ids:
+        if not is_member(db, project.id, assignee.id):
             raise AssigneeNotMember(assignee.name, project.name)
 
-    db_task = Task(**task.model_dump())
-    db.add(db_task)
+    try:
+        db_task = db.execute(
+            insert(Task).values(**task.model_dump()).returning(Task)
+        ).scalar_one()
+    except IntegrityError:
+        db.rollback()
+        raise DuplicateTaskName(task.title, project_name)
+    record_event(db, EventType.TASK_CREATED, convert_to_dict(db_task),
+                 project_id=db_task.project_id)
     db.commit()
-    db.refresh(db_task)
     return db_task
 
 # Read
+# * Query budget: 4 (task, project, members, assignee)
 def get_task(db: Session, task_id: int):
     task = db.query(Task) \
-           .options(
-               selectinload(Task.project),
-               selectinload(Task.assigned_user)
-           ) \
+           .options(*TASK_LOADERS) \
            .filter(
                Task.id == task_id
            ).first()
@@ -77,26 +85,42 @@ def get_task(db: Session, task_id: int):
         raise TaskNotFound(task_id)
     return task
 
-def get_tasks_by_project(db: Session, project_id: int):
-    project = db.query(Project).filter(
+# * Filters are applied in SQL; (project_id, status) and assigned_to are
+#   indexed, and both indexes end in the rowid so the id range scan and
+#   ordering are served by the index as well
+# * Only the relationships named in expand are loaded
+# * Query budget: 2 per page (project check, tasks), plus 2 to expand project
+#   and 1 to expand assigned_user
+def get_tasks_page(db: Session, project_id: int,
+                   status: Optional[TaskStatus] = None,
+                   assigned_to: Optional[int] = None,
+                   cursor: Optional[int] = None,
+                   limit: int = DEFAULT_PAGE_SIZE,
+                   expand: Iterable[str] = ()):
+    project = db.query(Project.id).filter(
                     Project.id == project_id
               ).first()
     if not project:
         raise ProjectNotFound(project_id)
-    return db.query(Task) \
-            .options(
-                selectinload(Task.project),
-                selectinload(Task.assigned_user)
-            ) \
-            .filter(
-                Task.project_id == project_id
-            ).all()
+    query = db.query(Task) \
+              .options(*[TASK_EXPANSION_LOADERS[name] for name in expand]) \
+              .filter(
+                  Task.project_id == project_id
+              )
+    if status is not None:
+        query = query.filter(Task.status == TaskStatus(status))
+    if assigned_to is not None:
+        query = query.filter(Task.assigned_to == assigned_to)
+    return paginate(query, Task.id, cursor, limit)
 
 # Update
+# * Renaming to a duplicate name is rejected by the unique index on
+#   tasks(project_id, title)
 def update_task(db: Session, task_id: int, updated: TaskCreate):
     db_task = get_task(db, task_id)
     if not db_task:
         raise TaskNotFound(task_id)
+    project_name = db_task.project.name
 
     # Prevent project reassignment
     if updated.project_id != db_task.project_id:
@@ -104,45 +128,266 @@ def update_task(db: Session, task_id: int, updated: TaskCreate):
 
     # Check if the assigned user is a member of the project
     if updated.assigned_to is not None:
-        assignee = db.query(User).filter(
-                        User.id == updated.assigned_to
-                   ).first()
+        assignee = db.get(User, updated.assigned_to)
         if not assignee:
             raise UserNotFound(updated.assigned_to)
-
-        project = db.query(Project).filter(
-                        Project.id == db_task.project_id
-                  ).first()
-        if not project:
-            raise ProjectNotFound(db_task.project_id)
-        user_ids = [user.id for user in project.members]
-        # Since members of a project HAS to be valid users, no need to double
-        # check here
-        if assignee.id not in user_ids:
-            raise AssigneeNotMember(assignee.name, project.name)
-
-    # Check if the new name is a duplicate within the project
-    dupe = db.query(Task).filter(
-                Task.project_id == db_task.project_id,
-                Task.title == updated.title,
-                # Allow edits without changing task title
-                Task.title != db_task.title
-           ).first()
-    if dupe:
-        raise DuplicateTaskName(updated.title, project.name)
+        if not is_member(db, db_task.project_id, assignee.id):
+            raise AssigneeNotMember(assignee.name, project_name)
 
     for key, value in updated.model_dump().items():
         setattr(db_task, key, value)
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        raise DuplicateTaskName(updated.title, project_name)
+    record_event(db, EventType.TASK_UPDATED, convert_to_dict(db_task),
+                 project_id=db_task.project_id)
     db.commit()
     db.refresh(db_task)
     return db_task
 
+# Partial update as a single conditional UPDATE ... RETURNING
+# * Only the fields sent are written, and only those are checked: a new
+#   assignee must be a member (an EXISTS in the WHERE clause, skipped when
+#   the task already has that assignee) and a new title must be unique (the
+#   unique index)
+# * expected_version (from If-Match) is compared by the same statement, so a
+#   concurrent change is caught without reading the task first
+# * The task is only read when nothing was updated, to tell why
+# * Query budget: 3 statements (update, outbox event, project version)
+def patch_task(db: Session, task_id: int, changes: Dict[str, Any],
+               expected_version: Optional[int] = None):
+    if changes.get("status") is not None:
+        changes = {**changes, "status": TaskStatus(changes["status"])}
+    conditions = [Task.id == task_id]
+    if expected_version is not None:
+        conditions.append(Task.version == expected_version)
+    if changes.get("assigned_to") is not None:
+        conditions.append(or_(
+            Task.assigned_to == changes["assigned_to"],
+            exists().where(
+                project_members.c.project_id == Task.project_id,
+                project_members.c.user_id == changes["assigned_to"]
+            )
+        ))
+    statement = update(Task) \
+                .where(*conditions) \
+                .values(**changes, version=Task.version + 1) \
+                .returning(Task)
+    try:
+        db_task = db.execute(
+            statement, execution_options={"synchronize_session": False}
+        ).scalar_one_or_none()
+    except IntegrityError:
+        db.rollback()
+        project_name = db.query(Project.name).join(Task).filter(
+                            Task.id == task_id
+                       ).scalar()
+        raise DuplicateTaskName(changes["title"], project_name)
+    if db_task is None:
+        _explain_failed_patch(db, task_id, changes, expected_version)
+
+    task = TaskCompact.model_validate(db_task).model_dump(mode="json")
+    record_event(db, EventType.TASK_UPDATED, task,
+                 project_id=db_task.project_id)
+    db.commit()
+    return task
+
+def _explain_failed_patch(db: Session, task_id: int, changes: Dict[str, Any],
+                          expected_version: Optional[int]):
+    db_task = db.get(Task, task_id)
+    if not db_task:
+        raise TaskNotFound(task_id)
+    if expected_version is not None and db_task.version != expected_version:
+        raise TaskVersionConflict(task_id, db_task.version)
+    assignee = db.get(User, changes["assigned_to"])
+    if not assignee:
+        raise UserNotFound(changes["assigned_to"])
+    raise AssigneeNotMember(assignee.name, db_task.project.name)
+
 # Delete
 def delete_task(db: Session, task_id: int):
     db_task = get_task(db, task_id)
     if not db_task:
         raise TaskNotFound(task_id)
     db.delete(db_task)
+    record_event(db, EventType.TASK_DELETED, {
+        "id": db_task.id,
+        "title": db_task.title,
+        "project_id": db_task.project_id
+    }, project_id=db_task.project_id)
     db.commit()
     return db_task
 
+################################################################################
+###                                   Bulk                                   ###
+################################################################################
+# Everything a bulk request needs to validate, fetched with one query per kind
+# (tasks, projects, assignees, memberships, clashing titles) instead of per
+# operation
+class _BulkContext:
+    def __init__(self, db: Session, operations: List[TaskBulkOperation]):
+        task_ids = {op.id for op in operations if op.op != BulkOp.create}
+        self.tasks = {task.id: task for task in db.query(Task).filter(
+                          Task.id.in_(task_ids))} if task_ids else {}
+
+        project_ids = {op.project_id for op in operations
+                       if op.op == BulkOp.create} | \
+                      {task.project_id for task in self.tasks.values()}
+        self.projects = {project.id: project for project in
+                         db.query(Project).filter(
+                             Project.id.in_(project_ids))}
+
+        assignee_ids = {op.assigned_to for op in operations
+                        if op.assigned_to is not None}
+        self.users, self.members = {}, set()
+        if assignee_ids:
+            self.users = {user.id: user for user in db.query(User).filter(
+                              User.id.in_(assignee_ids))}
+            self.members = set(db.query(project_members.c.project_id,
+                                        project_members.c.user_id).filter(
+                project_members.c.project_id.in_(project_ids),
+                project_members.c.user_id.in_(assignee_ids)
+            ).all())
+
+        # (project_id, title) -> task id, kept up to date as the operations
+        # are applied so clashes within the request are caught as well
+        titles = {op.title for op in operations if op.title is not None}
+        self.titles = {(project_id, title): task_id
+                       for task_id, project_id, title in db.query(
+                           Task.id, Task.project_id, Task.title).filter(
+                               Task.project_id.in_(project_ids),
+                               Task.title.in_(titles))} if titles else {}
+        for task in self.tasks.values():
+            self.titles[(task.project_id, task.title)] = task.id
+
+    def project(self, project_id: int) -> Project:
+        if project_id not in self.projects:
+            raise ProjectNotFound(project_id)
+        return self.projects[project_id]
+
+    def task(self, task_id: int) -> Task:
+        if task_id not in self.tasks:
+            raise TaskNotFound(task_id)
+        return self.tasks[task_id]
+
+    def check_assignee(self, project: Project, user_id: Optional[int]):
+        if user_id is None:
+            return
+        if user_id not in self.users:
+            raise UserNotFound(user_id)
+        if (project.id, user_id) not in self.members:
+            raise AssigneeNotMember(self.users[user_id].name, project.name)
+
+    def check_title(self, project: Project, title: str,
+                    task_id: Optional[int] = None):
+        owner = self.titles.get((project.id, title))
+        if owner is not None and owner != task_id:
+            raise DuplicateTaskName(title, project.name)
+
+    # * New tasks have no id until the flush, their Task stands in for it
+    def move_title(self, project_id: int, old: Optional[str],
+                   new: Optional[str], owner: Any):
+        if old is not None:
+            self.titles.pop((project_id, old), None)
+        if new is not None:
+            self.titles[(project_id, new)] = owner
+
+def _bulk_create(db: Session, ctx: _BulkContext, op: TaskBulkOperation):
+    project = ctx.project(op.project_id)
+    ctx.check_assignee(project, op.assigned_to)
+    ctx.check_title(project, op.title)
+    db_task = Task(**TaskCreate(**op.model_dump(
+                        exclude={"op", "id"}, exclude_none=True)).model_dump())
+    db.add(db_task)
+    ctx.move_title(project.id, None, op.title, db_task)
+    return db_task
+
+def _bulk_update(db: Session, ctx: _BulkContext, op: TaskBulkOperation):
+    db_task = ctx.task(op.id)
+    project = ctx.project(db_task.project_id)
+    changes = op.changes()
+    if changes.get("project_id", db_task.project_id) != db_task.project_id:
+        raise MovingTaskToNewProject(db_task.title)
+    if "assigned_to" in changes:
+        ctx.check_assignee(project, changes["assigned_to"])
+    if changes.get("title") is not None:
+        ctx.check_title(project, changes["title"], db_task.id)
+        ctx.move_title(project.id, db_task.title, changes["title"],
+                       db_task.id)
+    for key, value in changes.items():
+        # status, title and project_id cannot be cleared
+        if value is not None or key in ("description", "assigned_to"):
+            setattr(db_task, key, value)
+    if changes.get("title") is not None:
+        # Free the old title now; the flush would otherwise order statements
+        # its own way and could hit the unique index mid-way
+        db.flush()
+    return db_task
+
+def _bulk_delete(db: Session, ctx: _BulkContext, op: TaskBulkOperation):
+    db_task = ctx.task(op.id)
+    del ctx.tasks[op.id]
+    ctx.move_title(db_task.project_id, db_task.title, None, None)
+    db.delete(db_task)
+    # Flushes insert before they delete, so free the title right away
+    db.flush()
+    return db_task
+
+_BULK_HANDLERS = {
+    BulkOp.create: _bulk_create,
+    BulkOp.update: _bulk_update,
+    BulkOp.delete: _bulk_delete,
+}
+
+_BULK_EVENT_KEYS = {BulkOp.create: "created", BulkOp.update: "updated"}
+
+_BULK_ERRORS = (ProjectNotFound, TaskNotFound, UserNotFound,
+                AssigneeNotMember, DuplicateTaskName, MovingTaskToNewProject)
+
+# Create, update and delete tasks in one transaction
+# * Every operation is validated against state fetched up front and against
+#   the operations before it; those that fail are reported and skipped, the
+#   rest are applied in order and committed together
+# * Each project touched gets a single tasks_bulk event listing its created,
+#   updated and deleted tasks
+# * Results are compact task dicts taken before the commit, so returning them
+#   does not reload every task
+def bulk_tasks(db: Session, operations: List[TaskBulkOperation]):
+    ctx = _BulkContext(db, operations)
+    applied, results = [], []
+    for index, op in enumerate(operations):
+        result: Dict[str, Any] = {"index": index, "op": op.op, "ok": False,
+                                  "id": op.id}
+        try:
+            applied.append((op.op, _BULK_HANDLERS[op.op](db, ctx, op), result))
+            result["ok"] = True
+        except _BULK_ERRORS as e:
+            result["error"] = e.message
+            result["error_type"] = type(e).__name__
+        results.append(result)
+
+    db.flush()
+    changes = defaultdict(lambda: {"created": [], "updated": [],
+                                   "deleted": []})
+    for kind, db_task, result in applied:
+        task = TaskCompact.model_validate(db_task).model_dump(mode="json")
+        result["id"] = task["id"]
+        if kind == BulkOp.delete:
+            changes[db_task.project_id]["deleted"].append({
+                "id": task["id"], "title": task["title"],
+                "project_id": task["project_id"]
+            })
+        else:
+            result["task"] = task
+            changes[db_task.project_id][_BULK_EVENT_KEYS[kind]].append(task)
+    for project_id, project_changes in changes.items():
+        record_event(db, EventType.TASKS_BULK,
+                     {"project_id": project_id, **project_changes},
+                     project_id=project_id)
+    db.commit()
+
+    succeeded = sum(result["ok"] for result in results)
+    return {"succeeded": succeeded, "failed": len(results) - succeeded,
+            "results": results}
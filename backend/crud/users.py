@@ -2,40 +2,51 @@
 # crud/users.py
 # Purpose:  Implements CRUD and search operations for the User model using
 #           SQLAlchemy. Handles user creation with email uniqueness validation,
-#           retrieval by ID or project, deletion with task cleanup, and fallback
-#           creation through email-based lookup. Again, ID is used to reference
-#           users to ensure consistency in case of data corruption.
+#           retrieval by ID or project, deletion with task cleanup, and
+#           get-or-create by email as a single upsert. Again, ID is used to
+#           reference users to ensure consistency in case of data corruption.
+#           Every mutation records its real-time event in the outbox within
+#           the same transaction.
 ################################################################################
 
 # Libraries
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 from pydantic import EmailStr
 
 # Local files
-from ..models import Project, User, Task
-from ..schemas import UserCreate
+from ..models import Project, User, Task, project_members
+from ..schemas import TaskCompact, UserCreate
 from ..exceptions import *
+from ..websocket_utils import EventType, convert_to_dict
+from .events import record_event, record_events
+from .pagination import DEFAULT_PAGE_SIZE, paginate
 
 ################################################################################
 ###                                  User                                    ###
 ################################################################################
 
 # Create
+# * Duplicate emails are rejected by the unique index on users.email
+# * The row comes back from INSERT ... RETURNING, nothing is read afterwards
 def create_user(db: Session, user: UserCreate):
-    # Handling duplicate names
-    dupe = db.query(User).filter(
-                User.email == user.email
-           ).first()
-    if dupe:
+    try:
+        db_user = db.execute(
+            insert(User).values(**user.model_dump()).returning(User)
+        ).scalar_one()
+    except IntegrityError:
+        db.rollback()
         raise DuplicateUserEmail(user.email)
-
-    db_user = User(**user.model_dump())
-    db.add(db_user)
+    record_event(db, EventType.USER_CREATED, convert_to_dict(db_user))
     db.commit()
-    db.refresh(db_user)
     return db_user
 
 # Read
+# * Query budget: 1
 def get_user(db: Session, user_id: int):
     user = db.query(User).filter(
                 User.id == user_id
@@ -44,12 +55,16 @@ def get_user(db: Session, user_id: int):
         raise UserNotFound(user_id)
     return user
 
-def get_all_users(db: Session):
-    users = db.query(User).all()
-    return users
+# * Query budget: 1 per page
+def get_users_page(db: Session, cursor: Optional[int] = None,
+                   limit: int = DEFAULT_PAGE_SIZE):
+    return paginate(db.query(User), User.id, cursor, limit)
 
+# * Query budget: 2 (project, members)
 def get_users_by_project(db: Session, project_id: int):
-    project = db.query(Project).filter(
+    project = db.query(Project) \
+              .options(selectinload(Project.members)) \
+              .filter(
                     Project.id == project_id
               ).first()
     if not project:
@@ -59,31 +74,111 @@ def get_users_by_project(db: Session, project_id: int):
 # Update - No need to update user information, from the clients' side, simply
 #          remove and re-add a member to a project.
 
-# Search
-def find_user_by_email(db: Session, name: str, email: EmailStr):
-    user = db.query(User).filter(
-                User.email == email.lower(),
-                User.name == name
-           ).first()
-    # Force create a new user here
-    if not user:
-        new_user_data = UserCreate(name=name, email=email)
-        user = create_user(db, new_user_data)
+# Get or create
+# * One INSERT ... ON CONFLICT(email) DO UPDATE ... RETURNING for all of them:
+#   new emails are inserted and existing ones come back unchanged, as long as
+#   the name matches. Rows whose name does not match are not returned, and
+#   their emails are reported as conflicts
+# * New rows are told apart from the emails that existed before the upsert
+#   (read first, one index lookup). This relies on the write transaction
+#   (BEGIN IMMEDIATE) keeping anyone else from inserting in between
+# * Does not commit; a repeated email is only used once, and reported as a
+#   conflict as well if it comes again with another name
+# * Query budget: 2, plus the user_created events if any users are new
+def get_or_create_users(db: Session, people: Iterable[UserCreate]) \
+        -> Tuple[List[User], List[str]]:
+    unique: Dict[str, UserCreate] = {}
+    repeated: Dict[str, None] = {}
+    for person in people:
+        first = unique.setdefault(person.email, person)
+        if first.name != person.name:
+            repeated[person.email] = None
+    if not unique:
+        return [], []
 
-    return user
+    existing = set(db.scalars(
+                   select(User.email).where(User.email.in_(list(unique)))))
+    statement = sqlite_insert(User).values(
+                    [person.model_dump() for person in unique.values()])
+    statement = statement.on_conflict_do_update(
+        index_elements=[User.email],
+        set_={"email": statement.excluded.email},
+        where=User.name == statement.excluded.name
+    ).returning(User)
+    found = {user.email: user for user in db.scalars(
+                statement, execution_options={"populate_existing": True})}
+
+    created = [user for email, user in found.items()
+               if email not in existing]
+    if created:
+        record_events(db, EventType.USER_CREATED,
+                      [convert_to_dict(user) for user in created])
+    conflicts = dict.fromkeys(email for email in unique if email not in found)
+    conflicts.update(repeated)
+    return [found[email] for email in unique if email in found], \
+           list(conflicts)
+
+# * The same email under another name is a duplicate
+def get_or_create_user(db: Session, name: str, email: EmailStr):
+    users, conflicts = get_or_create_users(
+                           db, [UserCreate(name=name, email=email)])
+    if conflicts:
+        raise DuplicateUserEmail(conflicts[0])
+    return users[0]
+
+# Unassign the tasks matching where with one UPDATE ... RETURNING
+# * Each task gets a new version and a task_updated event, one batch per
+#   project, so clients and the change log see the change like any other
+# * Returns the ids of the projects whose tasks were unassigned
+def unassign_tasks(db: Session, *where) -> Set[int]:
+    unassigned = db.scalars(
+        update(Task).where(*where)
+        .values(assigned_to=None, version=Task.version + 1)
+        .returning(Task),
+        execution_options={"synchronize_session": False,
+                           "populate_existing": True}
+    ).all()
+    changed = defaultdict(list)
+    for task in unassigned:
+        changed[task.project_id].append(
+            TaskCompact.model_validate(task).model_dump(mode="json"))
+    for project_id, tasks in changed.items():
+        record_events(db, EventType.TASK_UPDATED, tasks,
+                      project_id=project_id)
+    return set(changed)
 
 # Delete
+# * Set-based like project deletes: memberships and assignments are cleared
+#   with one statement each, however many the user has
+# * Each project the user was a member of gets a member_removed event, as if
+#   they had been removed from it, so its viewers and its change log see it
+# * Query budget: 6 (user, memberships, tasks, members, user, event), plus an
+#   event and a version bump per project
 def delete_user(db: Session, user_id: int):
     db_user = get_user(db, user_id)
     if not db_user:
         raise UserNotFound(user_id)
 
-    # Update all tasks assigned to this user to have assigned_to = None
-    db.query(Task).filter(
-            Task.assigned_to == user_id
-    ).update({"assigned_to": None})
-
-    db.delete(db_user)
+    member_projects = db.scalars(
+        select(project_members.c.project_id).where(
+            project_members.c.user_id == user_id
+        )
+    ).all()
+    user = convert_to_dict(db_user)
+    for project_id in member_projects:
+        record_event(db, EventType.MEMBER_REMOVED, {
+            "project_id": project_id,
+            "user": user
+        }, project_id=project_id)
+    # Projects where the user only had tasks assigned change too
+    unassign_tasks(db, Task.assigned_to == user_id)
+    db.execute(delete(project_members).where(
+                    project_members.c.user_id == user_id))
+    db.execute(delete(User).where(User.id == user_id),
+               execution_options={"synchronize_session": False})
+    record_event(db, EventType.USER_DELETED, {
+        "id": db_user.id,
+        "name": db_user.name
+    })
     db.commit()
     return db_user
-
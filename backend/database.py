@@ -1,24 +1,171 @@
 ################################################################################
 # database.py
-# Purpose:  Sets up the locally hosted database via SQLite in taskboard.db
+# Purpose:  Sets up the locally hosted database via SQLite in taskboard.db.
+#           A storage profile (DB_PROFILE=dev|prod) decides the PRAGMAs every
+#           connection gets and how the pools are sized. There are three
+#           engines: a read-only pool for GET routes, a dedicated engine for
+#           the single writer (see db_writer.py), and a general engine for
+#           table creation and housekeeping. Pool checkout metrics are kept for
+#           each of them.
 ################################################################################
 
 # Libraries
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base
+import threading
+from typing import Any, Dict
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, declarative_base
 from sqlalchemy.orm import sessionmaker
 
 # Path to the SQLite file (now configurable via environment variable)
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./taskboard.db")
 
-# SQLite needs a special argument for multi-threading support
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Storage profiles
+# * pragmas are applied to every new connection; journal_mode is persistent
+#   in the database file and only set from read-write connections
+# * WAL lets readers run alongside the writer instead of waiting behind it
+# * foreign_keys is off by default in SQLite; with it on, the schema's ON
+#   DELETE rules hold for anything the explicit delete statements miss
+# * read_pool_size grows with cores in prod, since reads run in parallel
+_CORES = os.cpu_count() or 1
+STORAGE_PROFILES = {
+    "dev": {
+        "journal_mode": "WAL",
+        "pragmas": {
+            "synchronous": "NORMAL",
+            "busy_timeout": 5000,
+            "foreign_keys": "ON",
+        },
+        "read_pool_size": 4,
+        "read_max_overflow": 4,
+    },
+    "prod": {
+        "journal_mode": "WAL",
+        "pragmas": {
+            "synchronous": "NORMAL",
+            "busy_timeout": 10000,
+            "foreign_keys": "ON",
+            "cache_size": -65536,       # 64 MiB page cache per connection
+            "mmap_size": 268435456,     # 256 MiB memory-mapped I/O
+            "temp_store": "MEMORY",
+        },
+        "read_pool_size": _CORES,
+        "read_max_overflow": _CORES,
+    },
+}
+
+DB_PROFILE = os.getenv("DB_PROFILE", "dev")
+if DB_PROFILE not in STORAGE_PROFILES:
+    raise ValueError(f"Unknown DB_PROFILE [{DB_PROFILE}], expected one of "
+                     f"{sorted(STORAGE_PROFILES)}")
+profile = STORAGE_PROFILES[DB_PROFILE]
+
+# Apply the profile's PRAGMAs whenever an engine opens a connection
+def _install_pragmas(engine, read_only: bool = False):
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not read_only:
+            cursor.execute(f"PRAGMA journal_mode = {profile['journal_mode']}")
+        for name, value in profile["pragmas"].items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        if read_only:
+            cursor.execute("PRAGMA query_only = ON")
+        cursor.close()
+
+# Pool checkout metrics
+class PoolMetrics:
+    def __init__(self, engine):
+        self.engine = engine
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.connects = 0
+
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record,
+                     connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    def stats(self) -> Dict[str, Any]:
+        pool = self.engine.pool
+        return {
+            "pool_size": pool.size() if hasattr(pool, "size") else None,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") \
+                                        else None,
+            "checked_out": self.in_use,
+            "peak_checked_out": self.peak_in_use,
+            "checkouts": self.checkouts,
+            "connections_opened": self.connects,
+        }
+
+def _create_engine(**kwargs):
+    # SQLite needs a special argument for multi-threading support
+    return create_engine(
+        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False},
+        **kwargs
+    )
+
+# General read-write engine, for table creation and housekeeping
+engine = _create_engine()
+_install_pragmas(engine)
+
+# Read-only engine for GET routes
+read_engine = _create_engine(pool_size=profile["read_pool_size"],
+                             max_overflow=profile["read_max_overflow"])
+_install_pragmas(read_engine, read_only=True)
+
+# Engine behind the single writer connection
+# * pysqlite manages transactions itself and breaks SAVEPOINT, which the
+#   writer uses to isolate jobs sharing one commit; take over transaction
+#   control and begin with BEGIN IMMEDIATE so the write lock is taken upfront
+write_engine = _create_engine(pool_size=1, max_overflow=0)
+_install_pragmas(write_engine)
+
+@event.listens_for(write_engine, "connect")
+def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+
+@event.listens_for(write_engine, "begin")
+def _begin_immediate(conn):
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+pool_metrics = {
+    "general": PoolMetrics(engine),
+    "read": PoolMetrics(read_engine),
+    "write": PoolMetrics(write_engine),
+}
+
+def pool_stats() -> Dict[str, Any]:
+    return {name: metrics.stats() for name, metrics in pool_metrics.items()}
 
 # SessionLocal gives us a database session to use in routes and logic
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# ReadSessionLocal gives us a read-only session for GET routes
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False,
+                                bind=read_engine)
+
+# pysqlite runs each SELECT outside of a transaction, so consecutive reads in
+# one session can see different commits; an explicit BEGIN pins them all to
+# one WAL snapshot until the session is closed (or rolled back)
+def read_snapshot(db: Session):
+    db.connection().exec_driver_sql("BEGIN")
+
 # Base class that all models will inherit from
 Base = declarative_base()
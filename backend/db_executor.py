@@ -0,0 +1,104 @@
+################################################################################
+# db_executor.py
+# Purpose:  Runs synchronous SQLAlchemy work for async routes on a dedicated,
+#           bounded thread pool so the event loop (and with it Socket.IO and
+#           every other request) never waits on SQLite. Each job gets its own
+#           session, from the read-only pool by default, and results are
+#           converted to their response schema inside the worker thread, while
+#           the session is still open.
+################################################################################
+
+# Libraries
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from pydantic import TypeAdapter
+
+# Local files
+from .database import ReadSessionLocal
+from .exceptions import DatabaseBusy
+
+# Adapters are cached since building one is far more expensive than using it
+@functools.lru_cache(maxsize=None)
+def response_adapter(response_type) -> TypeAdapter:
+    return TypeAdapter(response_type)
+
+class DBExecutor:
+    # * At most `workers` jobs run at once and at most `max_pending` more wait
+    #   for a thread; beyond that, run() raises DatabaseBusy instead of letting
+    #   the backlog (and latency) grow without bound
+    def __init__(self, workers: int = 4, max_pending: int = 64,
+                 session_factory=ReadSessionLocal):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.session_factory = session_factory
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+        # Stats
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers,
+                                            thread_name_prefix="db")
+        return self._pool
+
+    # Run fn(db, *args) in a fresh session on the pool
+    # * If response_type is given (e.g. schemas.Task or list[schemas.User]),
+    #   the result is validated into it before the session closes
+    async def run(self, fn: Callable, *args,
+                  response_type: Any = None) -> Any:
+        if self.in_flight >= self.workers + self.max_pending:
+            self.rejected += 1
+            raise DatabaseBusy()
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._get_pool(),
+                functools.partial(self._call, fn, args, response_type)
+            )
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+
+    def _call(self, fn: Callable, args: tuple, response_type: Any) -> Any:
+        db = self.session_factory()
+        try:
+            result = fn(db, *args)
+            if response_type is not None:
+                result = response_adapter(response_type).validate_python(
+                    result, from_attributes=True
+                )
+            return result
+        finally:
+            db.close()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+# Shared executor
+# * DB_EXECUTOR_WORKERS and DB_EXECUTOR_QUEUE size the pool and its backlog
+db_executor = DBExecutor(
+    workers=int(os.getenv("DB_EXECUTOR_WORKERS", "4")),
+    max_pending=int(os.getenv("DB_EXECUTOR_QUEUE", "64"))
+)
+
+async def run_db(fn: Callable, *args, response_type: Any = None) -> Any:
+    return await db_executor.run(fn, *args, response_type=response_type)
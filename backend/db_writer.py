@@ -0,0 +1,178 @@
+################################################################################
+# db_writer.py
+# Purpose:  Serializes all mutations through a single writer. SQLite allows
+#           one writer at a time, so instead of many sessions fighting over the
+#           lock (and each paying for its own commit), a dedicated thread owns
+#           one connection, takes mutation jobs from a queue, and commits
+#           several of them together. Each job runs inside its own SAVEPOINT,
+#           so a failing job is rolled back on its own and reports its error to
+#           its caller while the rest of the group still commits.
+################################################################################
+
+# Libraries
+import asyncio
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy.orm import Session
+
+# Local files
+from .database import write_engine
+from .db_executor import response_adapter
+from .exceptions import DatabaseBusy
+from .crud import events
+
+class _WriteJob:
+    def __init__(self, fn: Callable, args: tuple, response_type: Any):
+        self.fn = fn
+        self.args = args
+        self.response_type = response_type
+        self.future = Future()
+
+class WriteQueue:
+    # * Jobs are fn(db, *args) callables, just like DBExecutor jobs; the CRUD
+    #   functions' own commits only release the job's SAVEPOINT, and the
+    #   writer commits the whole group afterwards
+    # * A group is whatever is queued when the writer becomes free, up to
+    #   max_batch jobs, so commits grow with load instead of adding latency
+    #   when idle
+    # * At most max_pending jobs may wait; beyond that, submit() raises
+    #   DatabaseBusy
+    def __init__(self, engine=write_engine, max_batch: int = 64,
+                 max_pending: int = 1024):
+        self.engine = engine
+        self.max_batch = max(1, max_batch)
+        self.max_pending = max_pending
+        self._queue: "queue.Queue[Optional[_WriteJob]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        # Stats
+        self.jobs = 0
+        self.failed = 0
+        self.commits = 0
+        self.max_group = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name="db-writer",
+                                                daemon=True)
+                self._thread.start()
+
+    # Finish every queued job, then stop the writer thread
+    def stop(self):
+        with self._lock:
+            if self._thread is None:
+                return
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    # Run fn(db, *args) on the writer and wait for its group to commit
+    # * If response_type is given, the result is validated into it inside the
+    #   job, while its session is still open
+    async def submit(self, fn: Callable, *args,
+                     response_type: Any = None) -> Any:
+        if self._queue.qsize() >= self.max_pending:
+            raise DatabaseBusy()
+        self.start()
+        job = _WriteJob(fn, args, response_type)
+        self._queue.put(job)
+        return await asyncio.wrap_future(job.future)
+
+    def _run(self):
+        conn = self.engine.connect()
+        try:
+            stopping = False
+            while not stopping:
+                job = self._queue.get()
+                if job is None:
+                    break
+                group = [job]
+                while len(group) < self.max_batch:
+                    try:
+                        job = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if job is None:
+                        stopping = True
+                        break
+                    group.append(job)
+                self._commit_group(conn, group)
+        finally:
+            conn.close()
+
+    def _commit_group(self, conn, group: List[_WriteJob]):
+        outcomes = []
+        try:
+            with conn.begin():
+                for job in group:
+                    outcomes.append(self._run_job(conn, job))
+        except Exception as e:
+            # The commit itself failed, so nothing in the group persisted
+            logging.exception("Write group commit failed")
+            self.failed += len(group)
+            for job in group:
+                job.future.set_exception(e)
+            return
+
+        self.commits += 1
+        self.jobs += len(group)
+        self.max_group = max(self.max_group, len(group))
+        # Commits made through the writer only released SAVEPOINTs, so tell
+        # outbox and project listeners now that the rows are actually visible,
+        # before any caller can go on to read them back
+        events.notify_commit_listeners()
+        events.notify_project_listeners(set().union(
+            *(touched for _, _, error, touched in outcomes if error is None)))
+        for job, result, error, _ in outcomes:
+            if error is not None:
+                self.failed += 1
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
+
+    def _run_job(self, conn, job: _WriteJob):
+        # * The session only lives for this job, so nothing it loaded can go
+        #   stale; keeping it past the commit spares re-reading what the
+        #   job just wrote (RETURNING already filled in server defaults)
+        db = Session(bind=conn, join_transaction_mode="create_savepoint",
+                     expire_on_commit=False, info={"write_group": True})
+        try:
+            result = job.fn(db, *job.args)
+            if job.response_type is not None:
+                result = response_adapter(job.response_type).validate_python(
+                    result, from_attributes=True
+                )
+            return job, result, None, events.take_touched_projects(db)
+        except Exception as e:
+            return job, None, e, set()
+        finally:
+            # Closing without committing rolls back the job's SAVEPOINT
+            db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "jobs": self.jobs,
+            "failed": self.failed,
+            "commits": self.commits,
+            "avg_group_size": round(self.jobs / self.commits, 2)
+                              if self.commits else 0,
+            "max_group_size": self.max_group,
+        }
+
+# Shared writer
+# * DB_WRITE_BATCH caps the jobs per commit, DB_WRITE_QUEUE the backlog
+write_queue = WriteQueue(
+    max_batch=int(os.getenv("DB_WRITE_BATCH", "64")),
+    max_pending=int(os.getenv("DB_WRITE_QUEUE", "1024"))
+)
+
+async def run_write(fn: Callable, *args, response_type: Any = None) -> Any:
+    return await write_queue.submit(fn, *args, response_type=response_type)
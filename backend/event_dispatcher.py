@@ -0,0 +1,278 @@
+################################################################################
+# event_dispatcher.py
+# Purpose:  Moves Socket.IO broadcasting off the HTTP request path. The
+#           EventDispatcher tails the transactional outbox written by the CRUD
+#           layer in seq order and queues each event, while background worker
+#           tasks drain the queues into the WebSocketManager. Delivery is
+#           at-least-once: the last broadcast seq is persisted, so events
+#           committed before a crash go out on the next start. Exposes queue
+#           depth and drain lag, and flushes everything still pending when the
+#           application shuts down. Also compacts the outbox: rows it has
+#           broadcast are dropped once they are older than the retention.
+#           With several workers, each one tails the outbox for its own
+#           clients, and a lock file elects the one that persists the cursor
+#           and compacts.
+################################################################################
+
+# Libraries
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Union
+
+# Local files
+from .database import SessionLocal
+from .crud import events
+
+class EventDispatcher:
+    # * Each worker owns one queue, and every event for a given room goes to
+    #   the same queue, so events for a room are delivered in order
+    # * Queues are bounded; when full, enqueue waits instead of dropping
+    # * The outbox is read when a commit wrote to it, or every poll_interval
+    #   seconds to pick up commits made by other processes
+    # * cursor_name keys the persisted position, so independent dispatchers
+    #   can tail the same outbox
+    # * Every compact_interval seconds, broadcast rows older than retention
+    #   seconds are dropped; they also serve delta sync until then
+    # * primary_lock is a lock file shared by the workers of a multi-worker
+    #   deployment; only its holder persists the cursor and compacts, the
+    #   others start at the head of the outbox and try to take it over every
+    #   poll. Without it this dispatcher is always the primary
+    def __init__(self, ws_manager, workers: int = 2,
+                 max_queue_size: int = 10000,
+                 session_factory=SessionLocal,
+                 poll_interval: float = 1.0,
+                 outbox_batch_size: int = 500,
+                 cursor_name: str = "default",
+                 retention: float = 24 * 3600,
+                 compact_interval: float = 600,
+                 primary_lock: Optional[str] = None):
+        self.ws_manager = ws_manager
+        self.num_workers = max(1, workers)
+        self.max_queue_size = max_queue_size
+        self.session_factory = session_factory
+        self.poll_interval = poll_interval
+        self.outbox_batch_size = outbox_batch_size
+        self.cursor_name = cursor_name
+        self.retention = retention
+        self.compact_interval = compact_interval
+        self.primary_lock = primary_lock
+        self._lock_file = None
+        self.primary = False
+        self._last_compaction = time.monotonic()
+        self._queues: List[asyncio.Queue] = []
+        self._workers: List[asyncio.Task] = []
+        self._tail: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+        self.running = False
+        self.last_seq = 0
+
+        # Stats
+        self.enqueued = 0
+        self.delivered = 0
+        self.failed = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.compacted = 0
+
+    async def start(self):
+        if self.running:
+            return
+        self._queues = [asyncio.Queue(maxsize=self.max_queue_size)
+                        for _ in range(self.num_workers)]
+        self._workers = [asyncio.create_task(self._worker(queue))
+                         for queue in self._queues]
+        self.ws_manager.dispatcher = self
+
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self.primary = self._take_primary()
+        # Clients of a secondary all connected after it started
+        self.last_seq = await asyncio.to_thread(
+            self._load_cursor if self.primary else self._load_head)
+        events.add_commit_listener(self.notify)
+        self._tail = asyncio.create_task(self._tail_outbox())
+        self.running = True
+
+    # Broadcast everything already committed to the outbox or queued, then
+    # stop the workers
+    async def stop(self):
+        if not self.running:
+            return
+        events.remove_commit_listener(self.notify)
+        self._stopping = True
+        self._wakeup.set()
+        await self._tail
+
+        # New events go straight to the manager from here on
+        self.ws_manager.dispatcher = None
+        self.running = False
+
+        for queue in self._queues:
+            await queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._release_primary()
+
+        # Anything still sitting in a batching window goes out now too
+        await self.ws_manager.flush()
+
+    async def enqueue(self, event_name: str, payload: Dict[str, Any],
+                      room: Optional[Union[str, List[str]]] = None):
+        key = tuple(room) if isinstance(room, list) else room
+        queue = self._queues[hash(key) % len(self._queues)]
+        await queue.put((time.monotonic(), event_name, payload, room))
+        self.enqueued += 1
+
+    # Wake the outbox tail; safe to call from any thread
+    def notify(self):
+        try:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            # Event loop already closed
+            pass
+
+    async def _tail_outbox(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                caught_up = await self._drain_outbox()
+            except Exception:
+                logging.exception("Failed to read the event outbox")
+                caught_up = True
+            if not caught_up:
+                continue
+            if self._stopping:
+                return
+            if not self.primary:
+                self.primary = self._take_primary()
+            if self.primary and time.monotonic() - self._last_compaction >= \
+                    self.compact_interval:
+                self._last_compaction = time.monotonic()
+                try:
+                    self.compacted += await asyncio.to_thread(self._compact)
+                except Exception:
+                    logging.exception("Failed to compact the event outbox")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    # Broadcast one page of outbox rows after last_seq
+    # * The cursor only moves once the page has been handed to Socket.IO, so
+    #   a crash replays it rather than losing it; with batching, that means
+    #   once the room buffers holding the page have been flushed
+    async def _drain_outbox(self) -> bool:
+        rows = await asyncio.to_thread(self._read_outbox)
+        if not rows:
+            return True
+        for seq, event_name, data in rows:
+            await self.ws_manager.emit_event(event_name, data, outbox_seq=seq)
+        for queue in self._queues:
+            await queue.join()
+        await self.ws_manager.flush()
+        self.last_seq = rows[-1][0]
+        if self.primary:
+            await asyncio.to_thread(self._save_cursor, self.last_seq)
+        return len(rows) < self.outbox_batch_size
+
+    def _read_outbox(self):
+        db = self.session_factory()
+        try:
+            rows = events.get_events_after(db, self.last_seq,
+                                           self.outbox_batch_size)
+            return [(row.seq, row.event_type, json.loads(row.payload))
+                    for row in rows]
+        finally:
+            db.close()
+
+    def _load_cursor(self) -> int:
+        db = self.session_factory()
+        try:
+            return events.get_cursor(db, self.cursor_name)
+        finally:
+            db.close()
+
+    def _load_head(self) -> int:
+        db = self.session_factory()
+        try:
+            return events.get_head_seq(db)
+        finally:
+            db.close()
+
+    def _save_cursor(self, seq: int):
+        db = self.session_factory()
+        try:
+            events.set_cursor(db, seq, self.cursor_name)
+        finally:
+            db.close()
+
+    # The lock is held for as long as the file stays open, and released by
+    # the OS if the process dies, so another worker can take over
+    def _take_primary(self) -> bool:
+        if self.primary_lock is None:
+            return True
+        import fcntl  # POSIX only, as is running several workers
+        if self._lock_file is None:
+            self._lock_file = open(self.primary_lock, "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def _release_primary(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+        self.primary = False
+
+    # Only rows this dispatcher has broadcast; created_at is UTC
+    def _compact(self) -> int:
+        older_than = datetime.now(timezone.utc).replace(tzinfo=None) - \
+                     timedelta(seconds=self.retention)
+        db = self.session_factory()
+        try:
+            return events.compact_events(db, self.last_seq, older_than)
+        finally:
+            db.close()
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            enqueued_at, event_name, payload, room = await queue.get()
+            try:
+                await self.ws_manager._deliver(event_name, payload, room)
+                self.delivered += 1
+            except Exception:
+                self.failed += 1
+                logging.exception(f"Failed to dispatch event {event_name}")
+            finally:
+                lag = time.monotonic() - enqueued_at
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+                queue.task_done()
+
+    def queue_depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "primary": self.primary,
+            "workers": self.num_workers,
+            "queue_depth": self.queue_depth(),
+            "outbox_seq": self.last_seq,
+            "compacted": self.compacted,
+            "enqueued": self.enqueued,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "last_drain_lag_ms": round(self.last_lag * 1000, 3),
+            "max_drain_lag_ms": round(self.max_lag * 1000, 3),
+        }
@@ -36,6 +36,14 @@ class MovingTaskToNewProject(Exception):
                         "project!"
         super().__init__(self.message)
 
+class TaskVersionConflict(Exception):
+    def __init__(self, task_id: int, version: int):
+        self.task_id = task_id
+        self.version = version
+        self.message = f"Task {task_id} was changed by someone else, it is " \
+                       f"now at version {version}."
+        super().__init__(self.message)
+
 class AssigneeNotMember(Exception):
     def __init__(self, assignee_name: str, project_name: int):
         self.assignee_name = assignee_name
@@ -69,8 +77,21 @@ class UserNotInProject(Exception):
         self.message = f"User [{user_name}] is NOT a member of project " \
                        f"[{project_name}]."
 
+class UnknownFields(Exception):
+    def __init__(self, kind: str, names):
+        self.kind = kind
+        self.names = sorted(names)
+        self.message = f"Unknown {kind} [{', '.join(self.names)}]."
+        super().__init__(self.message)
+
+class DatabaseBusy(Exception):
+    def __init__(self):
+        self.message = "Database is busy, please retry shortly."
+        super().__init__(self.message)
+
 
 __all__ = ["ProjectNotFound", "DuplicateProjectName", "TaskNotFound", \
            "MovingTaskToNewProject", "AssigneeNotMember", "DuplicateTaskName", \
+           "TaskVersionConflict", \
            "UserNotFound", "DuplicateUserEmail", "UserInProject", \
-           "UserNotInProject"]
+           "UserNotInProject", "UnknownFields", "DatabaseBusy"]
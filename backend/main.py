@@ -4,34 +4,76 @@
 #           middleware, database connections, and Socket.IO for real-time
 #           updates. Registers API routers for projects, tasks, and users.
 #           Defines global error handling middleware and WebSockey event
-#           handlers.
+#           handlers, including room subscriptions so clients only receive
+#           events for the projects they are viewing, resumed from a replay
+#           buffer after a reconnect. Starts the background event dispatcher
+#           with the app and flushes it on shutdown. When run with several
+#           workers, relays Socket.IO emits and commit notices between them.
 ################################################################################
 
 # Libraries
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+import asyncio
 import logging
+import os
 import socketio
 
 # Local files
 from . import models
-from .database import Base, engine, SessionLocal
+from .migrations import run_migrations
+from .database import Base, engine, SessionLocal, pool_stats
 from .routers import projects, tasks, users
+from .websocket_utils import WebSocketManager, LOBBY_ROOM, project_room
+from .event_dispatcher import EventDispatcher
+from .db_executor import db_executor
+from .db_writer import write_queue
+from .response_cache import response_cache
+from .single_flight import read_flights
+from .replay_buffer import ReplayBuffer
+from .socket_relay import RelayManager, UnixSocketTransport
+from .exceptions import DatabaseBusy
 
 # Set up basic logging for errors
 logging.basicConfig(level=logging.INFO,
                     format="%(asctime)s - %(levelname)s - %(message)s")
 
+# Workers of a multi-worker deployment (see server_startup.py) share a relay
+# directory; Socket.IO emits and commit notices are relayed between them
+# through it
+# * SOCKETIO_RELAY_DIR is set by server_startup.py --workers
+RELAY_DIR = os.getenv("SOCKETIO_RELAY_DIR")
+relay_manager = RelayManager(UnixSocketTransport(RELAY_DIR)) \
+                if RELAY_DIR else None
+
 # Create Socket.IO server
 sio = socketio.AsyncServer(
+    client_manager=relay_manager,
     async_mode='asgi',
     cors_allowed_origins="*",
     logger=True,
     engineio_logger=True
 )
 
-app = FastAPI()
+# Start the event dispatcher with the app and drain it on a clean shutdown
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if relay_manager is not None:
+        await relay_manager.start()
+    await app.state.event_dispatcher.start()
+    try:
+        yield
+    finally:
+        # Finish pending writes first so their events reach the outbox
+        await asyncio.to_thread(write_queue.stop)
+        await app.state.event_dispatcher.stop()
+        if relay_manager is not None:
+            await relay_manager.stop()
+        db_executor.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow frontend access
 app.add_middleware(
@@ -39,6 +81,9 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the browser read the pagination cursor of list endpoints and the
+    # ETags of project reads
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 # Create Socket.IO ASGI app
@@ -48,8 +93,29 @@ socket_app = socketio.ASGIApp(sio, app)
 def read_root():
     return {"message": "Hello from backend"}
 
-# Create database tables
+# Runtime statistics for monitoring
+@app.get("/stats")
+def read_stats(request: Request):
+    return {
+        "events": request.app.state.event_dispatcher.stats(),
+        "db_executor": db_executor.stats(),
+        "db_writer": write_queue.stats(),
+        "db_pools": pool_stats(),
+        "response_cache": response_cache.stats(),
+        "single_flight": read_flights.stats(),
+        "replay_buffer": replay_buffer.stats() if replay_buffer else None,
+        "relay": relay_manager.stats() if relay_manager else None
+    }
+
+# The DB executor's backlog is full: ask the client to back off
+@app.exception_handler(DatabaseBusy)
+async def database_busy_handler(request: Request, e: DatabaseBusy):
+    logging.warning(e.message)
+    return JSONResponse(status_code=503, content={"detail": e.message})
+
+# Create database tables, then upgrade existing ones in place
 models.Base.metadata.create_all(bind=engine)
+run_migrations(engine)
 
 def get_db():
     db = SessionLocal()
@@ -59,16 +125,76 @@ def get_db():
         db.close()
 
 # WebSocket event handlers
+# * A reconnecting client passes {"epoch", "rooms": {room: last_seq}} as its
+#   handshake auth; it is put back in those rooms and sent what it missed
 @sio.event
-async def connect(sid, environ):
+async def connect(sid, environ, auth=None):
     print(f"Client connected: {sid}")
     await sio.emit("connection_established", \
                    {"message": "Connected to server"}, room=sid)
+    if isinstance(auth, dict) and isinstance(auth.get("rooms"), dict):
+        for room, last_seq in auth["rooms"].items():
+            if _is_room(room):
+                await _join(sid, room, {"epoch": auth.get("epoch"),
+                                        "last_seq": last_seq})
 
 @sio.event
 async def disconnect(sid):
     print(f"Client disconnected: {sid}")
 
+# Room subscriptions
+# * Clients join a project's room while viewing its tasks or members, and the
+#   lobby room while viewing the dashboard
+# * Rooms are left automatically on disconnect, so clients re-subscribe after
+#   reconnecting
+# * Subscribing with "last_seq" (and the "epoch" it came from) resumes the
+#   room's stream after that event instead of starting it fresh
+def _get_project_id(data):
+    try:
+        return int(data["project_id"])
+    except (TypeError, KeyError, ValueError):
+        return None
+
+def _is_room(room) -> bool:
+    return room == LOBBY_ROOM or (
+        isinstance(room, str) and room.startswith("project_")
+        and room[len("project_"):].isdigit())
+
+# * The reply carries the room's current position ("epoch", "seq") for the
+#   client to resume from later
+async def _join(sid, room: str, data) -> dict:
+    ws_manager = app.state.ws_manager
+    await sio.enter_room(sid, room)
+    result = {"ok": True, "room": room, **ws_manager.stream_position(room)}
+    if isinstance(data, dict) and isinstance(data.get("last_seq"), int):
+        result["resumed"] = await ws_manager.resume(
+            sid, room, data.get("epoch"), data["last_seq"])
+    return result
+
+@sio.event
+async def subscribe_project(sid, data):
+    project_id = _get_project_id(data)
+    if project_id is None:
+        return {"ok": False, "error": "project_id is required"}
+    return await _join(sid, project_room(project_id), data)
+
+@sio.event
+async def unsubscribe_project(sid, data):
+    project_id = _get_project_id(data)
+    if project_id is None:
+        return {"ok": False, "error": "project_id is required"}
+    await sio.leave_room(sid, project_room(project_id))
+    return {"ok": True, "room": project_room(project_id)}
+
+@sio.event
+async def subscribe_lobby(sid, data=None):
+    return await _join(sid, LOBBY_ROOM, data)
+
+@sio.event
+async def unsubscribe_lobby(sid, data=None):
+    await sio.leave_room(sid, LOBBY_ROOM)
+    return {"ok": True, "room": LOBBY_ROOM}
+
 # Middleware that catches all unexpected exceptions (hopefully never needed!)
 @app.middleware("http")
 async def catch_exceptions_middleware(request: Request, call_next):
@@ -85,6 +211,36 @@ async def catch_exceptions_middleware(request: Request, call_next):
 # Make sio available to routers
 app.state.sio = sio
 
+# Replay buffer so reconnecting clients can resume their rooms' streams
+# * WS_REPLAY_EVENTS caps the events kept per room, 0 turns replay off
+# * WS_REPLAY_BUFFER_MB caps the memory of all of them together
+_replay_events = int(os.getenv("WS_REPLAY_EVENTS", "1000"))
+replay_buffer = ReplayBuffer(
+    room_events=_replay_events,
+    max_bytes=int(float(os.getenv("WS_REPLAY_BUFFER_MB", "16")) * 1024 * 1024)
+) if _replay_events > 0 else None
+
+# Shared WebSocketManager so events from concurrent requests can be batched
+# * WS_BATCH_WINDOW_MS sets the batching window; 0 disables batching
+app.state.ws_manager = WebSocketManager(
+    sio, batch_window=float(os.getenv("WS_BATCH_WINDOW_MS", "5")) / 1000,
+    replay=replay_buffer
+)
+
+# Background dispatcher so routes don't wait on broadcasts
+# * EVENT_DISPATCH_WORKERS and EVENT_QUEUE_SIZE size the worker pool and the
+#   per-worker queues
+# * OUTBOX_RETENTION_HOURS is how long broadcast events stay in the outbox
+#   for delta sync before compaction drops them
+app.state.event_dispatcher = EventDispatcher(
+    app.state.ws_manager,
+    workers=int(os.getenv("EVENT_DISPATCH_WORKERS", "2")),
+    max_queue_size=int(os.getenv("EVENT_QUEUE_SIZE", "10000")),
+    retention=float(os.getenv("OUTBOX_RETENTION_HOURS", "24")) * 3600,
+    primary_lock=os.path.join(RELAY_DIR, "dispatcher.lock") \
+                 if RELAY_DIR else None
+)
+
 # Include routers
 app.include_router(projects.router, prefix="/projects", tags=["projects"])
 app.include_router(tasks.router, prefix="/tasks", tags=["tasks"])
@@ -0,0 +1,75 @@
+################################################################################
+# migrations.py
+# Purpose:  Brings databases created by older versions of the app up to the
+#           current schema in place. create_all() only creates missing tables,
+#           so anything added to an existing table (indexes, columns) is done
+#           here. Every step is idempotent and they all run at startup, in
+#           order, inside one transaction.
+################################################################################
+
+# Libraries
+import logging
+from sqlalchemy import Connection, inspect
+
+# Local files
+from .models import Task, project_members
+
+def _has_index(conn: Connection, table: str, name: str) -> bool:
+    return any(index["name"] == name
+               for index in inspect(conn).get_indexes(table))
+
+# Tasks may hold duplicate titles from before uniqueness was enforced by the
+# database; keep the oldest and suffix the others with their id
+def _dedupe_task_titles(conn: Connection):
+    if _has_index(conn, "tasks", "uq_tasks_project_title"):
+        return
+    result = conn.exec_driver_sql(
+        "UPDATE tasks SET title = title || ' (' || id || ')' "
+        "WHERE id NOT IN (SELECT MIN(id) FROM tasks GROUP BY project_id, title)"
+    )
+    if result.rowcount:
+        logging.warning(f"Renamed {result.rowcount} duplicate task title(s)")
+
+def _has_column(conn: Connection, table: str, name: str) -> bool:
+    return any(column["name"] == name
+               for column in inspect(conn).get_columns(table))
+
+# SQLite cannot add a column with a non-constant default, so the column is
+# added bare and existing projects start out as modified now
+def _add_project_updated_at(conn: Connection):
+    if _has_column(conn, "projects", "updated_at"):
+        return
+    conn.exec_driver_sql("ALTER TABLE projects ADD COLUMN updated_at DATETIME")
+    conn.exec_driver_sql("UPDATE projects SET updated_at = CURRENT_TIMESTAMP")
+
+def _add_project_version(conn: Connection):
+    if _has_column(conn, "projects", "version"):
+        return
+    conn.exec_driver_sql(
+        "ALTER TABLE projects ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+
+def _add_task_version(conn: Connection):
+    if _has_column(conn, "tasks", "version"):
+        return
+    conn.exec_driver_sql(
+        "ALTER TABLE tasks ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+
+def _create_indexes(conn: Connection):
+    for index in list(Task.__table__.indexes) + \
+                 list(project_members.indexes):
+        index.create(bind=conn, checkfirst=True)
+
+MIGRATIONS = [
+    _dedupe_task_titles,
+    _add_project_updated_at,
+    _add_project_version,
+    _add_task_version,
+    _create_indexes,
+]
+
+def run_migrations(engine):
+    with engine.begin() as conn:
+        if not inspect(conn).has_table("tasks"):
+            return
+        for step in MIGRATIONS:
+            step(conn)
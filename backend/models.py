@@ -2,11 +2,13 @@
 # models.py
 # Purpose:  Defines SQLAlchemy models for the appliaction's database schema,
 #           including Project, Task, User, and Project-User association tables,
-#           as well as their relationships
+#           as well as their relationships. Also holds the outbox of real-time
+#           events written alongside each mutation.
 ################################################################################
 
 # Libraries
-from sqlalchemy import Column, Integer, String, Enum, ForeignKey, Table
+from sqlalchemy import Column, Integer, String, Enum, ForeignKey, Table, \
+                       Text, DateTime, Index, func
 from sqlalchemy.orm import relationship
 import enum
 
@@ -17,8 +19,12 @@ from .database import Base
 project_members = Table(
     "project_members",
     Base.metadata,
-    Column("project_id", ForeignKey("projects.id"), primary_key=True),
-    Column("user_id", ForeignKey("users.id"), primary_key=True)
+    Column("project_id", ForeignKey("projects.id", ondelete="CASCADE"),
+           primary_key=True),
+    Column("user_id", ForeignKey("users.id", ondelete="CASCADE"),
+           primary_key=True),
+    # The primary key covers lookups by project; this covers lookups by user
+    Index("ix_project_members_user_id", "user_id")
 )
 
 # Enum for task status
@@ -33,19 +39,37 @@ class Project(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True)
+    # Both bumped by every change to the project, its tasks or its members;
+    # version drives the ETags of project reads
+    updated_at = Column(DateTime, server_default=func.now())
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     # Link to tasks
+    # * passive_deletes: deletes never load the collections, the rows go with
+    #   set-based statements (or ON DELETE CASCADE) instead
     tasks = relationship("Task",
                          back_populates="project",
-                         cascade="all, delete")
+                         cascade="all, delete",
+                         passive_deletes=True)
 
     # Many-to-many relationship to users
     members = relationship("User", secondary=project_members,
-        back_populates="projects")
+        back_populates="projects", passive_deletes=True)
 
 # Task table
+# * Task titles are unique per project, enforced by the database
+# * (project_id, status) serves board columns and status filters, and
+#   assigned_to serves unassigning a user's tasks
+# * project_id alone (implicitly (project_id, rowid)) serves unfiltered
+#   keyset pages in id order without a sort
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        Index("uq_tasks_project_title", "project_id", "title", unique=True),
+        Index("ix_tasks_project_status", "project_id", "status"),
+        Index("ix_tasks_project_id", "project_id"),
+        Index("ix_tasks_assigned_to", "assigned_to"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
@@ -53,16 +77,25 @@ class Task(Base):
     status = Column(Enum(TaskStatus), default=TaskStatus.todo)
 
     # Foreign keys
-    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
+    project_id = Column(Integer,
+                        ForeignKey("projects.id",
+                        ondelete="CASCADE"),
+                        nullable=False)
     assigned_to = Column(Integer,
                          ForeignKey("users.id",
                          ondelete="SET NULL"),
                          nullable=True)
 
+    # Bumped by every update; the ORM checks it on flush, PATCH compares it
+    # with If-Match in its UPDATE
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
     # Relationships
     project = relationship("Project", back_populates="tasks")
     assigned_user = relationship("User")
 
+    __mapper_args__ = {"version_id_col": version}
+
 # User table
 class User(Base):
     __tablename__ = "users"
@@ -73,4 +106,27 @@ class User(Base):
 
     # Many-to-many relationship to projects
     projects = relationship("Project", secondary=project_members,
-            back_populates="members")
+            back_populates="members", passive_deletes=True)
+
+# Outbox of real-time events
+# * Rows are written in the same transaction as the change they describe and
+#   broadcast afterwards in seq order, so a committed change is never left
+#   without its event
+# * project_id is intentionally not a foreign key: events outlive the
+#   projects they describe (e.g. project_deleted)
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    seq = Column(Integer, primary_key=True)
+    event_type = Column(String, nullable=False)
+    project_id = Column(Integer, nullable=True, index=True)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+
+# Last outbox seq broadcast by a dispatcher
+class OutboxCursor(Base):
+    __tablename__ = "outbox_cursor"
+
+    name = Column(String, primary_key=True)
+    last_seq = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,122 @@
+################################################################################
+# replay_buffer.py
+# Purpose:  Lets Socket.IO clients resume a room's stream after a reconnect.
+#           Every event sent to a room is stamped with the room's next
+#           sequence number and kept in a bounded ring buffer for that room.
+#           A client that comes back with the last seq it saw gets the events
+#           it missed replayed, or is told to resync when they are no longer
+#           buffered. Buffers are capped per room and in total bytes.
+################################################################################
+
+# Libraries
+import json
+import uuid
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, NamedTuple, Optional
+
+class _Entry(NamedTuple):
+    ordinal: int
+    seq: int
+    payload: Dict[str, Any]
+    size: int
+
+class ReplayBuffer:
+    # * room_events caps the events kept per room, max_bytes the serialized
+    #   size of all of them; the oldest events go first
+    # * epoch identifies this buffer: sequence numbers restart with the
+    #   process, so a seq from another epoch cannot be resumed from
+    # * Runs on one event loop, so no locking is needed
+    def __init__(self, room_events: int = 1000,
+                 max_bytes: int = 16 * 1024 * 1024):
+        self.room_events = room_events
+        self.max_bytes = max_bytes
+        self.epoch = uuid.uuid4().hex[:12]
+        self._rooms: Dict[str, Deque[_Entry]] = {}
+        self._seqs: Dict[str, int] = defaultdict(int)
+        # (ordinal, room, seq) of events across rooms, oldest first, for the
+        # byte cap; events dropped by a room's own cap are skipped lazily
+        self._order: Deque[tuple] = deque()
+        self._ordinal = 0
+        self._events = 0
+        self.size = 0
+
+        # Stats
+        self.recorded = 0
+        self.evicted = 0
+        self.replayed = 0
+        self.resyncs = 0
+
+    # Stamp an event for a room and keep it; returns the stamped payload
+    def record(self, room: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        self._seqs[room] += 1
+        seq = self._seqs[room]
+        payload = {**payload, "room": room, "seq": seq, "epoch": self.epoch}
+        size = len(json.dumps(payload, default=str))
+
+        entries = self._rooms.get(room)
+        if entries is None:
+            entries = self._rooms[room] = deque()
+        if len(entries) >= self.room_events:
+            self._drop_oldest(room)
+        self._ordinal += 1
+        entries.append(_Entry(self._ordinal, seq, payload, size))
+        self._order.append((self._ordinal, room, seq))
+        self._events += 1
+        self.size += size
+        self.recorded += 1
+
+        while self.size > self.max_bytes and self._order:
+            _, old_room, old_seq = self._order.popleft()
+            old_entries = self._rooms.get(old_room)
+            # Skip events the room's own cap already dropped
+            if old_entries and old_entries[0].seq == old_seq:
+                self._drop_oldest(old_room)
+        # Rooms capped by count leave dropped events behind in the global
+        # order; rebuild it before they outnumber the kept ones
+        if len(self._order) > 2 * self._events + 64:
+            self._order = deque(sorted(
+                (entry.ordinal, name, entry.seq)
+                for name, kept in self._rooms.items() for entry in kept))
+        return payload
+
+    # Seq of the last event sent to a room; a client joining now has seen it
+    def head(self, room: str) -> int:
+        return self._seqs.get(room, 0)
+
+    # Events of a room after last_seq, or None when they cannot all be
+    # given: another epoch, a seq from the future, or already evicted
+    def since(self, room: str, epoch: str,
+              last_seq: int) -> Optional[List[Dict[str, Any]]]:
+        current = self.head(room)
+        entries = self._rooms.get(room, ())
+        if epoch != self.epoch or last_seq > current or (
+                last_seq < current and
+                (not entries or entries[0].seq > last_seq + 1)):
+            self.resyncs += 1
+            return None
+        missed = [entry.payload for entry in entries if entry.seq > last_seq]
+        self.replayed += len(missed)
+        return missed
+
+    def _drop_oldest(self, room: str):
+        entries = self._rooms[room]
+        entry = entries.popleft()
+        self.size -= entry.size
+        self._events -= 1
+        self.evicted += 1
+        if not entries:
+            del self._rooms[room]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "epoch": self.epoch,
+            "rooms": len(self._rooms),
+            "events": self._events,
+            "size_bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "room_events": self.room_events,
+            "recorded": self.recorded,
+            "evicted": self.evicted,
+            "replayed": self.replayed,
+            "resyncs": self.resyncs,
+        }
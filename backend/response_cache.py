@@ -0,0 +1,138 @@
+################################################################################
+# response_cache.py
+# Purpose:  In-process read-through cache of serialized project reads (project
+#           detail, members, tasks, board). Entries are JSON bodies keyed by
+#           project and request, kept in LRU order under a memory cap, and
+#           dropped for a project as soon as a commit that changed it is
+#           visible, i.e. at the same points the project's events are
+#           published. Per-project generation counters keep a read that raced
+#           with a mutation from caching what it read before the commit.
+################################################################################
+
+# Libraries
+import os
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Hashable, Iterable, NamedTuple, Optional
+
+# Local files
+from .crud import events
+
+class CachedResponse(NamedTuple):
+    etag: str
+    body: bytes
+    headers: Dict[str, str]
+
+class ResponseCache:
+    # * max_bytes caps the bodies held; least recently used entries are
+    #   evicted first and bodies larger than a quarter of it are not kept
+    # * max_bytes of 0 disables the cache
+    # * verify_hits makes readers check a hit against the project's version
+    #   before serving it, for when invalidations can be missed: workers of
+    #   a multi-worker deployment hear of each other's commits through relay
+    #   notices, which are not guaranteed to arrive
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024,
+                 verify_hits: bool = False):
+        self.max_bytes = max_bytes
+        self.verify_hits = verify_hits
+        # Reads run on the event loop, invalidations on the writer thread
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, CachedResponse]" = OrderedDict()
+        self._keys_by_project: Dict[int, set] = defaultdict(set)
+        self._generations: Dict[int, int] = defaultdict(int)
+        self.size = 0
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.rejected = 0
+        self.stale_hits = 0
+
+    def get(self, project_id: int, key: Hashable) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get((project_id, key))
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((project_id, key))
+            self.hits += 1
+            return entry
+
+    # Taken before reading the database; put() only accepts what was read
+    # under the project's current generation
+    def generation(self, project_id: int) -> int:
+        with self._lock:
+            return self._generations[project_id]
+
+    def put(self, project_id: int, key: Hashable, generation: int,
+            entry: CachedResponse):
+        if len(entry.body) > self.max_bytes // 4:
+            return
+        with self._lock:
+            if self._generations[project_id] != generation:
+                self.rejected += 1
+                return
+            self._remove((project_id, key))
+            self._entries[(project_id, key)] = entry
+            self._keys_by_project[project_id].add(key)
+            self.size += len(entry.body)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    # Project listener, called once commits that changed the projects are
+    # visible to readers
+    def invalidate(self, project_ids: Iterable[int]):
+        with self._lock:
+            for project_id in project_ids:
+                self._generations[project_id] += 1
+                for key in list(self._keys_by_project.pop(project_id, ())):
+                    self._remove((project_id, key))
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            for project_id in list(self._keys_by_project):
+                self._generations[project_id] += 1
+            self._entries.clear()
+            self._keys_by_project.clear()
+            self.size = 0
+
+    def _remove(self, full_key: tuple):
+        entry = self._entries.pop(full_key, None)
+        if entry is None:
+            return
+        self.size -= len(entry.body)
+        project_id, key = full_key
+        keys = self._keys_by_project.get(project_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_project[project_id]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "rejected_stale": self.rejected,
+            "stale_hits": self.stale_hits,
+        }
+
+# Shared cache, invalidated by every commit that changes a project
+# * RESPONSE_CACHE_MB caps its size, 0 turns it off
+# * Hits are verified when running as one of several workers, i.e. when
+#   SOCKETIO_RELAY_DIR is set (see socket_relay.py)
+response_cache = ResponseCache(
+    max_bytes=int(float(os.getenv("RESPONSE_CACHE_MB", "64")) * 1024 * 1024),
+    verify_hits=bool(os.getenv("SOCKETIO_RELAY_DIR"))
+)
+events.add_project_listener(response_cache.invalidate)
@@ -0,0 +1,140 @@
+################################################################################
+# routers/conditional.py
+# Purpose:  Conditional and cached GETs for project reads. Every mutation of
+#           a project, its tasks or its members bumps the project's version,
+#           and the ETag is derived from it, so a client that sends the ETag
+#           back in If-None-Match is answered with a 304 after a single primary
+#           key lookup, without loading or serializing any rows. Serialized
+#           responses are kept in the response cache, which answers repeated
+#           reads (and their 304s) without touching the database at all,
+#           and identical reads that miss it at the same time share a single
+#           flight: one version lookup and one load for all of them.
+#           Tasks carry their own version for conditional updates (If-Match).
+################################################################################
+
+# Libraries
+import functools
+import re
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from fastapi import Request, Response
+
+# Local files
+from ..crud import projects
+from ..db_executor import response_adapter, run_db
+from ..response_cache import CachedResponse, response_cache
+from ..single_flight import read_flights
+
+def project_etag(project_id: int, version: int) -> str:
+    return f'"project-{project_id}-v{version}"'
+
+def task_etag(task_id: int, version: int) -> str:
+    return f'"task-{task_id}-v{version}"'
+
+# Version an update must find, from If-Match
+# * None when there is no If-Match or it is "*": the update is unconditional
+# * 0 when no listed ETag is one of this task's; versions start at 1, so the
+#   update then fails as a conflict
+def task_if_match(if_match: Optional[str], task_id: int) -> Optional[int]:
+    if not if_match or if_match.strip() == "*":
+        return None
+    pattern = re.compile(rf'^"task-{task_id}-v(\d+)"$')
+    for tag in if_match.split(","):
+        found = pattern.match(tag.strip())
+        if found:
+            return int(found.group(1))
+    return 0
+
+# If-None-Match holds "*" or a list of (possibly weak) ETags
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/")
+            for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+# Concurrent lookups of a project's version within one cache generation
+# share a flight
+async def _project_version(project_id: int, generation: int) -> Optional[int]:
+    return await read_flights.do(
+        ("version", project_id, generation),
+        functools.partial(run_db, projects.get_project_version, project_id))
+
+# Returns (etag, response) where response is a 304 if the client is current
+# * The version is read before the rows, so the rows served with an ETag are
+#   never older than it; a mutation in between costs one extra full response
+# * (None, None) if the project does not exist; the read itself reports that
+async def check_project_etag(request: Request, project_id: int,
+                             generation: int) \
+        -> Tuple[Optional[str], Optional[Response]]:
+    version = await _project_version(project_id, generation)
+    if version is None:
+        return None, None
+    etag = project_etag(project_id, version)
+    if _matches(request.headers.get("if-none-match"), etag):
+        return etag, Response(status_code=304, headers={"ETag": etag})
+    return etag, None
+
+# * no-cache makes browsers revalidate with If-None-Match on every request
+def set_etag(response: Response, etag: Optional[str]):
+    if etag is not None:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "no-cache"
+
+def _json_response(entry: CachedResponse) -> Response:
+    response = Response(entry.body, media_type="application/json",
+                        headers=entry.headers)
+    set_etag(response, entry.etag)
+    return response
+
+# Serves a project read through the response cache
+# * load() returns the serialized body and any extra headers; it raises the
+#   read's own errors (such as ProjectNotFound), which are never cached
+# * Keyed by path and query, since the query picks the page and the view
+# * Misses for the same key, generation and version share one load; a
+#   request arriving after a mutation is visible never joins an older flight
+# * When the cache verifies hits, a hit costs the version lookup; one whose
+#   ETag is behind it means an invalidation was missed, and the project's
+#   entries are dropped
+async def serve_project_read(
+        request: Request, project_id: int,
+        load: Callable[[], Awaitable[Tuple[bytes, Dict[str, str]]]]
+) -> Response:
+    key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+    cached = response_cache.get(project_id, key)
+    if cached is not None and response_cache.verify_hits:
+        version = await _project_version(
+            project_id, response_cache.generation(project_id))
+        if version is None or \
+                project_etag(project_id, version) != cached.etag:
+            response_cache.stale_hits += 1
+            response_cache.invalidate([project_id])
+            cached = None
+    if cached is not None:
+        if _matches(request.headers.get("if-none-match"), cached.etag):
+            return Response(status_code=304, headers={"ETag": cached.etag})
+        return _json_response(cached)
+
+    generation = response_cache.generation(project_id)
+    etag, not_modified = await check_project_etag(request, project_id,
+                                                  generation)
+    if not_modified:
+        return not_modified
+
+    async def load_entry():
+        body, headers = await load()
+        entry = CachedResponse(etag, body, headers)
+        if etag is not None:
+            response_cache.put(project_id, key, generation, entry)
+        return entry
+
+    entry = await read_flights.do((project_id, key, generation, etag),
+                                  load_entry)
+    return _json_response(entry)
+
+# load() for serve_project_read that runs fn on the DB executor and
+# serializes its response_type
+def json_loader(fn: Callable, *args, response_type: Any):
+    async def load():
+        result = await run_db(fn, *args, response_type=response_type)
+        return response_adapter(response_type).dump_json(result), {}
+    return load
@@ -0,0 +1,23 @@
+################################################################################
+# routers/pagination.py
+# Purpose:  Shared response handling for keyset-paginated list routes. List
+#           bodies stay plain JSON arrays; the cursor for the next page is sent
+#           in the X-Next-Cursor header and left out on the last page.
+################################################################################
+
+# Libraries
+from typing import Dict
+from fastapi import Response
+
+# Local files
+from .. import schemas
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def next_cursor_headers(page: schemas.Page) -> Dict[str, str]:
+    if page.next_cursor is None:
+        return {}
+    return {NEXT_CURSOR_HEADER: str(page.next_cursor)}
+
+def set_next_cursor(response: Response, page: schemas.Page):
+    response.headers.update(next_cursor_headers(page))
@@ -3,83 +3,88 @@
 # Purpose:  Defines the API routes for project-related operations using FastAPI.
 #           Includes endpoints for creating, reading, updating, and deleting
 #           projects, managing project members, and retrieving associated tasks
-#           and users. Integrates with WebSocketManager to emit real-time events
-#           on changes and handles all relevant exceptions gracefully.
+#           and users. Real-time events for changes are recorded by the CRUD
+#           layer and broadcast by the event dispatcher. Handles all relevant
+#           exceptions gracefully. Reads run on the DB executor and mutations
+#           on the single writer, so the event loop is never blocked.
 ################################################################################
 
 # Libraries
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
+from typing import Optional
 import logging
 
 # Local files
 from ..exceptions import *
-from ..database import SessionLocal
-from ..crud import projects, users, tasks
+from ..crud import events, projects, users, tasks
 from .. import schemas
-from ..websocket_utils import WebSocketManager, convert_to_dict
+from ..db_executor import response_adapter, run_db
+from ..db_writer import run_write
+from ..crud.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from .pagination import next_cursor_headers, set_next_cursor
+from .conditional import json_loader, serve_project_read
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # Create Project
 # * Cannot have duplicate project names
 # * Has a list of users associated with each project (not required on creation)
 @router.post("/", response_model=schemas.Project)
-async def create_project(project: schemas.ProjectCreate,
-                   request: Request,
-                   db: Session = Depends(get_db)):
+async def create_project(project: schemas.ProjectCreate):
     try:
-        new_project = projects.create_project(db, project)
-        
-        # Emit WebSocket event
-        ws_manager = WebSocketManager(request.app.state.sio)
-        await ws_manager.emit_project_created(convert_to_dict(new_project))
-        
-        return new_project
+        return await run_write(projects.create_project, project,
+                            response_type=schemas.Project)
     except DuplicateProjectName as e:
         logging.warning(e.message)
         raise HTTPException(status_code=400, detail=e.message)
 
+# Get Project Summaries
+# * Per-status task counts, member count and last modification time
+# * Keyset paginated by id, the next page's cursor is in X-Next-Cursor
+# * Declared before /{project_id} so "summary" is not taken for an id
+@router.get("/summary", response_model=list[schemas.ProjectSummary])
+async def read_project_summaries(
+        response: Response,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[int] = Query(None, ge=0)):
+    page = await run_db(projects.get_project_summaries, cursor, limit,
+                        response_type=schemas.Page[schemas.ProjectSummary])
+    set_next_cursor(response, page)
+    return page.items
+
 # Get Project by ID
 # * Handle not found error
+# * Cached, and conditional on the project's ETag
 @router.get("/{project_id}", response_model=schemas.Project)
-def read_project(project_id: int, db: Session = Depends(get_db)):
+async def read_project(project_id: int, request: Request):
     try:
-        return projects.get_project(db, project_id)
+        return await serve_project_read(request, project_id, json_loader(
+            projects.get_project, project_id,
+            response_type=schemas.Project))
     except ProjectNotFound as e:
         logging.warning(e.message)
         raise HTTPException(status_code=404, detail=e.message)
 
+# Runs on the writer
+def _add_member(db: Session, project_id: int, user: schemas.UserCreate):
+    # Get the user's id from the name and email
+    # The following line is purely to raise ProjectNotFound before
+    # DuplicateUserEmail (makes more sense to me)
+    projects.get_project_info(db, project_id)
+    curr_user = users.get_or_create_user(db, user.name, user.email)
+    return projects.add_user_to_project(db, project_id, curr_user.id)
+
 # Add Member to Project
 # * Handle not found error
 # * Creates a new user if the user doesn't exist already
 # * Cannot have duplicate user email here either
 # * Friendly message if user is already in the project
 @router.post("/{project_id}/add-member", response_model=schemas.User)
-async def add_member(project_id: int, user: schemas.UserCreate, 
-                     request: Request,
-                     db: Session = Depends(get_db)):
-    # Get the user's id from the name and email
+async def add_member(project_id: int, user: schemas.UserCreate):
     try:
-        # The following line is purely to raise ProjectNotFound before
-        # DuplicateUserEmail (makes more sense to me)
-        project = projects.get_project(db, project_id)
-        curr_user = users.find_user_by_email(db, user.name, user.email)
-        added_user = projects.add_user_to_project(db, project_id, curr_user.id)
-        
-        # Emit WebSocket event
-        ws_manager = WebSocketManager(request.app.state.sio)
-        await ws_manager.emit_member_added(project_id,
-                                           convert_to_dict(added_user))
-        
-        return added_user
+        return await run_write(_add_member, project_id, user,
+                            response_type=schemas.User)
     except (UserNotFound, ProjectNotFound) as e:
         logging.warning(e.message)
         raise HTTPException(status_code=404, detail=e.message)
@@ -90,26 +95,21 @@ async def add_member(project_id: int, user: schemas.UserCreate,
         logging.info(e.message)
         raise HTTPException(status_code=400, detail=e.message)
 
+# Runs on the writer
+def _remove_member(db: Session, project_id: int, user: schemas.UserCreate):
+    projects.get_project_info(db, project_id)
+    curr_user = users.get_or_create_user(db, user.name, user.email)
+    return projects.remove_user_from_project(db, project_id, curr_user.id)
+
 # Remove Member from Project
 # * Handle not found error
 # * Raise error if user is not in the project
 # * If user is associated with any tasks, reassign the tasks to no one
 @router.post("/{project_id}/remove-member", response_model=schemas.User)
-async def remove_member(project_id: int, user: schemas.UserCreate, 
-                        request: Request,
-                        db: Session = Depends(get_db)):
+async def remove_member(project_id: int, user: schemas.UserCreate):
     try:
-        project = projects.get_project(db, project_id)
-        user = users.find_user_by_email(db, user.name, user.email)
-        removed_user = projects.remove_user_from_project(db, project_id,
-                                                         user.id)
-        
-        # Emit WebSocket event
-        ws_manager = WebSocketManager(request.app.state.sio)
-        await ws_manager.emit_member_removed(project_id,
-                                             convert_to_dict(removed_user))
-        
-        return removed_user
+        return await run_write(_remove_member, project_id, user,
+                            response_type=schemas.User)
     except (UserNotFound, ProjectNotFound) as e:
         logging.warning(e.message)
         raise HTTPException(status_code=404, detail=e.message)
@@ -117,45 +117,164 @@ async def remove_member(project_id: int, user: schemas.UserCreate,
         logging.info(e.message)
         raise HTTPException(status_code=400, detail=e.message)
 
+# Add Members to Project
+# * Adds existing users by id, with a single statement
+# * Users already in the project and unknown ids are reported, not errors
+@router.post("/{project_id}/add-members",
+             response_model=schemas.MemberBulkResult)
+async def add_members(project_id: int, request: schemas.MemberBulkRequest):
+    try:
+        return await run_write(projects.change_members, project_id,
+                               request.user_ids, True,
+                               response_type=schemas.MemberBulkResult)
+    except ProjectNotFound as e:
+        logging.warning(e.message)
+        raise HTTPException(status_code=404, detail=e.message)
+
+# Invite Members to Project
+# * Adds users by name and email like add-member, creating missing users, all
+#   with one upsert and one insert
+# * Existing members are reported as unchanged, and emails taken by a user
+#   with another name as conflicts
+@router.post("/{project_id}/invite-members",
+             response_model=schemas.MemberInviteResult)
+async def invite_members(project_id: int,
+                         request: schemas.MemberInviteRequest):
+    try:
+        return await run_write(projects.invite_members, project_id,
+                               request.users,
+                               response_type=schemas.MemberInviteResult)
+    except ProjectNotFound as e:
+        logging.warning(e.message)
+        raise HTTPException(status_code=404, detail=e.message)
+
+# Remove Members from Project
+# * Same as adding, and their tasks in the project are unassigned
+@router.post("/{project_id}/remove-members",
+             response_model=schemas.MemberBulkResult)
+async def remove_members(project_id: int, request: schemas.MemberBulkRequest):
+    try:
+        return await run_write(projects.change_members, project_id,
+                               request.user_ids, False,
+                               response_type=schemas.MemberBulkResult)
+    except ProjectNotFound as e:
+        logging.warning(e.message)
+        raise HTTPException(status_code=404, detail=e.message)
+
 # Get All Projects
+# * Keyset paginated by id, the next page's cursor is in X-Next-Cursor
 @router.get("/", response_model=list[schemas.Project])
-def read_all_projects(db: Session = Depends(get_db)):
-    return projects.get_all_projects(db)
+async def read_all_projects(
+        response: Response,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[int] = Query(None, ge=0)):
+    page = await run_db(projects.get_projects_page, cursor, limit,
+                        response_type=schemas.Page[schemas.Project])
+    set_next_cursor(response, page)
+    return page.items
 
 # Delete Project
 # * Handle not found error
 @router.delete("/{project_id}")
-async def delete_project(project_id: int, 
-                         request: Request,
-                         db: Session = Depends(get_db)):
+async def delete_project(project_id: int):
     try:
-        project = projects.delete_project(db, project_id)
-        
-        # Emit WebSocket event
-        ws_manager = WebSocketManager(request.app.state.sio)
-        await ws_manager.emit_project_deleted(project_id, project.name)
-        
+        project = await run_write(projects.delete_project, project_id)
         return {"message": f"Project [{project.name}] deleted"}
     except ProjectNotFound as e:
         logging.warning(e.message)
         raise HTTPException(status_code=404, detail=e.message)
 
+# Parses comma separated names, rejecting any outside of allowed
+def _parse_names(value: Optional[str], allowed: frozenset, kind: str):
+    if value is None:
+        return None
+    names = frozenset(name.strip() for name in value.split(",")
+                      if name.strip())
+    if names - allowed:
+        raise UnknownFields(kind, names - allowed)
+    return names
+
 # Get All Tasks for Project
 # * Handle not found error
-@router.get("/{project_id}/tasks", response_model=list[schemas.Task])
-def read_tasks_by_project(project_id: int, db: Session = Depends(get_db)):
+# * Optional status and assignee filters
+# * Compact tasks (ids and scalar fields) by default; fields= narrows the
+#   scalar fields and expand= adds project and/or assigned_user back
+# * Keyset paginated by id, the next page's cursor is in X-Next-Cursor
+# * Cached, and conditional on the project's ETag
+@router.get("/{project_id}/tasks", response_model=list[schemas.TaskCompact])
+async def read_tasks_by_project(
+        project_id: int,
+        request: Request,
+        status: Optional[schemas.TaskStatus] = None,
+        assigned_to: Optional[int] = None,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[int] = Query(None, ge=0),
+        fields: Optional[str] = None,
+        expand: Optional[str] = None):
+    try:
+        fields = _parse_names(fields, schemas.TASK_FIELDS, "task fields")
+        expand = _parse_names(expand, schemas.TASK_EXPANSIONS,
+                              "task expansions") or frozenset()
+        view = schemas.task_view(fields if fields is not None
+                                 else schemas.TASK_FIELDS, expand)
+
+        # The view model decides the shape, so the page is serialized here
+        # rather than through response_model
+        async def load():
+            page = await run_db(tasks.get_tasks_page, project_id, status,
+                                assigned_to, cursor, limit, expand,
+                                response_type=schemas.Page[view])
+            return response_adapter(list[view]).dump_json(page.items), \
+                   next_cursor_headers(page)
+
+        return await serve_project_read(request, project_id, load)
+    except UnknownFields as e:
+        logging.warning(e.message)
+        raise HTTPException(status_code=400, detail=e.message)
+    except ProjectNotFound as e:
+        logging.warning(e.message)
+        raise HTTPException(status_code=404, detail=e.message)
+
+# Get Task Board
+# * Handle not found error
+# * Project, members and every task (compact) in one request, replacing the
+#   project, tasks and users calls the task page used to make
+# * Cached, and conditional on the project's ETag, so an unchanged board
+#   costs at most one lookup
+@router.get("/{project_id}/board", response_model=schemas.Board)
+async def read_board(project_id: int, request: Request):
+    try:
+        return await serve_project_read(request, project_id, json_loader(
+            projects.get_board, project_id, response_type=schemas.Board))
+    except ProjectNotFound as e:
+        logging.warning(e.message)
+        raise HTTPException(status_code=404, detail=e.message)
+
+# Get Project Changes
+# * What changed in the project since a change log seq (from the board or
+#   the previous call), for catching up after a reconnect without reloading
+# * resync is set when that is not possible, e.g. the log was compacted past
+#   since; the client reloads the board then
+# * Handle not found error; a project deleted since is reported instead
+@router.get("/{project_id}/changes", response_model=schemas.ProjectChanges)
+async def read_project_changes(project_id: int,
+                               since: int = Query(..., ge=0)):
     try:
-        return tasks.get_tasks_by_project(db, project_id)
+        return await run_db(events.get_project_changes, project_id, since,
+                            response_type=schemas.ProjectChanges)
     except ProjectNotFound as e:
         logging.warning(e.message)
         raise HTTPException(status_code=404, detail=e.message)
 
 # Get All Users for Project
 # * Handle not found error
+# * Cached, and conditional on the project's ETag
 @router.get("/{project_id}/users", response_model=list[schemas.User])
-def read_users_by_project(project_id: int, db: Session = Depends(get_db)):
+async def read_users_by_project(project_id: int, request: Request):
     try:
-        return users.get_users_by_project(db, project_id)
+        return await serve_project_read(request, project_id, json_loader(
+            users.get_users_by_project, project_id,
+            response_type=list[schemas.User]))
     except ProjectNotFound as e:
         logging.warning(e.message)
         raise HTTPException(status_code=404, detail=e.message)
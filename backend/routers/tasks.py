@@ -2,32 +2,29 @@
 # routers/tasks.py
 # Purpose:  Defines the API routes for task-related operations using FastAPI.
 #           Includes endpoints to create, read, update, and delete tasks within
-#           projects. Handles project and user validation, duplicate prevention,
-#           and assignment rules. Integrates with WebSocketManager to emit real-
-#           time task events, and raises meaningful HTTP exceptions for errors.
+#           projects, one at a time or in bulk. Handles project and user
+#           validation, duplicate prevention, and assignment rules. Real-time
+#           task events are recorded by the CRUD layer and broadcast by the
+#           event dispatcher. Raises meaningful HTTP exceptions for errors.
+#           Reads run on the DB executor and mutations on the single writer,
+#           so the event loop is never blocked.
 ################################################################################
 
 # Libraries
-from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Header, HTTPException, Response
+from typing import Optional
 import logging
 
 # Local files
 from ..exceptions import *
-from ..database import SessionLocal
 from ..crud import tasks
 from .. import schemas
-from ..websocket_utils import WebSocketManager, convert_to_dict
+from ..db_executor import run_db
+from ..db_writer import run_write
+from .conditional import task_etag, task_if_match
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # Create Task
 # * Each task created should be fixed to the project the user is currently
 #   viewing
@@ -35,16 +32,10 @@ def get_db():
 # * Cannot have duplicate task names in the same project
 # * Cannot assign task to non-members
 @router.post("/", response_model=schemas.Task)
-async def create_task(task: schemas.TaskCreate,
-                      request: Request, db: Session = Depends(get_db)):
+async def create_task(task: schemas.TaskCreate):
     try:
-        new_task = tasks.create_task(db, task)
-        
-        # Emit WebSocket event
-        ws_manager = WebSocketManager(request.app.state.sio)
-        await ws_manager.emit_task_created(convert_to_dict(new_task))
-        
-        return new_task
+        return await run_write(tasks.create_task, task,
+                            response_type=schemas.Task)
     except ProjectNotFound as e:
         logging.warning(e.message)
         raise HTTPException(status_code=404, detail=e.message)
@@ -52,15 +43,40 @@ async def create_task(task: schemas.TaskCreate,
         logging.warning(e.message)
         raise HTTPException(status_code=400, detail=e.message)
 
+# Status each failed bulk operation would have answered on its own route
+_BULK_STATUS_CODES = {
+    "TaskNotFound": 404, "ProjectNotFound": 404, "UserNotFound": 404,
+    "MovingTaskToNewProject": 400, "AssigneeNotMember": 400,
+    "DuplicateTaskName": 400,
+}
+
+# Bulk Create, Update and Delete Tasks
+# * Same rules as the single task routes, checked for all operations at once
+# * Operations that fail are reported per item and skipped; the rest are
+#   committed together and announced with one event per project
+@router.post("/bulk", response_model=schemas.TaskBulkResult)
+async def bulk_tasks(request: schemas.TaskBulkRequest):
+    result = await run_write(tasks.bulk_tasks, request.operations,
+                             response_type=schemas.TaskBulkResult)
+    for item in result.results:
+        if not item.ok:
+            logging.warning(item.error)
+            item.status_code = _BULK_STATUS_CODES.get(item.error_type, 400)
+    return result
+
 # Get Task by ID
 # * Handle not found error
+# * The ETag can be sent back in If-Match to update only this version
 @router.get("/{task_id}", response_model=schemas.Task)
-def read_task(task_id: int, db: Session = Depends(get_db)):
+async def read_task(task_id: int, response: Response):
     try:
-        return tasks.get_task(db, task_id)
+        task = await run_db(tasks.get_task, task_id,
+                            response_type=schemas.Task)
     except TaskNotFound as e:
         logging.warning(e.message)
         raise HTTPException(status_code=404, detail=e.message)
+    response.headers["ETag"] = task_etag(task.id, task.version)
+    return task
 
 # Update Task
 # * Each task is fixed to a project and cannot be changed
@@ -68,16 +84,10 @@ def read_task(task_id: int, db: Session = Depends(get_db)):
 # * Can only assign to a current member in the project
 # * Again, cannot update a task to have duplicate task name
 @router.put("/{task_id}", response_model=schemas.Task)
-async def update_task(task_id: int, updated: schemas.TaskCreate,
-                      request: Request, db: Session = Depends(get_db)):
+async def update_task(task_id: int, updated: schemas.TaskCreate):
     try:
-        updated_task = tasks.update_task(db, task_id, updated)
-        
-        # Emit WebSocket event
-        ws_manager = WebSocketManager(request.app.state.sio)
-        await ws_manager.emit_task_updated(convert_to_dict(updated_task))
-        
-        return updated_task
+        return await run_write(tasks.update_task, task_id, updated,
+                            response_type=schemas.Task)
     except (TaskNotFound, ProjectNotFound, UserNotFound) as e:
         logging.warning(e.message)
         raise HTTPException(status_code=404, detail=e.message)
@@ -85,18 +95,38 @@ async def update_task(task_id: int, updated: schemas.TaskCreate,
         logging.warning(e.message)
         raise HTTPException(status_code=400, detail=e.message)
 
+# Partially Update Task
+# * Only the fields sent are changed and validated, e.g. a status change
+#   from dragging a card
+# * With If-Match, the update only applies to that version of the task and
+#   otherwise fails with 412
+@router.patch("/{task_id}", response_model=schemas.TaskCompact)
+async def patch_task(task_id: int, changes: schemas.TaskPatch,
+                     response: Response,
+                     if_match: Optional[str] = Header(None)):
+    try:
+        task = await run_write(tasks.patch_task, task_id, changes.changes(),
+                               task_if_match(if_match, task_id),
+                               response_type=schemas.TaskCompact)
+    except (TaskNotFound, UserNotFound) as e:
+        logging.warning(e.message)
+        raise HTTPException(status_code=404, detail=e.message)
+    except TaskVersionConflict as e:
+        logging.warning(e.message)
+        raise HTTPException(status_code=412, detail=e.message,
+                            headers={"ETag": task_etag(task_id, e.version)})
+    except (AssigneeNotMember, DuplicateTaskName) as e:
+        logging.warning(e.message)
+        raise HTTPException(status_code=400, detail=e.message)
+    response.headers["ETag"] = task_etag(task.id, task.version)
+    return task
+
 # Delete Task
 # * Handle not found error
 @router.delete("/{task_id}")
-async def delete_task(task_id: int, request: Request,
-                      db: Session = Depends(get_db)):
+async def delete_task(task_id: int):
     try:
-        task = tasks.delete_task(db, task_id)
-        
-        # Emit WebSocket event
-        ws_manager = WebSocketManager(request.app.state.sio)
-        await ws_manager.emit_task_deleted(task_id, task.title)
-        
+        task = await run_write(tasks.delete_task, task_id)
         return {"message": f"Task [{task.title}] deleted"}
     except TaskNotFound as e:
         logging.warning(e.message)
@@ -2,46 +2,37 @@
 # routers/users.py
 # Purpose:  Defines the API routes for user-related operations using FastAPI.
 #           Supports creating, retrieving, and deleting users, with validations
-#           for unique emails and user existence. Integrates with 
-#           WebSocketManager to emit real-time events on user creation and
-#           deletion. Users can exist independently of projects or tasks.
+#           for unique emails and user existence. Real-time events on user
+#           creation and deletion are recorded by the CRUD layer and broadcast
+#           by the event dispatcher. Users can exist independently of projects
+#           or tasks. Reads run on the DB executor and mutations on the single
+#           writer, so the event loop is never blocked.
 ################################################################################
 
 # Libraries
-from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Query, Response
+from typing import Optional
 import logging
 
 # Local files
 from ..exceptions import *
-from ..database import SessionLocal
 from ..crud import users
 from .. import schemas
-from ..websocket_utils import WebSocketManager, convert_to_dict
+from ..db_executor import run_db
+from ..db_writer import run_write
+from ..crud.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from .pagination import set_next_cursor
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # Create User
 # * Users can exist without being bound to a task or project
 # * Cannot have duplicate user emails (allows duplicate names)
 @router.post("/", response_model=schemas.User)
-async def create_user(user: schemas.UserCreate,
-                      request: Request, db: Session = Depends(get_db)):
+async def create_user(user: schemas.UserCreate):
     try:
-        new_user = users.create_user(db, user)
-        
-        # Emit WebSocket event
-        ws_manager = WebSocketManager(request.app.state.sio)
-        await ws_manager.emit_user_created(convert_to_dict(new_user))
-        
-        return new_user
+        return await run_write(users.create_user, user,
+                            response_type=schemas.User)
     except DuplicateUserEmail as e:
         logging.warning(e.message)
         raise HTTPException(status_code=400, detail=e.message)
@@ -49,30 +40,32 @@ async def create_user(user: schemas.UserCreate,
 # Get User by ID
 # * Handle not found error
 @router.get("/{user_id}", response_model=schemas.User)
-def read_user(user_id: int, db: Session = Depends(get_db)):
+async def read_user(user_id: int):
     try:
-        return users.get_user(db, user_id)
+        return await run_db(users.get_user, user_id,
+                            response_type=schemas.User)
     except UserNotFound as e:
         logging.warning(e.message)
         raise HTTPException(status_code=404, detail=e.message)
 
 # Get All Users
+# * Keyset paginated by id, the next page's cursor is in X-Next-Cursor
 @router.get("/", response_model=list[schemas.User])
-def read_all_users(db: Session = Depends(get_db)):
-    return users.get_all_users(db)
+async def read_all_users(
+        response: Response,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[int] = Query(None, ge=0)):
+    page = await run_db(users.get_users_page, cursor, limit,
+                        response_type=schemas.Page[schemas.User])
+    set_next_cursor(response, page)
+    return page.items
 
 # Delete User
 # * Handle not found error
 @router.delete("/{user_id}")
-async def delete_user(user_id: int, request: Request,
-                      db: Session = Depends(get_db)):
+async def delete_user(user_id: int):
     try:
-        user = users.delete_user(db, user_id)
-        
-        # Emit WebSocket event
-        ws_manager = WebSocketManager(request.app.state.sio)
-        await ws_manager.emit_user_deleted(user_id, user.name)
-        
+        user = await run_write(users.delete_user, user_id)
         return {"message": f"User [{user.name}] deleted"}
     except UserNotFound as e:
         logging.warning(e.message)
@@ -7,10 +7,15 @@
 ################################################################################
 
 # Libraries
-from pydantic import BaseModel, EmailStr, field_validator
-from typing import Optional, List
+import functools
+from datetime import datetime
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, create_model, \
+                     field_validator, model_validator
+from typing import Dict, FrozenSet, Generic, Optional, List, TypeVar
 from enum import Enum
 
+T = TypeVar("T")
+
 # Fixed task status
 class TaskStatus(str, Enum):
     todo = "todo"
@@ -52,6 +57,45 @@ class Project(ProjectBase):
         "from_attributes": True
     }
 
+# Adding or removing many members at once
+class MemberBulkRequest(BaseModel):
+    user_ids: List[int] = Field(min_length=1, max_length=1000)
+
+# * changed: users added (or removed); unchanged: ids that already were (or
+#   were not) members; not_found: ids of no user
+class MemberBulkResult(BaseModel):
+    changed: List[User]
+    unchanged: List[int]
+    not_found: List[int]
+
+class MemberInviteRequest(BaseModel):
+    users: List[UserCreate] = Field(min_length=1, max_length=1000)
+
+# * conflicts: emails already taken by a user with another name, or given
+#   again with another name in the same request
+class MemberInviteResult(BaseModel):
+    changed: List[User]
+    unchanged: List[int]
+    conflicts: List[str]
+
+# Dashboard view of a project: counts instead of nested rows
+class ProjectSummary(ProjectBase):
+    id: int
+    member_count: int
+    task_count: int
+    task_counts: Dict[TaskStatus, int]
+    updated_at: Optional[datetime] = None
+
+# Project without its members, for views that list members separately
+class ProjectInfo(ProjectBase):
+    id: int
+    version: int
+    updated_at: Optional[datetime] = None
+
+    model_config = {
+        "from_attributes": True
+    }
+
 # Task Schemas
 class TaskBase(BaseModel):
     title: str
@@ -65,6 +109,7 @@ class TaskCreate(TaskBase):
 
 class Task(TaskBase):
     id: int
+    version: int = 1
     project: Project = None
     assigned_user: Optional[User] = None
 
@@ -72,3 +117,146 @@ class Task(TaskBase):
         "from_attributes": True
     }
 
+# Ids and scalar fields only, the default for task lists
+class TaskCompact(TaskBase):
+    id: int
+    version: int = 1
+
+    model_config = {
+        "from_attributes": True
+    }
+
+# Partial update: only the fields sent are changed
+# * A task cannot move to another project, so project_id is not accepted
+class TaskPatch(BaseModel):
+    title: Optional[str] = None
+    description: Optional[str] = None
+    status: Optional[TaskStatus] = None
+    assigned_to: Optional[int] = None
+
+    model_config = ConfigDict(extra="forbid")
+
+    @model_validator(mode="after")
+    def check_changes(self):
+        if not self.model_fields_set:
+            raise ValueError("nothing to update")
+        for name in ("title", "status"):
+            if name in self.model_fields_set and getattr(self, name) is None:
+                raise ValueError(f"{name} cannot be null")
+        return self
+
+    # Fields sent, including explicit nulls such as unassigning
+    def changes(self) -> Dict[str, object]:
+        return {name: getattr(self, name) for name in self.model_fields_set}
+
+# Bulk task operations
+class BulkOp(str, Enum):
+    create = "create"
+    update = "update"
+    delete = "delete"
+
+# * create takes the TaskCreate fields; update takes the id and only the
+#   fields to change; delete only takes the id
+class TaskBulkOperation(BaseModel):
+    op: BulkOp
+    id: Optional[int] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    status: Optional[TaskStatus] = None
+    project_id: Optional[int] = None
+    assigned_to: Optional[int] = None
+
+    @model_validator(mode="after")
+    def check_op_fields(self):
+        if self.op == BulkOp.create:
+            if self.id is not None:
+                raise ValueError("create does not take an id")
+            if self.title is None or self.project_id is None:
+                raise ValueError("create needs a title and a project_id")
+        elif self.id is None:
+            raise ValueError(f"{self.op.value} needs an id")
+        return self
+
+    # Fields an update sets, including explicit nulls such as unassigning
+    def changes(self) -> Dict[str, object]:
+        return {name: getattr(self, name) for name in self.model_fields_set
+                if name not in ("op", "id")}
+
+class TaskBulkRequest(BaseModel):
+    operations: List[TaskBulkOperation] = Field(min_length=1,
+                                                max_length=1000)
+
+# * status_code is what the operation would have answered on its own route
+class TaskBulkItemResult(BaseModel):
+    index: int
+    op: BulkOp
+    ok: bool
+    id: Optional[int] = None
+    task: Optional[TaskCompact] = None
+    error: Optional[str] = None
+    error_type: Optional[str] = None
+    status_code: int = 200
+
+class TaskBulkResult(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[TaskBulkItemResult]
+
+# Everything the task board shows, read in one transaction
+# * seq is the change log position the board was read at, the since of the
+#   first request for its changes
+class Board(BaseModel):
+    project: ProjectInfo
+    members: List[User]
+    tasks: List[TaskCompact]
+    seq: int = 0
+
+# What changed in a project since a change log seq
+# * tasks and members are the latest state of those created or changed,
+#   deleted_tasks and removed_members the ids of those gone
+# * resync means the changes cannot be given, reload the board instead
+class ProjectChanges(BaseModel):
+    since: int
+    last_seq: int
+    resync: bool = False
+    tasks: List[TaskCompact] = []
+    deleted_tasks: List[int] = []
+    members: List[User] = []
+    removed_members: List[int] = []
+    project_deleted: bool = False
+
+# Sparse fieldsets for task lists
+# * fields picks scalar fields of TaskCompact (id is always included) and
+#   expand adds nested objects from Task
+# * One model per view, built on first use and cached, so validating a list
+#   only touches the requested fields
+TASK_FIELDS = frozenset(TaskCompact.model_fields) - {"id"}
+TASK_EXPANSIONS = frozenset({"project", "assigned_user"})
+
+@functools.lru_cache(maxsize=None)
+def task_view(fields: FrozenSet[str] = TASK_FIELDS,
+              expand: FrozenSet[str] = frozenset()) -> type[BaseModel]:
+    if fields == TASK_FIELDS and not expand:
+        return TaskCompact
+    definitions = {
+        name: (field.annotation, field)
+        for name, field in TaskCompact.model_fields.items()
+        if name == "id" or name in fields
+    }
+    for name in expand:
+        field = Task.model_fields[name]
+        definitions[name] = (field.annotation, field)
+    view_name = "TaskView_" + "_".join(sorted(fields | expand))
+    return create_model(view_name,
+                        __config__=ConfigDict(from_attributes=True),
+                        **definitions)
+
+# Pagination
+# * One page of a keyset-paginated list; next_cursor is None on the last page
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[int] = None
+
+    model_config = {
+        "from_attributes": True
+    }
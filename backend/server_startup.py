@@ -1,13 +1,46 @@
 ################################################################################
 # server_startup.py
-# Purpose:  Simply starts up the backend with WebSocket
+# Purpose:  Simply starts up the backend with WebSocket, in one process or in
+#           several worker processes (--workers) that relay Socket.IO events
+#           and commit notices to each other through a shared directory
 ################################################################################
 
 # Libraries
+import argparse
+import os
+import tempfile
 import uvicorn
 
-# Local files
-from .main import socket_app
+def main():
+    parser = argparse.ArgumentParser(description="Run the Task-Board backend")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int,
+                        default=int(os.getenv("WEB_WORKERS", "1")),
+                        help="Worker processes (default: WEB_WORKERS or 1)")
+    args = parser.parse_args()
+
+    if args.workers <= 1:
+        from .main import socket_app
+        uvicorn.run(socket_app, host=args.host, port=args.port)
+        return
+
+    if os.name != "posix":
+        parser.error("--workers needs Unix domain sockets")
+
+    # Set up the schema once, before the workers all race to create it
+    from .database import engine
+    from .migrations import run_migrations
+    from .models import Base
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+    # Workers import the app themselves and find each other through the
+    # relay directory they inherit
+    os.environ.setdefault("SOCKETIO_RELAY_DIR",
+                          tempfile.mkdtemp(prefix="taskboard-relay-"))
+    uvicorn.run("backend.main:socket_app", host=args.host, port=args.port,
+                workers=args.workers)
 
 if __name__ == "__main__":
-    uvicorn.run(socket_app, host="0.0.0.0", port=8000)
+    main()
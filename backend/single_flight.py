@@ -0,0 +1,55 @@
+################################################################################
+# single_flight.py
+# Purpose:  Coalesces identical concurrent work. The first caller for a key
+#           runs it; everyone who asks for the same key while it is still
+#           running waits for that result (or error) instead of repeating it.
+#           Used by the read routes so a burst of identical GETs, such as every
+#           viewer refetching a board after a broadcast, costs one read.
+################################################################################
+
+# Libraries
+import asyncio
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+class SingleFlight:
+    # * Keys only live while their work runs; nothing is cached afterwards
+    # * Runs on one event loop, so no locking is needed
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+
+        # Stats
+        self.leaders = 0
+        self.shared = 0
+
+    # * The work runs in a task of its own, which every caller (the first
+    #   one included) awaits through a shield, so a caller that goes away,
+    #   e.g. on a client disconnect, never cancels it for the others
+    async def do(self, key: Hashable,
+                 fn: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.shared += 1
+        else:
+            self.leaders += 1
+            flight = asyncio.ensure_future(fn())
+            self._flights[key] = flight
+            flight.add_done_callback(partial(self._land, key))
+        return await asyncio.shield(flight)
+
+    def _land(self, key: Hashable, flight: asyncio.Future):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Errors are raised to the callers; don't warn if all of them left
+        if not flight.cancelled():
+            flight.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "shared": self.shared,
+        }
+
+# Shared by the read routes
+read_flights = SingleFlight()
@@ -0,0 +1,253 @@
+################################################################################
+# socket_relay.py
+# Purpose:  Connects the worker processes of a multi-worker deployment. The
+#           RelayManager is a Socket.IO client manager that relays emits,
+#           room changes and disconnects between workers, so a client can be
+#           reached from any of them. It also carries commit notices: when a
+#           worker commits, the others wake their event dispatchers and drop
+#           the project reads they cached. Messages travel over a pluggable
+#           RelayTransport; UnixSocketTransport needs nothing but a shared
+#           directory, and a broker (Redis, NATS, ...) plugs in by
+#           implementing publish() and listen(). Notices are best effort,
+#           so the response cache also checks its hits in this mode.
+################################################################################
+
+# Libraries
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+# Local files
+from .crud import events
+
+class RelayTransport(ABC):
+    # * publish() sends one message to every other worker
+    # * listen() yields the messages other workers publish, in the order
+    #   each of them published
+    @abstractmethod
+    async def publish(self, message: bytes):
+        ...
+
+    @abstractmethod
+    def listen(self) -> AsyncIterator[bytes]:
+        ...
+
+    async def close(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+class UnixSocketTransport(RelayTransport):
+    # * Every worker listens on its own socket in directory and connects to
+    #   the sockets of the others, rescanning the directory at most every
+    #   refresh_interval seconds to find new ones
+    # * Messages are framed with a 4-byte length prefix
+    # * A worker that went away is skipped until the next rescan; its socket
+    #   file is left alone since a worker that is starting looks the same
+    def __init__(self, directory: str, refresh_interval: float = 1.0):
+        self.directory = directory
+        self.refresh_interval = refresh_interval
+        self.path = os.path.join(
+            directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock")
+        self._server = None
+        self._inbox: Optional[asyncio.Queue] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._writers: Dict[str, asyncio.StreamWriter] = {}
+        self._peers: List[str] = []
+        self._refreshed = 0.0
+
+        # Stats
+        self.published = 0
+        self.received = 0
+        self.send_errors = 0
+
+    async def _start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._inbox = asyncio.Queue()
+        self._server = await asyncio.start_unix_server(self._serve,
+                                                       path=self.path)
+
+    async def _serve(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter):
+        try:
+            while True:
+                size = int.from_bytes(await reader.readexactly(4), "big")
+                await self._inbox.put(await reader.readexactly(size))
+                self.received += 1
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def listen(self) -> AsyncIterator[bytes]:
+        if self._server is None:
+            await self._start()
+        while True:
+            yield await self._inbox.get()
+
+    # Publishes are serialized so every peer gets them in order
+    async def publish(self, message: bytes):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        frame = len(message).to_bytes(4, "big") + message
+        async with self._lock:
+            for path in self._current_peers():
+                try:
+                    writer = self._writers.get(path)
+                    if writer is None:
+                        _, writer = await asyncio.open_unix_connection(path)
+                        self._writers[path] = writer
+                    writer.write(frame)
+                    await writer.drain()
+                except OSError:
+                    self.send_errors += 1
+                    self._peers.remove(path)
+                    writer = self._writers.pop(path, None)
+                    if writer is not None:
+                        writer.close()
+            self.published += 1
+
+    def _current_peers(self) -> List[str]:
+        if time.monotonic() - self._refreshed >= self.refresh_interval:
+            self._refreshed = time.monotonic()
+            try:
+                names = os.listdir(self.directory)
+            except FileNotFoundError:
+                names = []
+            self._peers = [os.path.join(self.directory, name)
+                           for name in sorted(names) if name.endswith(".sock")
+                           and os.path.join(self.directory, name) != self.path]
+        return list(self._peers)
+
+    async def close(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "peers": len(self._peers),
+            "published": self.published,
+            "received": self.received,
+            "send_errors": self.send_errors,
+        }
+
+# Pub/sub method of the commit notices sharing the channel with Socket.IO's
+COMMIT_NOTICE = "taskboard_commit"
+
+class RelayManager(AsyncPubSubManager):
+    name = "relay"
+
+    def __init__(self, transport: RelayTransport, channel: str = "socketio",
+                 write_only: bool = False, logger=None):
+        super().__init__(channel=channel, write_only=write_only,
+                         logger=logger)
+        self.transport = transport
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sends = set()
+        # Set while a notice from another worker is being applied, so that
+        # the listeners it triggers do not send it back out
+        self._applying = threading.local()
+
+        # Stats
+        self.notices_sent = 0
+        self.notices_applied = 0
+
+    # Start relaying with the app, before any client connects: commit
+    # notices matter to workers without clients as well
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        events.add_commit_listener(self._on_commit)
+        events.add_project_listener(self._on_projects)
+        if not self.server.manager_initialized:
+            self.server.manager_initialized = True
+            self.initialize()
+
+    async def stop(self):
+        events.remove_commit_listener(self._on_commit)
+        events.remove_project_listener(self._on_projects)
+        if self._sends:
+            await asyncio.gather(*self._sends, return_exceptions=True)
+        if getattr(self, "thread", None) is not None:
+            self.thread.cancel()
+        await self.transport.close()
+
+    async def _publish(self, data):
+        await self.transport.publish(self.json.dumps(data).encode())
+
+    async def _listen(self):
+        async for message in self.transport.listen():
+            data = self.json.loads(message)
+            if data.get("method") == COMMIT_NOTICE:
+                self._apply_notice(data)
+            else:
+                yield data
+
+    # Commit listeners, called on the thread that committed
+    def _on_commit(self):
+        self._send_notice({"outbox": True})
+
+    def _on_projects(self, project_ids: Set[int]):
+        self._send_notice({"project_ids": sorted(project_ids)})
+
+    def _send_notice(self, notice: Dict[str, Any]):
+        if getattr(self._applying, "active", False) or self._loop is None:
+            return
+        message = {"method": COMMIT_NOTICE, "host_id": self.host_id,
+                   **notice}
+        try:
+            self._loop.call_soon_threadsafe(self._start_send, message)
+        except RuntimeError:
+            # Event loop already closed
+            pass
+
+    def _start_send(self, message: Dict[str, Any]):
+        task = asyncio.ensure_future(self._publish(message))
+        self._sends.add(task)
+        task.add_done_callback(self._sent)
+
+    def _sent(self, task: asyncio.Task):
+        self._sends.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Failed to relay a commit notice: "
+                          f"{task.exception()}")
+        else:
+            self.notices_sent += 1
+
+    # A worker committed: its project reads are stale here, and its events
+    # are in the outbox for this worker's dispatcher to deliver
+    def _apply_notice(self, data: Dict[str, Any]):
+        if data.get("host_id") == self.host_id:
+            return
+        self._applying.active = True
+        try:
+            if data.get("project_ids"):
+                events.notify_project_listeners(set(data["project_ids"]))
+            if data.get("outbox"):
+                events.notify_commit_listeners()
+        finally:
+            self._applying.active = False
+        self.notices_applied += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "host_id": self.host_id,
+            "notices_sent": self.notices_sent,
+            "notices_applied": self.notices_applied,
+            "transport": self.transport.stats(),
+        }
@@ -4,15 +4,28 @@
 #           events related to project, task, and user updates in the
 #           application. Includes utility functions for converting SQLAlchemy
 #           objects to JSON-serializable dictionaries to ensure consistent
-#           payload formatting.
+#           payload formatting. Events are scoped to Socket.IO rooms: task and
+#           member events go to the room of the project they belong to, while
+#           dashboard-level events go to a shared lobby room. Optionally,
+#           events can be buffered per room for a short window, coalesced, and
+#           sent as a single batched frame. With a ReplayBuffer, every event
+#           sent to a room is stamped with the room's sequence number so that
+#           reconnecting clients can resume from where they left off.
 ################################################################################
 
 # Libraries
 import asyncio
 import json
-from typing import Any, Dict, Optional, Union
+from typing import Any, Dict, List, Optional, Union
 from enum import Enum
 
+# Room for dashboard-level events (project and user lifecycle)
+LOBBY_ROOM = "lobby"
+
+# Room for all events scoped to a single project
+def project_room(project_id: int) -> str:
+    return f"project_{project_id}"
+
 # Enum for WebSocket event types
 class EventType(Enum):
     PROJECT_CREATED = "project_created"
@@ -23,17 +36,112 @@ class EventType(Enum):
     TASK_CREATED = "task_created"
     TASK_UPDATED = "task_updated"
     TASK_DELETED = "task_deleted"
+    # One event per project for a bulk task request
+    TASKS_BULK = "tasks_bulk"
     USER_CREATED = "user_created"
     USER_DELETED = "user_deleted"
+    BATCH = "batch"
+    # Sent to a resuming client whose missed events are no longer buffered
+    RESYNC_REQUIRED = "resync_required"
+
+# Pick the room(s) an event is sent to
+# * Project and user lifecycle events go to the lobby; viewers of a project
+#   also hear about its update or deletion
+# * Everything else goes to the room of the project it belongs to, or is
+#   broadcast when it carries no project_id
+def event_rooms(event_name: str, data: Dict[str, Any]) \
+        -> Optional[Union[str, List[str]]]:
+    if event_name in (EventType.PROJECT_CREATED.value,
+                      EventType.USER_CREATED.value,
+                      EventType.USER_DELETED.value):
+        return LOBBY_ROOM
+    if event_name in (EventType.PROJECT_UPDATED.value,
+                      EventType.PROJECT_DELETED.value):
+        return [LOBBY_ROOM, project_room(data["id"])]
+    project_id = data.get("project_id")
+    if project_id is None:
+        return None
+    return project_room(project_id)
+
+# Events whose payload is a full snapshot of the entity, so a later one makes
+# an earlier one for the same entity redundant
+SUPERSEDABLE_EVENTS = {EventType.PROJECT_UPDATED.value,
+                       EventType.TASK_UPDATED.value}
+
+# Identify the entity an event is about, used to coalesce events per entity
+def _entity_key(event_name: str, data: Dict[str, Any]) -> Optional[tuple]:
+    if not isinstance(data, dict):
+        return None
+    kind = event_name.split("_")[0]
+    if kind == "member":
+        user = data.get("user") or {}
+        return (kind, data.get("project_id"), user.get("id"))
+    if data.get("id") is None:
+        return None
+    return (kind, data["id"])
+
+# Events waiting to be sent to one room during the batching window
+class _RoomBuffer:
+    def __init__(self):
+        self.events = []   # Ordered payloads; superseded ones become None
+        self.latest = {}   # Entity key -> index of its latest payload
+        self.timer = None
+
+    def add(self, event_name: str, payload: Dict[str, Any]):
+        key = _entity_key(event_name, payload["data"])
+        index = self.latest.get(key) if key is not None else None
+
+        if index is not None and event_name in SUPERSEDABLE_EVENTS:
+            previous = self.events[index]
+            # An update right after a create folds into the create
+            if previous["type"] == event_name.replace("_updated",
+                                                      "_created"):
+                previous["data"] = payload["data"]
+                if "outbox_seq" in payload:
+                    previous["outbox_seq"] = payload["outbox_seq"]
+                return
+            # A newer snapshot replaces the older one; appending it keeps it
+            # behind every other buffered event for the same entity
+            if previous["type"] == event_name:
+                self.events[index] = None
+
+        self.events.append(payload)
+        if key is not None:
+            self.latest[key] = len(self.events) - 1
+        # A bulk change has no id of its own but is about each task it
+        # carries; later events for those tasks must come after it rather
+        # than fold into something before it
+        if event_name == EventType.TASKS_BULK.value:
+            for kind in ("created", "updated", "deleted"):
+                for task in payload["data"].get(kind, ()):
+                    self.latest.pop(("task", task["id"]), None)
+
+    def drain(self) -> list:
+        return [payload for payload in self.events if payload is not None]
 
 class WebSocketManager:
-    def __init__(self, sio):
+    # * batch_window is in seconds; 0 sends every event immediately
+    # * replay, a ReplayBuffer, makes room streams resumable; broadcasts
+    #   (room None) are not stamped or kept
+    def __init__(self, sio, batch_window: float = 0.0, replay=None):
         self.sio = sio
         self.debug = True  # Toggle for debug logging
+        self.batch_window = batch_window
+        self.replay = replay
+        self._buffers: Dict[Any, _RoomBuffer] = {}
+        self._flushes = set()
+        # Set by a running EventDispatcher, which then does the delivery
+        self.dispatcher = None
     
     # Generic method to emit events with consistent structure
+    # * room may be a single room name, a list of room names, or None to
+    #   broadcast to every connected client
+    # * outbox_seq, the event's position in the outbox, lets clients tell
+    #   how far their view is current, e.g. for /projects/{id}/changes
     async def _emit_event(self, event_type: Union[EventType, str],
-                          data: Dict[str, Any]):
+                          data: Dict[str, Any],
+                          room: Optional[Union[str, List[str]]] = None,
+                          outbox_seq: Optional[int] = None):
         event_name = event_type.value if isinstance(event_type, EventType) \
                                       else event_type
         
@@ -41,59 +149,170 @@ class WebSocketManager:
             "type": event_name,
             "data": data
         }
+        if outbox_seq is not None:
+            payload["outbox_seq"] = outbox_seq
         
         if self.debug and event_name in ["member_added", "member_removed"]:
             print(f"DEBUG {event_name}: {json.dumps(payload, indent=2)}")
         
-        await self.sio.emit(event_name, payload)
+        if self.dispatcher is not None:
+            await self.dispatcher.enqueue(event_name, payload, room)
+        else:
+            await self._deliver(event_name, payload, room)
+
+    # Hand an event to Socket.IO, or to its room's buffer when batching
+    async def _deliver(self, event_name: str, payload: Dict[str, Any],
+                       room: Optional[Union[str, List[str]]] = None):
+        if self.batch_window > 0:
+            self._buffer_event(event_name, payload, room)
+        else:
+            await self._send(room, [payload])
+
+    # Send events to their room(s)
+    # * With replay, each room is a stream of its own, so an event for
+    #   several rooms is stamped and sent once per room
+    async def _send(self, room: Optional[Union[str, List[str]]],
+                    events: List[Dict[str, Any]]):
+        if self.replay is None or room is None:
+            await self._send_frame(events, room=room)
+            return
+        for name in room if isinstance(room, list) else [room]:
+            await self._send_frame(
+                [self.replay.record(name, event) for event in events],
+                room=name)
+
+    # One event goes out as-is, several as one "batch" frame
+    # * Every worker delivers the outbox to its own clients, so these are
+    #   never relayed to other workers by a pub/sub client manager
+    async def _send_frame(self, events: List[Dict[str, Any]], **target):
+        if len(events) == 1:
+            await self.sio.emit(events[0]["type"], events[0],
+                                ignore_queue=True, **target)
+        elif events:
+            await self.sio.emit(EventType.BATCH.value, {
+                "type": EventType.BATCH.value,
+                "data": events
+            }, ignore_queue=True, **target)
+
+    # Where a client that just joined a room starts following its stream
+    def stream_position(self, room: str) -> Dict[str, Any]:
+        if self.replay is None:
+            return {}
+        return {"epoch": self.replay.epoch, "seq": self.replay.head(room)}
+
+    # Resume a client's stream of a room after its last seen seq
+    # * The client must already be in the room, so that anything sent from
+    #   here on reaches it live; it drops events it has seen by seq
+    # * Returns False, after telling the client to resync, when the missed
+    #   events are not buffered (or there is no buffer at all)
+    async def resume(self, sid: str, room: str, epoch: Optional[str],
+                     last_seq: int) -> bool:
+        missed = self.replay.since(room, epoch, last_seq) \
+                 if self.replay is not None else None
+        if missed is None:
+            await self.sio.emit(EventType.RESYNC_REQUIRED.value, {
+                "type": EventType.RESYNC_REQUIRED.value,
+                "data": {"room": room}
+            }, to=sid, ignore_queue=True)
+            return False
+        await self._send_frame(missed, to=sid)
+        return True
+
+    # Batching
+    # * Events are buffered per room; the first event in an empty buffer
+    #   starts the window, and when it closes the buffer is sent as-is if it
+    #   holds a single event, or as one "batch" frame otherwise
+    # * Per-entity ordering is preserved, ordering across entities is not
+    def _buffer_event(self, event_name: str, payload: Dict[str, Any],
+                      room: Optional[Union[str, List[str]]]):
+        key = tuple(room) if isinstance(room, list) else room
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = _RoomBuffer()
+            loop = asyncio.get_running_loop()
+            buffer.timer = loop.call_later(self.batch_window,
+                                           self._start_flush, key)
+        buffer.add(event_name, payload)
+
+    def _start_flush(self, key):
+        task = asyncio.ensure_future(self._flush_room(key))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush_room(self, key):
+        buffer = self._buffers.pop(key, None)
+        if buffer is None:
+            return
+        if buffer.timer is not None:
+            buffer.timer.cancel()
+
+        room = list(key) if isinstance(key, tuple) else key
+        await self._send(room, buffer.drain())
+
+    # Send everything that is still buffered right away
+    async def flush(self):
+        for key in list(self._buffers):
+            await self._flush_room(key)
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+    
+    # Emit an event to the rooms event_rooms() picks for it
+    async def emit_event(self, event_type: Union[EventType, str],
+                         data: Dict[str, Any],
+                         outbox_seq: Optional[int] = None):
+        event_name = event_type.value if isinstance(event_type, EventType) \
+                                      else event_type
+        await self._emit_event(event_name, data,
+                               room=event_rooms(event_name, data),
+                               outbox_seq=outbox_seq)
     
     async def emit_project_created(self, project_data: Dict[str, Any]):
-        await self._emit_event(EventType.PROJECT_CREATED, project_data)
+        await self.emit_event(EventType.PROJECT_CREATED, project_data)
     
     async def emit_project_updated(self, project_data: Dict[str, Any]):
-        await self._emit_event(EventType.PROJECT_UPDATED, project_data)
+        await self.emit_event(EventType.PROJECT_UPDATED, project_data)
     
     async def emit_project_deleted(self, project_id: int, project_name: str):
-        await self._emit_event(EventType.PROJECT_DELETED, {
+        await self.emit_event(EventType.PROJECT_DELETED, {
             "id": project_id, 
             "name": project_name
         })
     
     async def emit_member_added(self, project_id: int, user_data: Any):
         user_dict = self._prepare_data(user_data, "user_data")
-        await self._emit_event(EventType.MEMBER_ADDED, {
+        await self.emit_event(EventType.MEMBER_ADDED, {
             "project_id": project_id, 
             "user": user_dict
         })
     
     async def emit_member_removed(self, project_id: int, user_data: Any):
         user_dict = self._prepare_data(user_data, "user_data")
-        await self._emit_event(EventType.MEMBER_REMOVED, {
+        await self.emit_event(EventType.MEMBER_REMOVED, {
             "project_id": project_id, 
             "user": user_dict
         })
     
     async def emit_task_created(self, task_data: Any):
         task_dict = self._prepare_data(task_data, "task_data")
-        await self._emit_event(EventType.TASK_CREATED, task_dict)
+        await self.emit_event(EventType.TASK_CREATED, task_dict)
     
     async def emit_task_updated(self, task_data: Any):
         task_dict = self._prepare_data(task_data, "task_data")
-        await self._emit_event(EventType.TASK_UPDATED, task_dict)
+        await self.emit_event(EventType.TASK_UPDATED, task_dict)
     
     async def emit_task_deleted(self, task_id: int, task_title: str, \
                                 project_id: Optional[int] = None):
         data = {"id": task_id, "title": task_title}
         if project_id is not None:
             data["project_id"] = project_id
-        await self._emit_event(EventType.TASK_DELETED, data)
+        await self.emit_event(EventType.TASK_DELETED, data)
     
     async def emit_user_created(self, user_data: Any):
         user_dict = self._prepare_data(user_data, "user_data")
-        await self._emit_event(EventType.USER_CREATED, user_dict)
+        await self.emit_event(EventType.USER_CREATED, user_dict)
     
     async def emit_user_deleted(self, user_id: int, user_name: str):
-        await self._emit_event(EventType.USER_DELETED, {
+        await self.emit_event(EventType.USER_DELETED, {
             "id": user_id, 
             "name": user_name
         })
@@ -158,6 +377,10 @@ def _convert_regular_object(obj: Any) -> Dict[str, Any]:
 def _convert_value(value: Any) -> Any:
     if value is None:
         return None
+
+    # Enums (e.g. task status) are sent as their values
+    if isinstance(value, Enum):
+        return value.value
     
     # Handle nested SQLAlchemy objects
     if hasattr(value, '__table__'):
@@ -3,7 +3,8 @@
  * Purpose: Provides a reusable React hook to manage WebSocket connection state,
  *          event subscriptions, and sending messages; includes specialized
  *          hooks for handling real-time updates on projects, tasks, and
- *          members.
+ *          members. Pages join the Socket.IO room (lobby or project) whose
+ *          events they render, and refetch when a room cannot be resumed.
  ******************************************************************************/
 
 import { useEffect, useState, useCallback } from 'react'
@@ -54,10 +55,42 @@ export const useWebSocket = () => {
   }
 }
 
+// Join a project's room for as long as the calling component is mounted
+export const useProjectRoom = (projectId) => {
+  useEffect(() => {
+    if (!projectId) return
+    websocketService.subscribeProject(projectId)
+    return () => websocketService.unsubscribeProject(projectId)
+  }, [projectId])
+}
+
+// Join the lobby room for as long as the calling component is mounted
+export const useLobbyRoom = () => {
+  useEffect(() => {
+    websocketService.subscribeLobby()
+    return () => websocketService.unsubscribeLobby()
+  }, [])
+}
+
+// Call onResync when the room's missed events could not be replayed after a
+// reconnect, so the page refetches what it shows; the lobby without projectId
+export const useRoomResync = (onResync, projectId) => {
+  const { subscribe } = useWebSocket()
+
+  useEffect(() => {
+    const room = projectId ? `project_${parseInt(projectId)}` : 'lobby'
+    return subscribe('resync_required', (data) => {
+      console.log('Resync required event received:', data)
+      if (data.room === room && onResync) onResync()
+    })
+  }, [subscribe, onResync, projectId])
+}
+
 // Specialized hook: listen to project-related WebSocket events and trigger
 // callback
 export const useWebSocketProjects = (onProjectsChange) => {
   const { subscribe } = useWebSocket()
+  useLobbyRoom()
 
   useEffect(() => {
     const unsubscribeCreated = subscribe('project_created', (data) => {
@@ -83,53 +116,66 @@ export const useWebSocketProjects = (onProjectsChange) => {
 }
 
 // Specialized hook: listen to task-related WebSocket events and trigger
-// callback
-export const useWebSocketTasks = (onTasksChange) => {
+// callback; outbox_seq, the event's change log position, is passed along
+export const useWebSocketTasks = (onTasksChange, projectId) => {
   const { subscribe } = useWebSocket()
+  useProjectRoom(projectId)
 
   useEffect(() => {
     const unsubscribeCreated = subscribe('task_created', (data) => {
       console.log('Task created event received:', data)
-      if (onTasksChange) onTasksChange('created', data.data)
+      if (onTasksChange) onTasksChange('created', data.data, data.outbox_seq)
     })
     const unsubscribeUpdated = subscribe('task_updated', (data) => {
       console.log('Task updated event received:', data)
-      if (onTasksChange) onTasksChange('updated', data.data)
+      if (onTasksChange) onTasksChange('updated', data.data, data.outbox_seq)
     })
     const unsubscribeDeleted = subscribe('task_deleted', (data) => {
       console.log('Task deleted event received:', data)
-      if (onTasksChange) onTasksChange('deleted', data.data)
+      if (onTasksChange) onTasksChange('deleted', data.data, data.outbox_seq)
+    })
+    // Replayed as the individual changes it aggregates
+    const unsubscribeBulk = subscribe('tasks_bulk', (data) => {
+      console.log('Tasks bulk event received:', data)
+      if (!onTasksChange) return
+      const { created, updated, deleted } = data.data
+      const seq = data.outbox_seq
+      created.forEach(task => onTasksChange('created', task, seq))
+      updated.forEach(task => onTasksChange('updated', task, seq))
+      deleted.forEach(task => onTasksChange('deleted', task, seq))
     })
 
     return () => {
       unsubscribeCreated()
       unsubscribeUpdated()
       unsubscribeDeleted()
+      unsubscribeBulk()
     }
   }, [subscribe, onTasksChange])
 }
 
 // Specialized hook: listen to member- and user-related WebSocket events and
-// trigger callback
-export const useWebSocketMembers = (onMembersChange) => {
+// trigger callback, with the event's outbox_seq as for tasks
+export const useWebSocketMembers = (onMembersChange, projectId) => {
   const { subscribe } = useWebSocket()
+  useProjectRoom(projectId)
 
   useEffect(() => {
     const unsubscribeAdded = subscribe('member_added', (data) => {
       console.log('Member added event received:', data)
-      if (onMembersChange) onMembersChange('added', data.data)
+      if (onMembersChange) onMembersChange('added', data.data, data.outbox_seq)
     })
     const unsubscribeRemoved = subscribe('member_removed', (data) => {
       console.log('Member removed event received:', data)
-      if (onMembersChange) onMembersChange('removed', data.data)
+      if (onMembersChange) onMembersChange('removed', data.data, data.outbox_seq)
     })
     const unsubscribeUserCreated = subscribe('user_created', (data) => {
       console.log('User created event received:', data)
-      if (onMembersChange) onMembersChange('user_created', data.data)
+      if (onMembersChange) onMembersChange('user_created', data.data, data.outbox_seq)
     })
     const unsubscribeUserDeleted = subscribe('user_deleted', (data) => {
       console.log('User deleted event received:', data)
-      if (onMembersChange) onMembersChange('user_deleted', data.data)
+      if (onMembersChange) onMembersChange('user_deleted', data.data, data.outbox_seq)
     })
 
     return () => {
@@ -7,16 +7,19 @@
 
 import { useEffect, useState, useCallback } from 'react'
 import axios from 'axios'
+import { fetchAllPages } from '../services/api'
 import './Dashboard.css'
 import Members from './Members'
 import Tasks from './Tasks'
-import { useWebSocketProjects } from '../hooks/useWebSocket'
+import { useRoomResync, useWebSocketProjects } from '../hooks/useWebSocket'
 import ConnectionIndicator from '../components/ConnectionIndicator'
 
 function Dashboard() {
   const [projects, setProjects] = useState([])
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState(null)
+  // Task counts per project id, from the summary endpoint
+  const [summaries, setSummaries] = useState({})
   const [showAddModal, setShowAddModal] = useState(false)
   const [newProjectName, setNewProjectName] = useState('')
   const [isCreating, setIsCreating] = useState(false)
@@ -54,6 +57,10 @@ function Dashboard() {
 
   useWebSocketProjects(handleProjectsChange)
 
+  // Lobby events missed while disconnected could not be replayed
+  const handleResync = useCallback(() => fetchProjects(), [])
+  useRoomResync(handleResync)
+
   useEffect(() => {
     fetchProjects()
   }, [])
@@ -61,8 +68,14 @@ function Dashboard() {
   const fetchProjects = async () => {
     try {
       setLoading(true)
-      const response = await axios.get('http://localhost:8000/projects/')
-      setProjects(response.data)
+      const [projectList, summaryList] = await Promise.all([
+        fetchAllPages('/projects/'),
+        fetchAllPages('/projects/summary')
+      ])
+      setProjects(projectList)
+      setSummaries(Object.fromEntries(
+        summaryList.map(summary => [summary.id, summary])
+      ))
       setError(null)
     } catch (err) {
       setError('Failed to fetch projects')
@@ -209,6 +222,8 @@ function Dashboard() {
             <ProjectCard 
               key={project.id} 
               project={project} 
+              summary={summaries[project.id]}
+              loadingSummary={loading}
               onDeleteProject={handleDeleteProject}
               onViewMembers={handleViewMembers}
               onViewTasks={handleViewTasks}
@@ -290,31 +305,13 @@ function Dashboard() {
 
 function ProjectCard({ 
   project, 
+  summary,
+  loadingSummary,
   onDeleteProject, 
   onViewMembers, 
   onViewTasks 
 }) {
   const [showDeleteConfirm, setShowDeleteConfirm] = useState(false)
-  const [taskCount, setTaskCount] = useState(null)
-  const [loadingTasks, setLoadingTasks] = useState(false)
-
-  useEffect(() => {
-    fetchTaskCount()
-  }, [project.id])
-
-  const fetchTaskCount = async () => {
-    try {
-      setLoadingTasks(true)
-      const response = await axios.get(
-        `http://localhost:8000/projects/${project.id}/tasks`
-      )
-      setTaskCount(response.data.length)
-    } catch (err) {
-      console.error('Error fetching tasks:', err)
-    } finally {
-      setLoadingTasks(false)
-    }
-  }
 
   const handleDelete = async () => {
     try {
@@ -343,7 +340,7 @@ function ProjectCard({
         </div>
         <div className="stat">
           <span className="stat-number">
-            {loadingTasks ? '•••' : (taskCount ?? '0')}
+            {loadingSummary ? '•••' : (summary?.task_count ?? '0')}
           </span>
           <span className="stat-label">Tasks</span>
         </div>
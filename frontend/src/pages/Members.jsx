@@ -8,7 +8,7 @@
 import { useEffect, useState, useCallback } from 'react'
 import axios from 'axios'
 import './Members.css'
-import { useWebSocketMembers } from '../hooks/useWebSocket'
+import { useRoomResync, useWebSocketMembers } from '../hooks/useWebSocket'
 import ConnectionIndicator from '../components/ConnectionIndicator'
 
 function Members({ projectId, onBack }) {
@@ -41,7 +41,11 @@ function Members({ projectId, onBack }) {
     }
   }, [projectId])
 
-  useWebSocketMembers(handleMembersChange)
+  useWebSocketMembers(handleMembersChange, projectId)
+
+  // Project events missed while disconnected could not be replayed
+  const handleResync = useCallback(() => fetchProjectAndMembers(), [projectId])
+  useRoomResync(handleResync, projectId)
 
   useEffect(() => {
     if (projectId) {
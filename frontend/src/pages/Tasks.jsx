@@ -5,10 +5,15 @@
  *          with real-time updates via WebSocket connections.
  ******************************************************************************/
 
-import { useEffect, useState, useCallback } from 'react'
+import { useEffect, useState, useCallback, useRef } from 'react'
 import axios from 'axios'
+import { API_URL } from '../services/api'
 import './Tasks.css'
-import { useWebSocketTasks } from '../hooks/useWebSocket'
+import {
+  useRoomResync,
+  useWebSocketMembers,
+  useWebSocketTasks
+} from '../hooks/useWebSocket'
 import ConnectionIndicator from '../components/ConnectionIndicator'
 
 function Tasks({ projectId, onBack }) {
@@ -29,8 +34,21 @@ function Tasks({ projectId, onBack }) {
   const [draggedTask, setDraggedTask] = useState(null)
   const [dragOverColumn, setDragOverColumn] = useState(null)
 
+  // Change log position of what is on screen; events missed while the
+  // socket was down are replayed by the server, or fetched as deltas from
+  // here when they can no longer be replayed
+  const seqRef = useRef(null)
+
+  // Live events of this project's room arrive in log order, so once one is
+  // applied the board is current up to its position
+  const advanceSeq = (seq) => {
+    if (seqRef.current !== null && seq != null && seq > seqRef.current) {
+      seqRef.current = seq
+    }
+  }
+
   // WebSocket handler for real-time task updates
-  const handleTasksChange = useCallback((action, taskData) => {
+  const handleTasksChange = useCallback((action, taskData, seq) => {
     // Only handle tasks for the current project
     if (taskData.project_id !== parseInt(projectId)) {
       return
@@ -60,10 +78,44 @@ function Tasks({ projectId, onBack }) {
       
       default:
         console.log('Unknown task action:', action)
+        return
+    }
+    advanceSeq(seq)
+  }, [projectId])
+
+  useWebSocketTasks(handleTasksChange, projectId)
+
+  // WebSocket handler for membership changes, applied like the deltas of
+  // syncChanges so the position stays true for them as well
+  const handleMembersChange = useCallback((action, payload, seq) => {
+    if (!payload || parseInt(payload.project_id) !== parseInt(projectId)) {
+      return
     }
+    const user = payload.user
+    if (!user || !user.id) return
+
+    if (action === 'added') {
+      setMembers(prev => [...prev.filter(m => m.id !== user.id), user])
+    } else if (action === 'removed') {
+      setMembers(prev => prev.filter(m => m.id !== user.id))
+      // Tasks of removed members are unassigned
+      setTasks(prev => prev.map(task => task.assigned_to === user.id
+        ? { ...task, assigned_to: null } : task))
+    } else {
+      return
+    }
+    advanceSeq(seq)
   }, [projectId])
 
-  useWebSocketTasks(handleTasksChange)
+  useWebSocketMembers(handleMembersChange, projectId)
+
+  const handleResync = useCallback(() => {
+    if (seqRef.current !== null) {
+      syncChanges()
+    }
+  }, [projectId])
+
+  useRoomResync(handleResync, projectId)
 
   useEffect(() => {
     if (projectId) {
@@ -71,21 +123,57 @@ function Tasks({ projectId, onBack }) {
     }
   }, [projectId])
 
+  // Apply what changed since seqRef, or reload everything if the server
+  // can no longer tell
+  const syncChanges = async () => {
+    try {
+      const response = await axios.get(
+        `${API_URL}/projects/${projectId}/changes`,
+        { params: { since: seqRef.current } }
+      )
+      const changes = response.data
+      if (changes.resync || changes.project_deleted) {
+        fetchProjectData()
+        return
+      }
+      seqRef.current = changes.last_seq
+
+      const changed = new Map(changes.tasks.map(task => [task.id, task]))
+      const deleted = new Set(changes.deleted_tasks)
+      const removed = new Set(changes.removed_members)
+      setTasks(prev => {
+        const kept = prev
+          .filter(task => !deleted.has(task.id))
+          .map(task => changed.get(task.id) || task)
+          // Tasks of removed members are unassigned
+          .map(task => removed.has(task.assigned_to)
+            ? { ...task, assigned_to: null } : task)
+        const known = new Set(kept.map(task => task.id))
+        return [...kept, ...changes.tasks.filter(task => !known.has(task.id))]
+      })
+      setMembers(prev => {
+        const added = new Map(changes.members.map(user => [user.id, user]))
+        const kept = prev.filter(user =>
+          !removed.has(user.id) && !added.has(user.id))
+        return [...kept, ...added.values()]
+      })
+    } catch (err) {
+      console.error('Error syncing project changes:', err)
+      fetchProjectData()
+    }
+  }
+
   const fetchProjectData = async () => {
     try {
       setLoading(true)
       setError(null)
       
-      const [projectResponse, tasksResponse, membersResponse] = 
-        await Promise.all([
-          axios.get(`http://localhost:8000/projects/${projectId}`),
-          axios.get(`http://localhost:8000/projects/${projectId}/tasks`),
-          axios.get(`http://localhost:8000/projects/${projectId}/users`)
-        ])
-      
-      setProject(projectResponse.data)
-      setTasks(tasksResponse.data)
-      setMembers(membersResponse.data)
+      // Project, members and tasks in one round trip
+      const response = await axios.get(`${API_URL}/projects/${projectId}/board`)
+      setProject(response.data.project)
+      setTasks(response.data.tasks)
+      setMembers(response.data.members)
+      seqRef.current = response.data.seq
     } catch (err) {
       setError('Failed to fetch project tasks')
       console.error('Error fetching project data:', err)
@@ -164,17 +252,12 @@ function Tasks({ projectId, onBack }) {
     setTasks(updatedTasks)
 
     try {
-      const payload = {
-        title: draggedTask.title,
-        description: draggedTask.description || null,
-        status: newStatus,
-        project_id: parseInt(projectId),
-        assigned_to: draggedTask.assigned_to || null
-      }
-      
-      const response = await axios.put(
-        `http://localhost:8000/tasks/${draggedTask.id}`, 
-        payload
+      // Only the status changes; If-Match makes the move fail instead of
+      // overwriting the task if someone else changed it in the meantime
+      const response = await axios.patch(
+        `${API_URL}/tasks/${draggedTask.id}`,
+        { status: newStatus },
+        { headers: { 'If-Match': `"task-${draggedTask.id}-v${draggedTask.version}"` } }
       )
       
       console.log(`Task ${draggedTask.id} successfully moved to ${newStatus}`)
@@ -187,7 +270,12 @@ function Tasks({ projectId, onBack }) {
     } catch (err) {
       console.error('Error updating task status:', err)
       setTasks(tasks)
-      alert('Failed to update task status. Please try again.')
+      if (err.response?.status === 412) {
+        alert('This task was changed by someone else. Showing the latest version.')
+        fetchProjectData()
+      } else {
+        alert('Failed to update task status. Please try again.')
+      }
     }
   }
 
@@ -0,0 +1,26 @@
+/*******************************************************************************
+ * api.js
+ * Purpose: Helpers for the REST API. List endpoints are keyset paginated: each
+ *          response holds one page and the X-Next-Cursor header points at the
+ *          next one.
+ ******************************************************************************/
+
+import axios from 'axios'
+
+export const API_URL = 'http://localhost:8000'
+
+const PAGE_SIZE = 500
+
+// Follows X-Next-Cursor until the last page and returns every item
+export async function fetchAllPages(path, params = {}) {
+  const items = []
+  let cursor = null
+  do {
+    const response = await axios.get(`${API_URL}${path}`, {
+      params: { ...params, limit: PAGE_SIZE, ...(cursor && { cursor }) }
+    })
+    items.push(...response.data)
+    cursor = response.headers['x-next-cursor']
+  } while (cursor)
+  return items
+}
@@ -12,6 +12,15 @@ class WebSocketService {
     this.maxReconnectAttempts = 5
     this.reconnectInterval = 1000
     this.listeners = new Map()
+    // Rooms this client wants to be in; replayed after every (re)connect
+    this.projectSubscriptions = new Map()
+    this.lobbySubscriptions = 0
+    // Last seq seen per room, and the server epoch they belong to; sent in
+    // the handshake so a reconnect resumes each room where it left off
+    this.streams = new Map()
+    this.epoch = null
+    this.resumedRooms = new Set()
+    this.hasConnected = false
   }
 
   connect() {
@@ -27,7 +36,8 @@ class WebSocketService {
       upgrade: true,
       rememberUpgrade: true,
       timeout: 20000,
-      forceNew: true
+      forceNew: true,
+      auth: (cb) => cb(this.resumeAuth())
     })
 
     this.setupEventHandlers()
@@ -38,6 +48,11 @@ class WebSocketService {
       console.log('Connected to WebSocket server:', this.socket.id)
       this.isConnected = true
       this.reconnectAttempts = 0
+
+      // Rooms are dropped server-side on disconnect; those sent in the
+      // handshake are rejoined by the server, the rest are rejoined here
+      this.resubscribe()
+      this.hasConnected = true
       
       // Notify listeners about connection
       this.emit('connection_status', { connected: true, id: this.socket.id })
@@ -69,6 +84,23 @@ class WebSocketService {
       console.log('Connection established:', data)
     })
 
+    // The server no longer has the events this client missed in a room;
+    // whoever renders the room refetches it, and the stream is picked up
+    // again from where it is now
+    this.socket.on('resync_required', (data) => {
+      console.log('Resync required:', data)
+      const room = data.data.room
+      this.resync(room)
+      this.sendRoomEvent(...this.subscribeEvent(room))
+    })
+
+    // Batched events: several events for one room, sent as one frame in
+    // their original order; also how missed events are replayed
+    this.socket.on('batch', (data) => {
+      console.log('Batch received:', data)
+      data.data.forEach(event => this.emit(event.type, event))
+    })
+
     // Project events
     this.socket.on('project_created', (data) => {
       console.log('Project created:', data)
@@ -112,6 +144,12 @@ class WebSocketService {
       this.emit('task_deleted', data)
     })
 
+    // One event for a whole bulk request in a project
+    this.socket.on('tasks_bulk', (data) => {
+      console.log('Tasks changed in bulk:', data)
+      this.emit('tasks_bulk', data)
+    })
+
     // User events
     this.socket.on('user_created', (data) => {
       console.log('User created:', data)
@@ -154,6 +192,118 @@ class WebSocketService {
     }
   }
 
+  // Room subscriptions
+  // * Reference counted so several components can share one room
+  subscribeProject(projectId) {
+    const id = parseInt(projectId)
+    const count = this.projectSubscriptions.get(id) || 0
+    this.projectSubscriptions.set(id, count + 1)
+    if (count === 0) {
+      this.sendRoomEvent('subscribe_project', { project_id: id })
+    }
+  }
+
+  unsubscribeProject(projectId) {
+    const id = parseInt(projectId)
+    const count = this.projectSubscriptions.get(id) || 0
+    if (count <= 1) {
+      this.projectSubscriptions.delete(id)
+      this.streams.delete(`project_${id}`)
+      if (count === 1) {
+        this.sendRoomEvent('unsubscribe_project', { project_id: id })
+      }
+    } else {
+      this.projectSubscriptions.set(id, count - 1)
+    }
+  }
+
+  subscribeLobby() {
+    this.lobbySubscriptions++
+    if (this.lobbySubscriptions === 1) {
+      this.sendRoomEvent('subscribe_lobby', {})
+    }
+  }
+
+  unsubscribeLobby() {
+    if (this.lobbySubscriptions === 0) return
+    this.lobbySubscriptions--
+    if (this.lobbySubscriptions === 0) {
+      this.streams.delete('lobby')
+      this.sendRoomEvent('unsubscribe_lobby', {})
+    }
+  }
+
+  resubscribe() {
+    this.projectSubscriptions.forEach((_, id) => this.rejoin(`project_${id}`))
+    if (this.lobbySubscriptions > 0) {
+      this.rejoin('lobby')
+    }
+  }
+
+  // A room that could not be resumed may have missed events while the
+  // socket was down
+  rejoin(room) {
+    if (this.resumedRooms.has(room)) return
+    this.sendRoomEvent(...this.subscribeEvent(room))
+    if (this.hasConnected) this.resync(room)
+  }
+
+  subscribeEvent(room) {
+    return room === 'lobby'
+      ? ['subscribe_lobby', {}]
+      : ['subscribe_project', { project_id: parseInt(room.slice(8)) }]
+  }
+
+  // Unlike send(), stay quiet while disconnected: resubscribe() catches up
+  // * The reply tells where the room's stream is at as of joining it
+  sendRoomEvent(event, data) {
+    if (this.socket && this.isConnected) {
+      this.socket.emit(event, data, (reply) => this.startStream(reply))
+    }
+  }
+
+  // Stream positions
+  resumeAuth() {
+    const rooms = {}
+    this.projectSubscriptions.forEach((_, id) => {
+      const room = `project_${id}`
+      if (this.streams.has(room)) rooms[room] = this.streams.get(room)
+    })
+    if (this.lobbySubscriptions > 0 && this.streams.has('lobby')) {
+      rooms.lobby = this.streams.get('lobby')
+    }
+    this.resumedRooms = new Set(Object.keys(rooms))
+    return { epoch: this.epoch, rooms }
+  }
+
+  startStream(reply) {
+    if (!reply || !reply.ok || reply.seq === undefined) return
+    if (reply.epoch !== this.epoch) {
+      this.epoch = reply.epoch
+      this.streams.clear()
+    }
+    if (!this.streams.has(reply.room)) {
+      this.streams.set(reply.room, reply.seq)
+    }
+  }
+
+  // Drop events already seen (a replay can overlap what arrives live) and
+  // advance the room's position
+  isNewInStream(data) {
+    if (!data || data.seq === undefined || data.epoch !== this.epoch) {
+      return true
+    }
+    const last = this.streams.get(data.room)
+    if (last !== undefined && data.seq <= last) return false
+    this.streams.set(data.room, data.seq)
+    return true
+  }
+
+  resync(room) {
+    this.streams.delete(room)
+    this.emit('resync_required', { room })
+  }
+
   // Event listener management
   on(event, callback) {
     if (!this.listeners.has(event)) {
@@ -176,6 +326,7 @@ class WebSocketService {
   }
 
   emit(event, data) {
+    if (!this.isNewInStream(data)) return
     if (this.listeners.has(event)) {
       this.listeners.get(event).forEach(callback => {
         try {
@@ -7,11 +7,11 @@ DB_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__),
 os.environ["DATABASE_URL"] = f"sqlite:///{DB_FILE}"
 
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 
 from backend.main import app, get_db
-from backend.database import Base
+from backend.database import Base, read_engine, write_engine
 
 SQLALCHEMY_DATABASE_URL = os.environ["DATABASE_URL"]
 
@@ -33,10 +33,37 @@ def setup_and_teardown_db():
     app.dependency_overrides[get_db] = override_get_db
     yield
     Base.metadata.drop_all(bind=engine)
-    if os.path.exists(DB_FILE):
-        os.remove(DB_FILE)
+    engine.dispose()
+    # WAL mode leaves -wal and -shm files next to the database
+    for path in (DB_FILE, DB_FILE + "-wal", DB_FILE + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
 
 @pytest.fixture
 def client():
     with TestClient(app) as c:
         yield c
+
+# Counts the statements GET routes run on the read pool
+@pytest.fixture
+def count_queries():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(read_engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(read_engine, "before_cursor_execute", record)
+
+# Counts the statements mutations run on the writer connection
+@pytest.fixture
+def count_writes():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(write_engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(write_engine, "before_cursor_execute", record)
@@ -0,0 +1,54 @@
+# tests/test_database.py
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from backend.database import engine, read_engine, write_engine, profile, \
+                             ReadSessionLocal, read_snapshot
+
+def pragma(bind, name):
+    with bind.connect() as conn:
+        return conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+
+def test_profile_pragmas_applied():
+    for bind in (engine, read_engine, write_engine):
+        assert pragma(bind, "journal_mode") == profile["journal_mode"].lower()
+        assert pragma(bind, "busy_timeout") == \
+               profile["pragmas"]["busy_timeout"]
+        assert pragma(bind, "foreign_keys") == 1
+    assert pragma(read_engine, "query_only") == 1
+    assert pragma(write_engine, "query_only") == 0
+
+def test_read_sessions_cannot_write():
+    db = ReadSessionLocal()
+    try:
+        with pytest.raises(OperationalError):
+            db.execute(text("INSERT INTO projects (name) VALUES ('ReadOnly')"))
+    finally:
+        db.close()
+
+def test_read_snapshot_ignores_later_commits():
+    count = "SELECT COUNT(*) FROM projects"
+    db = ReadSessionLocal()
+    try:
+        read_snapshot(db)
+        before = db.execute(text(count)).scalar()
+        with engine.begin() as conn:
+            conn.exec_driver_sql(
+                "INSERT INTO projects (name) VALUES ('AfterSnapshot')")
+        assert db.execute(text(count)).scalar() == before
+    finally:
+        db.close()
+
+    db = ReadSessionLocal()
+    try:
+        assert db.execute(text(count)).scalar() == before + 1
+    finally:
+        db.close()
+
+def test_pool_stats_exposed(client):
+    client.get("/projects/")
+    pools = client.get("/stats").json()["db_pools"]
+    assert set(pools) == {"general", "read", "write"}
+    assert pools["read"]["checkouts"] >= 1
+    assert pools["read"]["checked_out"] == 0
@@ -0,0 +1,70 @@
+# tests/test_db_executor.py
+import asyncio
+import time
+
+import pytest
+
+from backend.db_executor import DBExecutor
+from backend.exceptions import DatabaseBusy
+from backend import schemas
+from backend.crud import projects
+
+def slow_write(db, seconds):
+    # Stand-in for a long SQLite write holding its thread
+    time.sleep(seconds)
+    return "written"
+
+def test_heartbeats_not_delayed_by_slow_write():
+    executor = DBExecutor(workers=1, max_pending=0)
+
+    async def run():
+        gaps = []
+
+        async def heartbeat():
+            last = time.monotonic()
+            for _ in range(20):
+                await asyncio.sleep(0.01)
+                now = time.monotonic()
+                gaps.append(now - last)
+                last = now
+
+        result, _ = await asyncio.gather(executor.run(slow_write, 0.3),
+                                         heartbeat())
+        return result, gaps
+
+    try:
+        result, gaps = asyncio.run(run())
+    finally:
+        executor.shutdown()
+    assert result == "written"
+    # The write took 300 ms, yet every 10 ms tick arrived roughly on time
+    assert max(gaps) < 0.1
+
+def test_full_backlog_is_rejected():
+    executor = DBExecutor(workers=1, max_pending=0)
+
+    async def run():
+        first = asyncio.ensure_future(executor.run(slow_write, 0.1))
+        await asyncio.sleep(0)
+        with pytest.raises(DatabaseBusy):
+            await executor.run(slow_write, 0)
+        return await first
+
+    try:
+        assert asyncio.run(run()) == "written"
+    finally:
+        executor.shutdown()
+    assert executor.stats()["rejected"] == 1
+
+def test_response_built_inside_session(client):
+    project = client.post("/projects/", json={"name": "ExecProj"}).json()
+    executor = DBExecutor(workers=1)
+
+    try:
+        result = asyncio.run(executor.run(projects.get_project, project["id"],
+                                          response_type=schemas.Project))
+    finally:
+        executor.shutdown()
+    # Lazy relationships were loaded before the session closed
+    assert isinstance(result, schemas.Project)
+    assert result.members == []
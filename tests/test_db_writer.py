@@ -0,0 +1,68 @@
+# tests/test_db_writer.py
+import asyncio
+import time
+
+from backend.db_writer import WriteQueue
+from backend.database import SessionLocal
+from backend.crud import projects
+from backend.exceptions import DuplicateProjectName
+from backend import schemas
+
+def hold_writer(db, seconds):
+    time.sleep(seconds)
+
+def test_queued_writes_share_commits_and_fail_alone():
+    writer = WriteQueue(max_batch=64)
+    names = [f"GroupProj{i}" for i in range(20)]
+
+    async def run():
+        # Keep the writer busy so the following jobs queue up behind it
+        blocker = asyncio.ensure_future(writer.submit(hold_writer, 0.1))
+        await asyncio.sleep(0.02)
+        jobs = [writer.submit(projects.create_project,
+                              schemas.ProjectCreate(name=name),
+                              response_type=schemas.Project)
+                for name in names + ["GroupProj3"]]
+        results = await asyncio.gather(*jobs, return_exceptions=True)
+        await blocker
+        return results
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        writer.stop()
+
+    created, duplicate = results[:-1], results[-1]
+    assert [project.name for project in created] == names
+    assert isinstance(duplicate, DuplicateProjectName)
+
+    stats = writer.stats()
+    assert stats["jobs"] == 22 and stats["failed"] == 1
+    # 21 queued jobs went out in far fewer commits
+    assert stats["commits"] <= 3
+    assert stats["max_group_size"] >= 10
+
+    db = SessionLocal()
+    try:
+        page = projects.get_projects_page(
+                   db, cursor=min(project.id for project in created) - 1,
+                   limit=len(created))
+        stored = [project.name for project in page["items"]]
+    finally:
+        db.close()
+    assert all(name in stored for name in names)
+
+def test_writer_restarts_after_stop():
+    writer = WriteQueue()
+
+    async def create(name):
+        return await writer.submit(projects.create_project,
+                                   schemas.ProjectCreate(name=name),
+                                   response_type=schemas.Project)
+
+    try:
+        assert asyncio.run(create("RestartA")).name == "RestartA"
+        writer.stop()
+        assert asyncio.run(create("RestartB")).name == "RestartB"
+    finally:
+        writer.stop()
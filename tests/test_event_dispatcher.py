@@ -0,0 +1,78 @@
+# tests/test_event_dispatcher.py
+import asyncio
+
+from backend.event_dispatcher import EventDispatcher
+from backend.websocket_utils import WebSocketManager, project_room
+
+class SlowSio:
+    def __init__(self, delay):
+        self.delay = delay
+        self.emitted = []
+
+    async def emit(self, event, data=None, room=None, **kwargs):
+        await asyncio.sleep(self.delay)
+        self.emitted.append((event, data, room))
+
+def test_enqueue_returns_before_delivery_and_stop_flushes():
+    sio = SlowSio(delay=0.05)
+    manager = WebSocketManager(sio)
+    manager.debug = False
+    # Its own outbox cursor, so events from other tests replay harmlessly
+    dispatcher = EventDispatcher(manager, workers=2,
+                                 cursor_name="dispatcher-test")
+
+    async def run():
+        await dispatcher.start()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for i in range(5):
+            await manager.emit_task_updated({"id": i, "project_id": -1,
+                                             "status": "done"})
+        elapsed = loop.time() - started
+        depth = dispatcher.stats()["queue_depth"]
+        await dispatcher.stop()
+        return elapsed, depth
+
+    elapsed, depth = asyncio.run(run())
+    # Emitting only enqueued; the slow broadcasts happened in the background
+    assert elapsed < 0.05
+    assert depth > 0
+    # Stopping drained the queue, in order, before returning
+    assert [data["data"]["id"] for _, data, room in sio.emitted
+            if room == project_room(-1)] == [0, 1, 2, 3, 4]
+    stats = dispatcher.stats()
+    assert stats["queue_depth"] == 0
+    assert stats["delivered"] >= 5 and stats["failed"] == 0
+    assert stats["max_drain_lag_ms"] >= 50
+    assert manager.dispatcher is None
+
+def test_stats_endpoint(client):
+    client.post("/projects/", json={"name": "StatsProj"})
+    resp = client.get("/stats")
+    assert resp.status_code == 200
+    events = resp.json()["events"]
+    assert events["running"]
+    assert events["enqueued"] >= 1
+
+def test_one_primary_per_lock(tmp_path):
+    lock = str(tmp_path / "dispatcher.lock")
+    first, second = [
+        EventDispatcher(WebSocketManager(SlowSio(delay=0)),
+                        cursor_name="primary-test", primary_lock=lock,
+                        poll_interval=0.05)
+        for _ in range(2)]
+
+    async def run():
+        await first.start()
+        await second.start()
+        roles = (first.primary, second.primary)
+        # The secondary takes over once the primary is gone
+        await first.stop()
+        await asyncio.sleep(0.2)
+        taken_over = second.primary
+        await second.stop()
+        return roles, taken_over
+
+    roles, taken_over = asyncio.run(run())
+    assert roles == (True, False)
+    assert taken_over
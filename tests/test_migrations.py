@@ -0,0 +1,51 @@
+# tests/test_migrations.py
+from sqlalchemy import create_engine, inspect
+
+from backend.migrations import run_migrations
+
+# Schema as created by versions before the indexes existed
+LEGACY_SCHEMA = [
+    "CREATE TABLE projects (id INTEGER PRIMARY KEY, name VARCHAR UNIQUE)",
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, name VARCHAR, "
+    "email VARCHAR UNIQUE)",
+    "CREATE TABLE tasks (id INTEGER PRIMARY KEY, title VARCHAR, "
+    "description VARCHAR, status VARCHAR, project_id INTEGER, "
+    "assigned_to INTEGER)",
+    "CREATE TABLE project_members (project_id INTEGER, user_id INTEGER)",
+]
+
+def test_legacy_database_is_migrated_in_place(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.exec_driver_sql(statement)
+        conn.exec_driver_sql("INSERT INTO projects VALUES (1, 'Legacy')")
+        conn.exec_driver_sql(
+            "INSERT INTO tasks (id, title, status, project_id) VALUES "
+            "(1, 'Dup', 'todo', 1), (2, 'Dup', 'todo', 1), "
+            "(3, 'Other', 'todo', 1)")
+
+    # Running twice must be harmless
+    run_migrations(engine)
+    run_migrations(engine)
+
+    with engine.connect() as conn:
+        titles, task_versions = zip(*conn.exec_driver_sql(
+                    "SELECT title, version FROM tasks ORDER BY id"))
+        task_indexes = {index["name"]: index["unique"]
+                        for index in inspect(conn).get_indexes("tasks")}
+        member_indexes = [index["name"] for index in
+                          inspect(conn).get_indexes("project_members")]
+        updated_at, version = conn.exec_driver_sql(
+                        "SELECT updated_at, version FROM projects").one()
+    engine.dispose()
+
+    assert titles == ("Dup", "Dup (2)", "Other")
+    assert task_versions == (1, 1, 1)
+    assert task_indexes["uq_tasks_project_title"]
+    assert "ix_tasks_project_status" in task_indexes
+    assert "ix_tasks_project_id" in task_indexes
+    assert "ix_tasks_assigned_to" in task_indexes
+    assert "ix_project_members_user_id" in member_indexes
+    assert updated_at is not None
+    assert version == 1
@@ -0,0 +1,145 @@
+# tests/test_outbox.py
+import asyncio
+import time
+
+from backend.main import app
+from backend.database import SessionLocal
+from backend.models import OutboxEvent
+from backend.crud import events
+from backend.event_dispatcher import EventDispatcher
+from backend.websocket_utils import WebSocketManager, project_room
+
+class FakeSio:
+    def __init__(self):
+        self.emitted = []
+
+    async def emit(self, event, data=None, room=None, **kwargs):
+        self.emitted.append((event, data, room))
+
+def outbox_for_project(project_id):
+    db = SessionLocal()
+    try:
+        return [row.event_type for row in db.query(OutboxEvent).filter(
+                    OutboxEvent.project_id == project_id
+                ).order_by(OutboxEvent.seq)]
+    finally:
+        db.close()
+
+def test_mutations_write_outbox_rows(client):
+    project = client.post("/projects/", json={"name": "OutboxProj"}).json()
+    task = client.post("/tasks/", json={
+        "title": "OutboxTask",
+        "project_id": project["id"]
+    }).json()
+    client.put(f"/tasks/{task['id']}", json={
+        "title": "OutboxTask",
+        "status": "done",
+        "project_id": project["id"]
+    })
+    client.delete(f"/tasks/{task['id']}")
+    # A rejected mutation leaves nothing behind
+    client.post("/tasks/", json={"title": "X", "project_id": 99999})
+    assert outbox_for_project(project["id"]) == ["task_created",
+                                                 "task_updated",
+                                                 "task_deleted"]
+
+def test_rolled_back_event_is_discarded():
+    db = SessionLocal()
+    try:
+        events.record_event(db, "task_created", {"id": 1}, project_id=-1)
+        db.rollback()
+    finally:
+        db.close()
+    assert outbox_for_project(-1) == []
+
+def test_dispatcher_broadcasts_committed_events(client):
+    sio = FakeSio()
+    manager = app.state.ws_manager
+    original = manager.sio
+    manager.sio = sio
+    try:
+        project = client.post("/projects/",
+                              json={"name": "LiveOutbox"}).json()
+        client.post("/tasks/", json={"title": "Live",
+                                     "project_id": project["id"]})
+        deadline = time.time() + 2
+        while time.time() < deadline and not any(
+                room == project_room(project["id"])
+                for _, _, room in sio.emitted):
+            time.sleep(0.02)
+    finally:
+        manager.sio = original
+    frames = [data for _, data, room in sio.emitted
+              if room == project_room(project["id"])]
+    assert frames and frames[0]["type"] == "task_created"
+    # Stamped with its outbox position, from which the changes go on
+    changes = client.get(f"/projects/{project['id']}/changes",
+                         params={"since": frames[0]["outbox_seq"]}).json()
+    assert not changes["resync"] and changes["tasks"] == []
+    changes = client.get(f"/projects/{project['id']}/changes",
+                         params={"since": frames[0]["outbox_seq"] - 1}).json()
+    assert [task["title"] for task in changes["tasks"]] == ["Live"]
+
+def test_dispatcher_replays_events_missed_while_down():
+    # Commit an event with no dispatcher running, as after a crash
+    db = SessionLocal()
+    try:
+        events.record_event(db, "task_deleted",
+                            {"id": 1, "title": "Missed", "project_id": -2},
+                            project_id=-2)
+        db.commit()
+    finally:
+        db.close()
+
+    sio = FakeSio()
+    manager = WebSocketManager(sio)
+    manager.debug = False
+    dispatcher = EventDispatcher(manager, cursor_name="replay-test")
+
+    async def run():
+        await dispatcher.start()
+        await dispatcher.stop()
+
+    asyncio.run(run())
+    assert ("task_deleted", project_room(-2)) in \
+           [(event, room) for event, _, room in sio.emitted]
+
+    # The cursor was persisted, so a restart does not replay again
+    sio.emitted.clear()
+    asyncio.run(run())
+    assert sio.emitted == []
+
+def test_cursor_waits_for_batched_events():
+    db = SessionLocal()
+    try:
+        events.record_event(db, "task_deleted",
+                            {"id": 1, "title": "Batched", "project_id": -3},
+                            project_id=-3)
+        db.commit()
+        # Start right before it
+        events.set_cursor(db, events.get_head_seq(db) - 1, "batched-test")
+    finally:
+        db.close()
+
+    sio = FakeSio()
+    # A window far longer than the test, so only a flush can send the event
+    manager = WebSocketManager(sio, batch_window=60)
+    manager.debug = False
+    dispatcher = EventDispatcher(manager, cursor_name="batched-test")
+    saved = []
+    save_cursor = dispatcher._save_cursor
+
+    def record_save(seq):
+        saved.append([room for _, _, room in sio.emitted])
+        save_cursor(seq)
+    dispatcher._save_cursor = record_save
+
+    async def run():
+        await dispatcher.start()
+        while not saved:
+            await asyncio.sleep(0.01)
+        await dispatcher.stop()
+
+    asyncio.run(run())
+    # The event had been sent by the time its seq was saved
+    assert project_room(-3) in saved[0]
@@ -1,4 +1,11 @@
 # tests/test_projects.py
+import json
+from datetime import datetime, timedelta
+
+from backend.crud import events
+from backend.database import SessionLocal
+from backend.models import OutboxEvent, Task
+
 def test_create_and_get_project(client):
     # Create
     resp = client.post("/projects/", json={"name": "Alpha"})
@@ -38,6 +45,32 @@ def test_delete_project(client):
     resp = client.get(f"/projects/{pid}")
     assert resp.status_code == 404
 
+def test_delete_project_is_set_based(client, count_writes):
+    project = client.post("/projects/", json={"name": "BigProj"}).json()
+    member = client.post(f"/projects/{project['id']}/add-member",
+                         json={"name": "Big", "email": "big@b.com"}).json()
+    client.post("/tasks/bulk", json={"operations": [
+        {"op": "create", "title": f"Task{i}", "project_id": project["id"],
+         "assigned_to": member["id"]} for i in range(50)]})
+
+    count_writes.clear()
+    assert client.delete(f"/projects/{project['id']}").status_code == 200
+    # A few statements however many tasks there are, none reading tasks
+    statements = [s for s in count_writes if not s.startswith(
+                    ("BEGIN", "SAVEPOINT", "RELEASE", "COMMIT"))]
+    assert len(statements) == 6
+    assert not [s for s in statements if s.startswith("SELECT")
+                and "tasks" in s]
+
+    db = SessionLocal()
+    try:
+        assert db.query(Task).filter(
+                    Task.project_id == project["id"]).count() == 0
+    finally:
+        db.close()
+    # The member outlives the project
+    assert client.get(f"/users/{member['id']}").status_code == 200
+
 def test_add_and_remove_member(client):
     # Create project and user
     project = client.post("/projects/", json={"name": "Zeta"}).json()
@@ -73,3 +106,169 @@ def test_remove_non_member(client):
                        json={"name": "Tom", "email": "tom@example.com"})
     assert resp.status_code == 400
     assert "not a member" in resp.json()["detail"].lower()
+
+def test_project_summaries(client):
+    project = client.post("/projects/", json={"name": "SummaryProj"}).json()
+    client.post(f"/projects/{project['id']}/add-member",
+                json={"name": "Sum", "email": "sum@s.com"})
+    for title, status in [("S1", "todo"), ("S2", "done"), ("S3", "done")]:
+        client.post("/tasks/", json={"title": title, "status": status,
+                                     "project_id": project["id"]})
+
+    # Start right before the project so it is on the first page
+    resp = client.get("/projects/summary",
+                      params={"cursor": project["id"] - 1, "limit": 1})
+    assert resp.status_code == 200
+    [summary] = resp.json()
+    assert summary["id"] == project["id"]
+    assert summary["member_count"] == 1
+    assert summary["task_count"] == 3
+    assert summary["task_counts"] == {"todo": 1, "in-progress": 0, "done": 2}
+    assert summary["updated_at"] is not None
+
+def test_read_board(client):
+    project = client.post("/projects/", json={"name": "BoardProj"}).json()
+    user = client.post(f"/projects/{project['id']}/add-member",
+                       json={"name": "Boarder", "email": "board@b.com"}).json()
+    for title in ["B1", "B2"]:
+        client.post("/tasks/", json={"title": title,
+                                     "project_id": project["id"],
+                                     "assigned_to": user["id"]})
+
+    resp = client.get(f"/projects/{project['id']}/board")
+    assert resp.status_code == 200
+    board = resp.json()
+    assert board["project"]["name"] == "BoardProj"
+    assert [member["id"] for member in board["members"]] == [user["id"]]
+    assert [task["title"] for task in board["tasks"]] == ["B1", "B2"]
+    assert "project" not in board["tasks"][0]
+
+    assert client.get("/projects/99999/board").status_code == 404
+
+def test_create_project_reads_nothing_back(client, count_writes):
+    resp = client.post("/projects/", json={"name": "ReturningProj"})
+    assert resp.status_code == 200
+    assert resp.json()["members"] == []
+    # The row comes back from INSERT ... RETURNING
+    assert not [s for s in count_writes
+                if s.lstrip().upper().startswith("SELECT")]
+
+def test_add_and_remove_members_in_bulk(client, count_writes):
+    project = client.post("/projects/", json={"name": "BulkMembers"}).json()
+    ids = [client.post("/users/", json={"name": f"Bulk{i}",
+                                        "email": f"bulk{i}@m.com"}).json()["id"]
+           for i in range(3)]
+    client.post(f"/projects/{project['id']}/add-member",
+                json={"name": "Bulk0", "email": "bulk0@m.com"})
+    task = client.post("/tasks/", json={"title": "Assigned",
+                                        "project_id": project["id"],
+                                        "assigned_to": ids[0]}).json()
+
+    count_writes.clear()
+    resp = client.post(f"/projects/{project['id']}/add-members",
+                       json={"user_ids": ids + [99999]})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert [user["id"] for user in body["changed"]] == ids[1:]
+    assert (body["unchanged"], body["not_found"]) == ([ids[0]], [99999])
+    # One statement for all the memberships, members are never loaded
+    assert len([s for s in count_writes if "project_members" in s]) == 1
+    members = client.get(f"/projects/{project['id']}/users").json()
+    assert sorted(user["id"] for user in members) == ids
+
+    resp = client.post(f"/projects/{project['id']}/remove-members",
+                       json={"user_ids": ids[:2]})
+    assert [user["id"] for user in resp.json()["changed"]] == ids[:2]
+    members = client.get(f"/projects/{project['id']}/users").json()
+    assert [user["id"] for user in members] == [ids[2]]
+    assert client.get(f"/tasks/{task['id']}").json()["assigned_to"] is None
+
+    resp = client.post("/projects/99999/add-members", json={"user_ids": ids})
+    assert resp.status_code == 404
+
+def test_invite_members_upserts_users(client, count_writes):
+    project = client.post("/projects/", json={"name": "InviteProj"}).json()
+    known = client.post("/users/", json={"name": "Known",
+                                         "email": "known@i.com"}).json()
+    client.post("/users/", json={"name": "Taken", "email": "taken@i.com"})
+
+    count_writes.clear()
+    resp = client.post(f"/projects/{project['id']}/invite-members", json={
+        "users": [{"name": "Known", "email": "KNOWN@i.com"},
+                  {"name": "Fresh", "email": "fresh@i.com"},
+                  {"name": "Impostor", "email": "taken@i.com"},
+                  {"name": "Fresh", "email": "fresh@i.com"},
+                  {"name": "Stranger", "email": "fresh@i.com"}]})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert [user["email"] for user in body["changed"]] == \
+           ["known@i.com", "fresh@i.com"]
+    assert body["changed"][0]["id"] == known["id"]
+    # The first name given for an email is used, another one conflicts
+    assert body["conflicts"] == ["taken@i.com", "fresh@i.com"]
+    # One upsert for all the users
+    assert len([s for s in count_writes
+                if s.startswith("INSERT INTO users")]) == 1
+
+    db = SessionLocal()
+    try:
+        created = [json.loads(event.payload)["email"] for event in
+                   db.query(OutboxEvent).filter(
+                       OutboxEvent.event_type == "user_created")]
+    finally:
+        db.close()
+    assert created.count("fresh@i.com") == 1
+    assert created.count("known@i.com") == 1
+
+    # Inviting again changes nothing
+    resp = client.post(f"/projects/{project['id']}/invite-members", json={
+        "users": [{"name": "Fresh", "email": "fresh@i.com"}]})
+    assert resp.json()["changed"] == []
+    assert resp.json()["unchanged"] == [body["changed"][1]["id"]]
+
+def test_project_changes_since_board(client):
+    project = client.post("/projects/", json={"name": "DeltaProj"}).json()
+    url = f"/projects/{project['id']}"
+    gone = client.post("/tasks/", json={"title": "Gone",
+                                        "project_id": project["id"]}).json()
+    seq = client.get(f"{url}/board").json()["seq"]
+
+    # Changes after the board was read, collapsed to their latest state
+    member = client.post(f"{url}/add-member",
+                         json={"name": "Delta", "email": "delta@d.com"}).json()
+    task = client.post("/tasks/", json={"title": "Moved",
+                                        "project_id": project["id"]}).json()
+    client.patch(f"/tasks/{task['id']}", json={"status": "in-progress"})
+    client.patch(f"/tasks/{task['id']}", json={"status": "done"})
+    client.delete(f"/tasks/{gone['id']}")
+    client.post("/projects/", json={"name": "OtherDeltaProj"})
+
+    changes = client.get(f"{url}/changes", params={"since": seq}).json()
+    assert not changes["resync"]
+    assert [(t["id"], t["status"]) for t in changes["tasks"]] == \
+           [(task["id"], "done")]
+    assert changes["deleted_tasks"] == [gone["id"]]
+    assert [user["id"] for user in changes["members"]] == [member["id"]]
+
+    # Nothing new since the last call
+    head = changes["last_seq"]
+    changes = client.get(f"{url}/changes", params={"since": head}).json()
+    assert (changes["tasks"], changes["deleted_tasks"]) == ([], [])
+
+    # Once compacted past since, only a full resync is possible
+    db = SessionLocal()
+    try:
+        events.compact_events(db, head, datetime.utcnow() +
+                              timedelta(minutes=1))
+    finally:
+        db.close()
+    assert client.get(f"{url}/changes",
+                      params={"since": seq}).json()["resync"]
+    assert not client.get(f"{url}/changes",
+                          params={"since": head}).json()["resync"]
+
+    # A project that does not exist has no changes to give
+    assert client.get("/projects/99999/changes",
+                      params={"since": head}).status_code == 404
+    assert client.get("/projects/99999/changes",
+                      params={"since": seq}).status_code == 404
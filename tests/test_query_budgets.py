@@ -0,0 +1,66 @@
+# tests/test_query_budgets.py
+import pytest
+
+from backend.response_cache import response_cache
+
+# Statements each read endpoint may run, whatever the number of rows
+# * Routes conditional on the project's ETag add one version lookup
+BUDGETS = {
+    "/projects/": 2,
+    "/projects/summary": 1,
+    "/projects/{project_id}": 3,
+    "/projects/{project_id}/board": 6,
+    "/projects/{project_id}/changes?since=0": 4,
+    "/projects/{project_id}/tasks": 3,
+    "/projects/{project_id}/tasks?expand=project,assigned_user": 6,
+    "/projects/{project_id}/users": 3,
+    "/tasks/{task_id}": 4,
+    "/users/": 1,
+    "/users/{user_id}": 1,
+}
+
+def add_rows(client, project_id, start, count):
+    for i in range(start, start + count):
+        user = client.post(f"/projects/{project_id}/add-member", json={
+            "name": f"Budget{i}", "email": f"budget{i}@b.com"}).json()
+        task = client.post("/tasks/", json={
+            "title": f"Budget{i}", "project_id": project_id,
+            "assigned_to": user["id"]}).json()
+    return user, task
+
+@pytest.mark.parametrize("path", sorted(BUDGETS))
+def test_query_count_is_constant(client, count_queries, path):
+    project = client.post("/projects/", json={"name": f"Budget {path}"}).json()
+
+    counts = []
+    for start, count in [(0, 1), (1, 10)]:
+        user, task = add_rows(client, project["id"], start, count)
+        url = path.format(project_id=project["id"], user_id=user["id"],
+                          task_id=task["id"])
+        count_queries.clear()
+        assert client.get(url).status_code == 200
+        counts.append(len(count_queries))
+
+    assert counts[0] == counts[1]
+    assert counts[0] <= BUDGETS[path]
+
+@pytest.mark.parametrize("path", ["", "/board", "/tasks", "/users"])
+def test_unchanged_project_costs_one_lookup(client, count_queries, path):
+    project = client.post("/projects/", json={"name": f"ETag {path}"}).json()
+    url = f"/projects/{project['id']}{path}"
+    resp = client.get(url)
+    etag = resp.headers["etag"]
+
+    # Without the cached response, only the version is looked up
+    response_cache.clear()
+    count_queries.clear()
+    resp = client.get(url, headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert len(count_queries) == 1
+
+    # Any change to the project's tasks moves the ETag on
+    client.post("/tasks/", json={"title": "Change",
+                                 "project_id": project["id"]})
+    resp = client.get(url, headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["etag"] != etag
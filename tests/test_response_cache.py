@@ -0,0 +1,73 @@
+# tests/test_response_cache.py
+from backend.database import engine
+from backend.response_cache import CachedResponse, ResponseCache, \
+                                   response_cache
+
+def entry(size):
+    return CachedResponse('"etag"', b"x" * size, {})
+
+def test_lru_eviction_under_memory_cap():
+    cache = ResponseCache(max_bytes=800)
+    for key in "abcd":
+        cache.put(1, key, cache.generation(1), entry(200))
+    cache.get(1, "a")
+    # e and f push out the least recently used entries, b then c
+    for key in "ef":
+        cache.put(1, key, cache.generation(1), entry(200))
+    assert cache.get(1, "b") is None and cache.get(1, "c") is None
+    assert cache.get(1, "a") is not None
+    assert cache.size == 800
+    # Larger than a quarter of the cache, not worth keeping
+    cache.put(1, "big", cache.generation(1), entry(300))
+    assert cache.get(1, "big") is None
+    assert cache.stats()["evictions"] == 2
+
+def test_invalidation_rejects_reads_that_raced_it():
+    cache = ResponseCache()
+    cache.put(1, "a", cache.generation(1), entry(10))
+    cache.put(2, "a", cache.generation(2), entry(10))
+    generation = cache.generation(1)
+    cache.invalidate({1})
+    assert cache.get(1, "a") is None
+    assert cache.get(2, "a") is not None
+    # Read before the mutation was visible, so it must not be cached
+    cache.put(1, "a", generation, entry(10))
+    assert cache.get(1, "a") is None
+    assert cache.stats()["rejected_stale"] == 1
+
+def test_reads_served_from_cache_until_mutation(client, count_queries):
+    project = client.post("/projects/", json={"name": "CachedProj"}).json()
+    url = f"/projects/{project['id']}/board"
+    first = client.get(url)
+
+    count_queries.clear()
+    for _ in range(5):
+        resp = client.get(url)
+        assert resp.json() == first.json()
+        assert resp.headers["etag"] == first.headers["etag"]
+    assert count_queries == []
+
+    # The writer's commit drops the cached board
+    client.post("/tasks/", json={"title": "Fresh",
+                                 "project_id": project["id"]})
+    resp = client.get(url)
+    assert [task["title"] for task in resp.json()["tasks"]] == ["Fresh"]
+    assert client.get("/stats").json()["response_cache"]["hits"] >= 5
+
+def test_verified_hits_catch_missed_invalidations(client, monkeypatch):
+    project = client.post("/projects/", json={"name": "VerifiedProj"}).json()
+    url = f"/projects/{project['id']}/board"
+    first = client.get(url)
+    monkeypatch.setattr(response_cache, "verify_hits", True)
+
+    # Another worker's commit, whose invalidation never arrived here
+    with engine.begin() as conn:
+        conn.exec_driver_sql("UPDATE projects SET name = 'Renamed', "
+                             "version = version + 1 WHERE id = ?",
+                             (project["id"],))
+    resp = client.get(url)
+    assert resp.json()["project"]["name"] == "Renamed"
+    assert resp.headers["etag"] != first.headers["etag"]
+    # Current again, so it is served from the cache after the check
+    assert client.get(url).json() == resp.json()
+    assert response_cache.stats()["stale_hits"] >= 1
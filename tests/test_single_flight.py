@@ -0,0 +1,93 @@
+# tests/test_single_flight.py
+import asyncio
+import time
+
+import httpx
+
+from backend.main import app
+from backend.crud import projects, tasks
+from backend.response_cache import response_cache
+from backend.single_flight import SingleFlight
+
+def test_concurrent_calls_share_one_run():
+    flights = SingleFlight()
+    runs = []
+
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return {"value": 42}
+
+    async def fail():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        raise ValueError("boom")
+
+    async def run():
+        results = await asyncio.gather(*[flights.do("key", work)
+                                         for _ in range(10)])
+        errors = await asyncio.gather(*[flights.do("bad", fail)
+                                        for _ in range(3)],
+                                      return_exceptions=True)
+        return results, errors
+
+    results, errors = asyncio.run(run())
+    assert len(runs) == 2
+    assert all(result is results[0] for result in results)
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert flights.stats() == {"in_flight": 0, "leaders": 2, "shared": 11}
+
+def slow(fn):
+    def wrapper(*args):
+        time.sleep(0.05)
+        return fn(*args)
+    return wrapper
+
+def test_herd_of_identical_reads_runs_once(client, count_queries,
+                                           monkeypatch):
+    project = client.post("/projects/", json={"name": "HerdProj"}).json()
+    client.post("/tasks/", json={"title": "Herd",
+                                 "project_id": project["id"]})
+    # Slow reads so every request arrives while the first is in flight
+    monkeypatch.setattr(projects, "get_project_version",
+                        slow(projects.get_project_version))
+    monkeypatch.setattr(tasks, "get_tasks_page", slow(tasks.get_tasks_page))
+    response_cache.clear()
+    count_queries.clear()
+
+    async def herd():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport,
+                                     base_url="http://test") as http:
+            return await asyncio.gather(*[
+                http.get(f"/projects/{project['id']}/tasks")
+                for _ in range(20)])
+
+    responses = asyncio.run(herd())
+    assert all(resp.status_code == 200 for resp in responses)
+    assert all(resp.json() == responses[0].json() for resp in responses)
+    # One version lookup, then one project check and one page of tasks
+    assert len(count_queries) == 3
+
+def test_cancelled_leader_does_not_fail_followers():
+    flights = SingleFlight()
+    runs = []
+
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def run():
+        leader = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0.01)
+        # The leader's client went away
+        leader.cancel()
+        return await follower, leader.cancelled()
+
+    result, leader_cancelled = asyncio.run(run())
+    assert (result, leader_cancelled) == ("done", True)
+    assert len(runs) == 1
+    assert flights.stats()["in_flight"] == 0
@@ -0,0 +1,71 @@
+# tests/test_socket_relay.py
+import asyncio
+import json
+
+import socketio
+
+from backend.crud import events
+from backend.socket_relay import COMMIT_NOTICE, RelayManager, \
+                                 UnixSocketTransport
+
+def test_unix_transport_delivers_in_order(tmp_path):
+    async def run():
+        a = UnixSocketTransport(str(tmp_path))
+        b = UnixSocketTransport(str(tmp_path))
+        inbox = b.listen()
+        # Start listening before the other side scans for peers
+        receiving = asyncio.ensure_future(inbox.__anext__())
+        await asyncio.sleep(0.05)
+        for i in range(3):
+            await a.publish(json.dumps({"n": i}).encode())
+        received = [await receiving] + \
+                   [await asyncio.wait_for(inbox.__anext__(), 1)
+                    for _ in range(2)]
+        stats = a.stats()
+        await a.close()
+        await b.close()
+        return received, stats
+
+    received, stats = asyncio.run(run())
+    assert [json.loads(m)["n"] for m in received] == [0, 1, 2]
+    assert stats["peers"] == 1 and stats["published"] == 3
+    assert list(tmp_path.iterdir()) == []
+
+def test_commit_notices_cross_workers(tmp_path):
+    changed = []
+    listener = changed.append
+
+    async def run():
+        manager = RelayManager(UnixSocketTransport(str(tmp_path)))
+        socketio.AsyncServer(client_manager=manager, async_mode="asgi")
+        peer = UnixSocketTransport(str(tmp_path))
+        inbox = peer.listen()
+        receiving = asyncio.ensure_future(inbox.__anext__())
+        await manager.start()
+        await asyncio.sleep(0.05)
+        events.add_project_listener(listener)
+        try:
+            # A commit here is announced to the other worker
+            events.notify_project_listeners({5})
+            sent = json.loads(await asyncio.wait_for(receiving, 1))
+
+            # A commit there invalidates here, without being echoed back
+            await peer.publish(json.dumps({
+                "method": COMMIT_NOTICE, "host_id": "peer",
+                "project_ids": [7], "outbox": True}).encode())
+            for _ in range(50):
+                if manager.notices_applied:
+                    break
+                await asyncio.sleep(0.01)
+            echoed = asyncio.ensure_future(inbox.__anext__())
+            await asyncio.sleep(0.1)
+            return sent, echoed.done()
+        finally:
+            events.remove_project_listener(listener)
+            await manager.stop()
+            await peer.close()
+
+    sent, echoed = asyncio.run(run())
+    assert sent["method"] == COMMIT_NOTICE and sent["project_ids"] == [5]
+    assert changed == [{5}, {7}]
+    assert not echoed
@@ -1,4 +1,9 @@
 # tests/test_tasks.py
+import json
+
+from backend.database import SessionLocal
+from backend.models import OutboxEvent, project_members
+
 def test_create_and_get_task(client):
     # Create project
     project = client.post("/projects/", json={"name": "TaskProj"}).json()
@@ -61,6 +66,119 @@ def test_update_task(client):
     assert resp.status_code == 200
     assert resp.json()["title"] == "UpdatedTitle"
 
+def test_patch_task(client, count_writes):
+    project = client.post("/projects/", json={"name": "PatchProj"}).json()
+    member = client.post(f"/projects/{project['id']}/add-member",
+                         json={"name": "Patcher", "email": "p@p.com"}).json()
+    outsider = client.post("/users/", json={"name": "NotIn",
+                                            "email": "notin@p.com"}).json()
+    task = client.post("/tasks/", json={"title": "Card",
+                                        "project_id": project["id"]}).json()
+    client.post("/tasks/", json={"title": "Other",
+                                 "project_id": project["id"]})
+    etag = client.get(f"/tasks/{task['id']}").headers["etag"]
+    assert etag == f'"task-{task["id"]}-v1"'
+
+    count_writes.clear()
+    resp = client.patch(f"/tasks/{task['id']}", json={"status": "done"},
+                        headers={"If-Match": etag})
+    assert resp.status_code == 200
+    assert resp.json()["status"] == "done"
+    assert resp.json()["version"] == 2
+    assert resp.headers["etag"] == f'"task-{task["id"]}-v2"'
+    # No reads: the conditional update, the outbox event and the project bump
+    assert not [s for s in count_writes
+                if s.lstrip().upper().startswith("SELECT")]
+
+    # The old version no longer matches
+    resp = client.patch(f"/tasks/{task['id']}", json={"status": "todo"},
+                        headers={"If-Match": etag})
+    assert resp.status_code == 412
+    assert resp.headers["etag"] == f'"task-{task["id"]}-v2"'
+
+    # Only the fields sent are changed and checked
+    resp = client.patch(f"/tasks/{task['id']}",
+                        json={"assigned_to": member["id"]})
+    assert resp.status_code == 200
+    assert (resp.json()["status"], resp.json()["assigned_to"]) == \
+           ("done", member["id"])
+    assert client.patch(f"/tasks/{task['id']}", json={
+                "assigned_to": outsider["id"]}).status_code == 400
+    assert client.patch(f"/tasks/{task['id']}", json={
+                "assigned_to": 99999}).status_code == 404
+    assert client.patch(f"/tasks/{task['id']}", json={
+                "title": "Other"}).status_code == 400
+    assert client.patch("/tasks/99999", json={
+                "status": "done"}).status_code == 404
+    assert client.patch(f"/tasks/{task['id']}", json={
+                "project_id": 1}).status_code == 422
+    assert client.patch(f"/tasks/{task['id']}", json={}).status_code == 422
+
+    # Full updates bump the version as well
+    resp = client.put(f"/tasks/{task['id']}", json={
+        "title": "Card", "status": "todo", "project_id": project["id"]})
+    assert resp.json()["version"] == 4
+
+def test_patch_keeps_an_unchanged_assignee(client):
+    project = client.post("/projects/", json={"name": "KeepProj"}).json()
+    member = client.post(f"/projects/{project['id']}/add-member",
+                         json={"name": "Keeper", "email": "k@k.com"}).json()
+    task = client.post("/tasks/", json={"title": "Kept",
+                                        "project_id": project["id"],
+                                        "assigned_to": member["id"]}).json()
+    # The membership goes behind the API's back
+    db = SessionLocal()
+    try:
+        db.execute(project_members.delete().where(
+            project_members.c.project_id == project["id"]))
+        db.commit()
+    finally:
+        db.close()
+
+    # Sending the assignee the task already has is not a reassignment
+    resp = client.patch(f"/tasks/{task['id']}", json={
+        "status": "done", "assigned_to": member["id"]})
+    assert resp.status_code == 200
+    assert resp.json()["assigned_to"] == member["id"]
+
+def task_events(project_id):
+    db = SessionLocal()
+    try:
+        return [json.loads(event.payload) for event in
+                db.query(OutboxEvent).filter(
+                    OutboxEvent.project_id == project_id,
+                    OutboxEvent.event_type == "task_updated"
+                ).order_by(OutboxEvent.seq)]
+    finally:
+        db.close()
+
+def test_unassigned_tasks_get_events(client):
+    projects = [client.post("/projects/", json={"name": name}).json()
+                for name in ("UnassignA", "UnassignB")]
+    for project in projects:
+        user = client.post(f"/projects/{project['id']}/add-member",
+                           json={"name": "Leaver", "email": "l@u.com"}).json()
+    tasks = [client.post("/tasks/", json={"title": "Held",
+                                          "project_id": project["id"],
+                                          "assigned_to": user["id"]}).json()
+             for project in projects]
+
+    # Removing the member unassigns their tasks in that project only
+    client.post(f"/projects/{projects[0]['id']}/remove-member",
+                json={"name": "Leaver", "email": "l@u.com"})
+    [event] = task_events(projects[0]["id"])
+    assert (event["id"], event["assigned_to"], event["version"]) == \
+           (tasks[0]["id"], None, 2)
+    assert client.get(f"/tasks/{tasks[0]['id']}").headers["etag"] == \
+           f'"task-{tasks[0]["id"]}-v2"'
+    assert task_events(projects[1]["id"]) == []
+
+    # Deleting the user unassigns the rest
+    client.delete(f"/users/{user['id']}")
+    [event] = task_events(projects[1]["id"])
+    assert (event["id"], event["assigned_to"], event["version"]) == \
+           (tasks[1]["id"], None, 2)
+
 def test_delete_task(client):
     project = client.post("/projects/", json={"name": "DeleteTaskProj"}).json()
     task = client.post("/tasks/", json={
@@ -75,3 +193,130 @@ def test_delete_task(client):
     # Confirm deletion
     resp = client.get(f"/tasks/{task['id']}")
     assert resp.status_code == 404
+
+def test_tasks_keyset_pagination_and_filters(client):
+    project = client.post("/projects/", json={"name": "PagedProj"}).json()
+    user = client.post(f"/projects/{project['id']}/add-member",
+                       json={"name": "Pager", "email": "pager@p.com"}).json()
+    for i in range(7):
+        client.post("/tasks/", json={
+            "title": f"Paged{i}",
+            "project_id": project["id"],
+            "status": "done" if i % 2 else "todo",
+            "assigned_to": user["id"] if i < 3 else None
+        })
+
+    # Walk the pages by following the cursor header
+    titles, cursor = [], None
+    while True:
+        params = {"limit": 3}
+        if cursor:
+            params["cursor"] = cursor
+        resp = client.get(f"/projects/{project['id']}/tasks", params=params)
+        assert resp.status_code == 200
+        assert len(resp.json()) <= 3
+        titles += [task["title"] for task in resp.json()]
+        cursor = resp.headers.get("x-next-cursor")
+        if not cursor:
+            break
+    assert titles == [f"Paged{i}" for i in range(7)]
+
+    resp = client.get(f"/projects/{project['id']}/tasks",
+                      params={"status": "done"})
+    assert [task["title"] for task in resp.json()] == \
+           ["Paged1", "Paged3", "Paged5"]
+    resp = client.get(f"/projects/{project['id']}/tasks",
+                      params={"status": "todo", "assigned_to": user["id"]})
+    assert [task["title"] for task in resp.json()] == ["Paged0", "Paged2"]
+
+    resp = client.get(f"/projects/{project['id']}/tasks",
+                      params={"limit": 0})
+    assert resp.status_code == 422
+
+def test_task_list_views(client):
+    project = client.post("/projects/", json={"name": "ViewProj"}).json()
+    user = client.post(f"/projects/{project['id']}/add-member",
+                       json={"name": "Viewer", "email": "viewer@v.com"}).json()
+    client.post("/tasks/", json={"title": "Viewed", "description": "desc",
+                                 "project_id": project["id"],
+                                 "assigned_to": user["id"]})
+    url = f"/projects/{project['id']}/tasks"
+
+    # Compact by default
+    [task] = client.get(url).json()
+    assert set(task) == {"id", "title", "description", "status",
+                         "project_id", "assigned_to", "version"}
+
+    [task] = client.get(url, params={"fields": "title,status"}).json()
+    assert set(task) == {"id", "title", "status"}
+
+    [task] = client.get(url, params={"fields": "title",
+                                     "expand": "assigned_user,project"}).json()
+    assert set(task) == {"id", "title", "assigned_user", "project"}
+    assert task["assigned_user"]["email"] == "viewer@v.com"
+    assert task["project"]["members"][0]["id"] == user["id"]
+
+    resp = client.get(url, params={"fields": "title,secret"})
+    assert resp.status_code == 400
+    assert "secret" in resp.json()["detail"]
+
+def test_bulk_tasks(client, count_writes):
+    project = client.post("/projects/", json={"name": "BulkProj"}).json()
+    member = client.post(f"/projects/{project['id']}/add-member",
+                         json={"name": "Bulker", "email": "bulk@b.com"}).json()
+    outsider = client.post("/users/", json={"name": "Out",
+                                            "email": "out@b.com"}).json()
+    keep = client.post("/tasks/", json={"title": "Keep",
+                                        "project_id": project["id"]}).json()
+    drop = client.post("/tasks/", json={"title": "Drop",
+                                        "project_id": project["id"]}).json()
+
+    count_writes.clear()
+    resp = client.post("/tasks/bulk", json={"operations": [
+        {"op": "create", "title": "New", "project_id": project["id"],
+         "assigned_to": member["id"]},
+        # Clashes with the create above
+        {"op": "create", "title": "New", "project_id": project["id"]},
+        {"op": "update", "id": keep["id"], "status": "done"},
+        {"op": "update", "id": keep["id"], "assigned_to": outsider["id"]},
+        {"op": "delete", "id": drop["id"]},
+        # Its title was freed by the delete
+        {"op": "create", "title": "Drop", "project_id": project["id"]},
+        {"op": "delete", "id": 99999},
+    ]})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert (body["succeeded"], body["failed"]) == (4, 3)
+    assert [item["ok"] for item in body["results"]] == \
+           [True, False, True, False, True, True, False]
+    assert [item["status_code"] for item in body["results"]] == \
+           [200, 400, 200, 400, 200, 200, 404]
+    assert body["results"][0]["task"]["assigned_to"] == member["id"]
+    # Validation is batched: one membership lookup and one query for
+    # clashing titles, however many operations there are
+    selects = [s for s in count_writes
+               if s.lstrip().upper().startswith("SELECT")]
+    assert len([s for s in selects if "FROM project_members" in s]) == 1
+    assert len([s for s in selects if "tasks.title IN" in s]) == 1
+
+    tasks = client.get(f"/projects/{project['id']}/tasks").json()
+    assert sorted((task["title"], task["status"]) for task in tasks) == \
+           [("Drop", "todo"), ("Keep", "done"), ("New", "todo")]
+
+    # A single aggregated event for the project
+    db = SessionLocal()
+    try:
+        [event] = db.query(OutboxEvent).filter(
+            OutboxEvent.project_id == project["id"],
+            OutboxEvent.event_type == "tasks_bulk").all()
+    finally:
+        db.close()
+    changes = json.loads(event.payload)
+    assert len(changes["created"]) == 2
+    assert len(changes["updated"]) == 1
+    assert [task["id"] for task in changes["deleted"]] == [drop["id"]]
+
+def test_bulk_tasks_rejects_malformed_operations(client):
+    resp = client.post("/tasks/bulk", json={"operations": [
+        {"op": "update", "status": "done"}]})
+    assert resp.status_code == 422
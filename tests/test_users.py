@@ -35,3 +35,10 @@ def test_delete_user(client):
     # Confirm deletion
     resp = client.get(f"/users/{user['id']}")
     assert resp.status_code == 404
+
+def test_create_user_reads_nothing_back(client, count_writes):
+    resp = client.post("/users/", json={"name": "Ret", "email": "ret@r.com"})
+    assert resp.status_code == 200
+    assert resp.json()["email"] == "ret@r.com"
+    assert not [s for s in count_writes
+                if s.lstrip().upper().startswith("SELECT")]
@@ -0,0 +1,182 @@
+# tests/test_websocket.py
+import asyncio
+import json
+
+from backend import main
+from backend.replay_buffer import ReplayBuffer
+from backend.websocket_utils import WebSocketManager, LOBBY_ROOM, \
+                                    project_room
+
+class FakeSio:
+    def __init__(self):
+        self.emitted = []
+        self.rooms = {}
+
+    async def emit(self, event, data=None, room=None, to=None, **kwargs):
+        self.emitted.append((event, data, room or to))
+
+    async def enter_room(self, sid, room, namespace=None):
+        self.rooms.setdefault(sid, set()).add(room)
+
+    async def leave_room(self, sid, room, namespace=None):
+        self.rooms.get(sid, set()).discard(room)
+
+def test_task_and_member_events_target_project_room():
+    sio = FakeSio()
+    manager = WebSocketManager(sio)
+    manager.debug = False
+
+    async def emit_all():
+        await manager.emit_task_created({"id": 1, "project_id": 7})
+        await manager.emit_task_updated({"id": 1, "project_id": 7})
+        await manager.emit_task_deleted(1, "T", 7)
+        await manager.emit_member_added(7, {"id": 3, "name": "U"})
+        await manager.emit_member_removed(7, {"id": 3, "name": "U"})
+
+    asyncio.run(emit_all())
+    assert [room for _, _, room in sio.emitted] == [project_room(7)] * 5
+
+def test_dashboard_events_target_lobby():
+    sio = FakeSio()
+    manager = WebSocketManager(sio)
+    manager.debug = False
+
+    async def emit_all():
+        await manager.emit_project_created({"id": 2, "name": "P"})
+        await manager.emit_project_deleted(2, "P")
+
+    asyncio.run(emit_all())
+    assert sio.emitted[0][2] == LOBBY_ROOM
+    # Viewers of a deleted board are told as well
+    assert sio.emitted[1][2] == [LOBBY_ROOM, project_room(2)]
+
+def test_subscribe_handlers(monkeypatch):
+    sio = FakeSio()
+    monkeypatch.setattr(main, "sio", sio)
+
+    async def subscribe():
+        ok = await main.subscribe_project("sid1", {"project_id": "4"})
+        bad = await main.subscribe_project("sid1", {})
+        await main.subscribe_lobby("sid1")
+        await main.unsubscribe_project("sid1", {"project_id": 4})
+        return ok, bad
+
+    ok, bad = asyncio.run(subscribe())
+    assert ok["ok"] and ok["room"] == project_room(4)
+    assert not bad["ok"]
+    assert sio.rooms["sid1"] == {LOBBY_ROOM}
+
+def test_batching_coalesces_updates_per_entity():
+    sio = FakeSio()
+    manager = WebSocketManager(sio, batch_window=0.01)
+    manager.debug = False
+
+    async def burst():
+        await manager.emit_task_updated({"id": 1, "project_id": 7,
+                                         "status": "todo"})
+        await manager.emit_task_created({"id": 2, "project_id": 7,
+                                         "status": "todo"})
+        await manager.emit_task_updated({"id": 1, "project_id": 7,
+                                         "status": "in-progress"})
+        await manager.emit_task_updated({"id": 2, "project_id": 7,
+                                         "status": "done"})
+        await manager.emit_task_updated({"id": 1, "project_id": 7,
+                                         "status": "done"})
+        assert sio.emitted == []
+        await asyncio.sleep(0.05)
+
+    asyncio.run(burst())
+    assert len(sio.emitted) == 1
+    event, payload, room = sio.emitted[0]
+    assert event == "batch" and room == project_room(7)
+    # Task 2's update folds into its create; task 1 keeps only its latest
+    assert [(e["type"], e["data"]["id"], e["data"]["status"])
+            for e in payload["data"]] == [("task_created", 2, "done"),
+                                          ("task_updated", 1, "done")]
+
+def test_batching_keeps_task_events_behind_bulk_changes():
+    sio = FakeSio()
+    manager = WebSocketManager(sio, batch_window=0.01)
+    manager.debug = False
+
+    async def burst():
+        await manager.emit_task_created({"id": 1, "project_id": 7,
+                                         "status": "todo"})
+        await manager.emit_event("tasks_bulk", {
+            "project_id": 7, "created": [], "deleted": [],
+            "updated": [{"id": 1, "project_id": 7,
+                         "status": "in-progress"}]})
+        await manager.emit_task_updated({"id": 1, "project_id": 7,
+                                         "status": "done"})
+        await asyncio.sleep(0.05)
+
+    asyncio.run(burst())
+    [(event, payload, _)] = sio.emitted
+    # The update after the bulk change stays after it, so it is applied last
+    assert [(e["type"], e["data"].get("status")) for e in payload["data"]] \
+           == [("task_created", "todo"), ("tasks_bulk", None),
+               ("task_updated", "done")]
+
+def test_batching_single_event_and_flush():
+    sio = FakeSio()
+    manager = WebSocketManager(sio, batch_window=10)
+    manager.debug = False
+
+    async def emit_and_flush():
+        await manager.emit_task_deleted(5, "T", 7)
+        await manager.emit_project_created({"id": 8, "name": "P"})
+        await manager.flush()
+
+    asyncio.run(emit_and_flush())
+    # Lone events are sent unwrapped, one frame per room
+    assert sorted((event, room) for event, _, room in sio.emitted) == \
+           [("project_created", LOBBY_ROOM),
+            ("task_deleted", project_room(7))]
+
+def test_replay_resumes_room_stream(monkeypatch):
+    sio = FakeSio()
+    manager = WebSocketManager(sio, replay=ReplayBuffer())
+    manager.debug = False
+    monkeypatch.setattr(main, "sio", sio)
+    monkeypatch.setattr(main.app.state, "ws_manager", manager)
+    epoch = manager.replay.epoch
+
+    async def run():
+        for i in range(3):
+            await manager.emit_task_updated({"id": i, "project_id": 7})
+        # Events for several rooms are one stream per room
+        await manager.emit_project_deleted(7, "P")
+        sio.emitted.clear()
+        await main.connect("sid1", {}, {"epoch": epoch, "rooms": {
+            project_room(7): 2, LOBBY_ROOM: 1, "nope": 0}})
+        return await main.subscribe_project(
+            "sid2", {"project_id": 7, "epoch": "old", "last_seq": 2})
+
+    result = asyncio.run(run())
+    assert sio.rooms["sid1"] == {project_room(7), LOBBY_ROOM}
+    events = [(event, data, to) for event, data, to in sio.emitted
+              if event != "connection_established"]
+    # Missed events come as one frame; the lobby had nothing missed
+    assert events[0][0] == "batch" and events[0][2] == "sid1"
+    assert [(e["type"], e["seq"]) for e in events[0][1]["data"]] == \
+           [("task_updated", 3), ("project_deleted", 4)]
+    # A seq from another epoch cannot be resumed from; the reply gives the
+    # position to follow the room from instead
+    assert result["resumed"] is False
+    assert (result["epoch"], result["seq"]) == (epoch, 4)
+    assert events[-1][0] == "resync_required" and events[-1][2] == "sid2"
+
+def test_replay_buffer_caps():
+    replay = ReplayBuffer(room_events=2)
+    for _ in range(3):
+        replay.record("a", {"type": "t", "data": {}})
+    assert replay.since("a", replay.epoch, 0) is None
+    assert [e["seq"] for e in replay.since("a", replay.epoch, 2)] == [3]
+    assert replay.since("a", replay.epoch, 5) is None
+
+    size = len(json.dumps(replay.record("b", {"type": "t", "data": {}})))
+    replay.max_bytes = 2 * size
+    replay.record("c", {"type": "t", "data": {}})
+    stats = replay.stats()
+    assert stats["size_bytes"] <= replay.max_bytes
+    assert stats["events"] == 2 and stats["evicted"] == 3